@@ -0,0 +1,206 @@
+"""
+Renderer conformance suite: renders synthetic splatter images of increasing
+size with every available backend, compares the renders with stored golden
+images and records the time and peak memory of every backend and resolution
+in a JSON report. Renderer optimisations are judged against this suite.
+
+    python -m benchmarks.conformance --sizes 1000 10000 100000 1000000 --resolutions 128
+    python -m benchmarks.conformance --update_golden
+
+Golden images are rendered with the CUDA rasterizer when it is installed
+and the suite runs on a GPU (--device cuda), with the torch backend, the
+PyTorch port of the CUDA kernels, otherwise. They are stored as 8-bit PNGs
+(the views side by side) in benchmarks/golden, with the backend that
+rendered them. Against torch goldens the torch backend is only checked for
+changes, not for correctness: regenerate them on a GPU host to check it
+against the CUDA kernels. Every case runs in a fresh process so that its
+peak memory is not hidden by the previous cases.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
+
+from gaussian_renderer import BACKENDS, render_batch
+from utils.synthetic_utils import get_synthetic_splatter_image, get_synthetic_loop_cameras
+
+from .render_fps import get_benchmark_cfg
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+# renders are compared after quantisation to 8 bits, which alone costs ~59 dB
+MIN_PSNR = 40.0
+
+def golden_path(num_gaussians, resolution, num_views):
+    return os.path.join(GOLDEN_DIR, "{}_gaussians_{}px_{}_views.png".format(num_gaussians, resolution, num_views))
+
+def to_strip(frames):
+    """
+    [V, 3, H, W] renders to one uint8 [H, V * W, 3] image.
+    """
+    frames = torch.clamp(frames * 255, 0.0, 255.0).round().to(torch.uint8).cpu()
+    return torch.cat(list(frames), dim=2).permute(1, 2, 0).numpy()
+
+def get_golden_backend(device):
+    """
+    Backend rendering the golden images: the CUDA rasterizer if it can run.
+    """
+    if torch.device(device).type == "cuda" and "cuda" in BACKENDS:
+        return "cuda"
+    return "torch"
+
+def save_golden(frames, backend, num_gaussians, resolution, num_views):
+    info = PngInfo()
+    info.add_text("backend", backend)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    Image.fromarray(to_strip(frames)).save(golden_path(num_gaussians, resolution, num_views), pnginfo=info)
+
+def load_golden_backend(num_gaussians, resolution, num_views):
+    """
+    Backend that rendered the golden images, None if they were not generated.
+    """
+    path = golden_path(num_gaussians, resolution, num_views)
+    if not os.path.isfile(path):
+        return None
+    # goldens stored before the backend was recorded were rendered with torch
+    return Image.open(path).text.get("backend", "torch")
+
+def load_golden(num_gaussians, resolution, num_views):
+    """
+    Golden renders [V, 3, H, W] in [0, 1], None if they were not generated.
+    """
+    path = golden_path(num_gaussians, resolution, num_views)
+    if not os.path.isfile(path):
+        return None
+    strip = torch.from_numpy(np.array(Image.open(path))).float() / 255.0
+    return torch.stack(torch.chunk(strip.permute(2, 0, 1), num_views, dim=2))
+
+def psnr(image, target):
+    mse = torch.mean((image.float().cpu() - target.float().cpu()) ** 2).item()
+    return float("inf") if mse == 0 else -10 * float(np.log10(mse))
+
+def available_backends(device):
+    """
+    Backends that can render on the device.
+    """
+    if torch.device(device).type == "cuda":
+        return list(BACKENDS.keys())
+    return [b for b in BACKENDS.keys() if b != "cuda"]
+
+@torch.no_grad()
+def render_case(backend, num_gaussians, resolution, num_views, device="cpu"):
+    """
+    Renders the synthetic splatter image with num_gaussians from a loop of
+    num_views cameras. Returns the renders [V, 3, H, W] and ms per view.
+    """
+    cfg = get_benchmark_cfg(resolution)
+    reconstruction = get_synthetic_splatter_image(num_gaussians, device=device)
+    cameras = get_synthetic_loop_cameras(num_views, device=device)
+    background = torch.ones(3, dtype=torch.float32, device=device)
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    frames = render_batch({k: v.unsqueeze(0) for k, v in reconstruction.items()},
+                          *[c.float().unsqueeze(0) for c in cameras], background, cfg,
+                          backend=backend)["render"]
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+    return frames.cpu(), 1000 * (time.perf_counter() - start) / num_views
+
+def run_case(backend, num_gaussians, resolution, num_views, device):
+    """
+    render_case in a fresh process, with the peak memory of the case: the
+    growth of the peak resident set size on CPU, the peak allocation on GPU.
+    """
+    if torch.device(device).type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    frames, ms_per_view = render_case(backend, num_gaussians, resolution, num_views, device)
+    if torch.device(device).type == "cuda":
+        peak_memory_mb = torch.cuda.max_memory_allocated(device) / 2 ** 20
+    else:
+        # ru_maxrss is in kilobytes on Linux
+        peak_memory_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 2 ** 10
+    return frames, ms_per_view, peak_memory_mb
+
+def run_suite(sizes, resolutions, backends, num_views, device="cpu", update_golden=False, min_psnr=MIN_PSNR):
+    """
+    Returns the report: one entry per (size, resolution, backend).
+    """
+    ctx = mp.get_context("spawn")
+    cases = []
+    for num_gaussians in sizes:
+        for resolution in resolutions:
+            if update_golden:
+                golden_backend = get_golden_backend(device)
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    frames, _, _ = executor.submit(run_case, golden_backend, num_gaussians, resolution,
+                                                   num_views, device).result()
+                save_golden(frames, golden_backend, num_gaussians, resolution, num_views)
+            golden = load_golden(num_gaussians, resolution, num_views)
+            golden_backend = load_golden_backend(num_gaussians, resolution, num_views)
+            for backend in backends:
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    frames, ms_per_view, peak_memory_mb = executor.submit(
+                        run_case, backend, num_gaussians, resolution, num_views, device).result()
+                case = {"num_gaussians": num_gaussians,
+                        "resolution": resolution,
+                        "backend": backend,
+                        "ms_per_view": ms_per_view,
+                        "peak_memory_mb": peak_memory_mb,
+                        "golden_backend": golden_backend,
+                        "psnr": None,
+                        "passed": None}
+                if golden is not None:
+                    # compare what would be stored, the golden images are 8-bit
+                    quantised = torch.clamp(frames * 255, 0.0, 255.0).round() / 255.0
+                    case["psnr"] = min(psnr(quantised[v_idx], golden[v_idx]) for v_idx in range(num_views))
+                    case["passed"] = case["psnr"] >= min_psnr
+                cases.append(case)
+                print("{:>8d} Gaussians {:>4d}px {:>10s}: {:9.2f} ms/view {:9.1f} MB  PSNR {}".format(
+                    num_gaussians, resolution, backend, ms_per_view, peak_memory_mb,
+                    "no golden" if case["psnr"] is None else "{:.2f} dB to {}".format(case["psnr"], golden_backend)))
+
+    return {"environment": {"torch": torch.__version__,
+                            "python": platform.python_version(),
+                            "device": str(device),
+                            "num_threads": torch.get_num_threads(),
+                            "cpu_count": os.cpu_count()},
+            "num_views": num_views,
+            "min_psnr": min_psnr,
+            "cases": cases}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Renderer conformance and golden image suite')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='Numbers of Gaussians of the synthetic splatter images (default: 1000 10000)')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[64, 128], help='Render resolutions')
+    parser.add_argument('--backends', type=str, nargs='+', default=None, choices=list(BACKENDS.keys()),
+                        help='Backends to test (default: all available on the device)')
+    parser.add_argument('--num_views', type=int, default=4, help='Views of the camera loop rendered per case')
+    parser.add_argument('--min_psnr', type=float, default=MIN_PSNR, help='Smallest PSNR to the golden images')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to render on')
+    parser.add_argument('--update_golden', action='store_true',
+                        help='Render the golden images first, with the CUDA rasterizer on GPU and torch on CPU')
+    parser.add_argument('--report', type=str, default='conformance_report.json', help='Path of the JSON report')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    report = run_suite(args.sizes, args.resolutions, args.backends or available_backends(args.device),
+                       args.num_views, device=args.device, update_golden=args.update_golden,
+                       min_psnr=args.min_psnr)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Report saved to {}".format(args.report))
+    sys.exit(0 if all(case["passed"] is not False for case in report["cases"]) else 1)
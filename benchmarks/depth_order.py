@@ -0,0 +1,105 @@
+"""
+Compares sorting the Gaussians from scratch in every view with repairing the
+depth order of the previous view (DepthOrderCache) on a 200 view loop.
+
+    python -m benchmarks.depth_order --num_views 200
+"""
+
+import argparse
+import math
+import time
+
+import torch
+
+from gaussian_renderer import BACKENDS, render_batch
+from gaussian_renderer.torch_rasterizer import (DepthOrderCache, RasterizationSettings,
+                                                depth_order, preprocess_gaussians)
+from utils.synthetic_utils import get_synthetic_splatter_image, get_synthetic_loop_cameras
+
+from .render_fps import get_benchmark_cfg
+
+@torch.no_grad()
+def project_loop(reconstruction, cameras, cfg, background):
+    """
+    Projected Gaussians of every view of the loop.
+    """
+    world_view_transforms, full_proj_transforms, camera_centers = cameras
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    projected = []
+    for r_idx in range(world_view_transforms.shape[0]):
+        settings = RasterizationSettings(image_height=cfg.data.training_resolution,
+                                         image_width=cfg.data.training_resolution,
+                                         tanfovx=tanfov, tanfovy=tanfov, bg=background,
+                                         scale_modifier=1.0, viewmatrix=world_view_transforms[r_idx],
+                                         projmatrix=full_proj_transforms[r_idx],
+                                         sh_degree=cfg.model.max_sh_degree,
+                                         campos=camera_centers[r_idx], prefiltered=False, debug=False)
+        projected.append(preprocess_gaussians(reconstruction["xyz"], torch.zeros_like(reconstruction["xyz"]),
+                                              reconstruction["opacity"], settings,
+                                              shs=torch.cat([reconstruction["features_dc"],
+                                                             reconstruction["features_rest"]], dim=1),
+                                              scales=reconstruction["scaling"],
+                                              rotations=reconstruction["rotation"]))
+    return projected
+
+def measure_sort_time(projected, sort_fn):
+    """
+    Average time (ms) per view and the orders computed for every view.
+    """
+    orders = []
+    start = time.perf_counter()
+    for p in projected:
+        orders.append(sort_fn(p))
+    return 1000 * (time.perf_counter() - start) / len(projected), orders
+
+@torch.no_grad()
+def measure_render_time(reconstruction, cameras, cfg, background, backend, reuse_depth_order):
+    """
+    Average time (ms) per view of rendering the loop with render_batch.
+    """
+    world_view_transforms, full_proj_transforms, camera_centers = cameras
+    start = time.perf_counter()
+    render_batch({k: v.unsqueeze(0) for k, v in reconstruction.items()},
+                 world_view_transforms.unsqueeze(0), full_proj_transforms.unsqueeze(0),
+                 camera_centers.unsqueeze(0), background, cfg, backend=backend,
+                 reuse_depth_order=reuse_depth_order)
+    return 1000 * (time.perf_counter() - start) / world_view_transforms.shape[0]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark depth order reuse on a camera loop')
+    parser.add_argument('--num_views', type=int, default=200, help='Number of views in the camera loop')
+    parser.add_argument('--resolution', type=int, default=128, help='Side of the splatter image and of the renders')
+    parser.add_argument('--max_passes', type=int, nargs='+', default=[2, 8],
+                        help='Odd-even transposition passes before falling back to a full sort')
+    parser.add_argument('--max_swapped_fraction', type=float, default=0.001,
+                        help='Largest fraction of swapped neighbours that is repaired instead of sorted')
+    parser.add_argument('--backends', type=str, nargs='*', default=['cpu_fast'],
+                        choices=[b for b in BACKENDS.keys() if b != "cuda"],
+                        help='Backends to time end to end')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to render on')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cfg = get_benchmark_cfg(args.resolution)
+    reconstruction = get_synthetic_splatter_image(args.resolution * args.resolution, device=args.device)
+    cameras = get_synthetic_loop_cameras(args.num_views, device=args.device)
+    background = torch.ones(3, dtype=torch.float32, device=args.device)
+    projected = project_loop(reconstruction, cameras, cfg, background)
+
+    print("{} Gaussians, {} views".format(reconstruction["xyz"].shape[0], args.num_views))
+    full_ms, reference = measure_sort_time(projected, depth_order)
+    print("{:>22s}: {:8.3f} ms/view".format("full sort", full_ms))
+    for max_passes in args.max_passes:
+        cache = DepthOrderCache(max_passes=max_passes, max_swapped_fraction=args.max_swapped_fraction)
+        ms, orders = measure_sort_time(projected, cache)
+        matches = all(torch.equal(projected[i].depth[a], projected[i].depth[b])
+                      for i, (a, b) in enumerate(zip(orders, reference)))
+        print("{:>22s}: {:8.3f} ms/view, {} repairs, {} full sorts, same order: {}".format(
+            "incremental ({} passes)".format(max_passes), ms,
+            cache.num_repairs, cache.num_full_sorts, matches))
+    for backend in args.backends:
+        for reuse_depth_order in [False, True]:
+            print("{:>10s} reuse={:<5s}: {:8.2f} ms/view".format(
+                backend, str(reuse_depth_order),
+                measure_render_time(reconstruction, cameras, cfg, background, backend, reuse_depth_order)))
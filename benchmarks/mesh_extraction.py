@@ -0,0 +1,71 @@
+"""
+Times the mesh extraction of a synthetic 128x128 splatter image (density
+grid, marching tetrahedra and the full extract_mesh with the vertex colours)
+at several grid resolutions, and checks that a 256^3 grid is extracted
+within a time budget.
+
+    python -m benchmarks.mesh_extraction --resolutions 128 256 --max_seconds 5
+"""
+
+import argparse
+import math
+import sys
+import time
+
+import torch
+
+from utils.mesh_utils import evaluate_density_grid, extract_mesh, get_grid_bounds, marching_tetrahedra
+from utils.synthetic_utils import get_synthetic_splatter_image
+
+# resolution the time budget applies to
+CHECKED_RESOLUTION = 256
+
+def timed(fn, repeats=3):
+    """
+    Smallest time (s) of repeats calls and the result of the last one.
+    """
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+@torch.no_grad()
+def benchmark(reconstruction, resolution, chunk_size, repeats):
+    bounds = get_grid_bounds(reconstruction)
+    density_s, (density, _, _, _) = timed(lambda: evaluate_density_grid(reconstruction, resolution, bounds,
+                                                                         chunk_size=chunk_size), repeats)
+    surface_s, _ = timed(lambda: marching_tetrahedra(density, 0.5), repeats)
+    total_s, (vertices, faces, _) = timed(lambda: extract_mesh(reconstruction, resolution, bounds=bounds,
+                                                               chunk_size=chunk_size), repeats)
+    return {"density_s": density_s, "surface_s": surface_s, "total_s": total_s,
+            "num_vertices": vertices.shape[0], "num_faces": faces.shape[0]}
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark mesh extraction from the density of the Gaussians')
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[128, 256], help='Grid resolutions')
+    parser.add_argument('--chunk_size', type=int, default=256, help='Grid points along every axis of a chunk')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed calls per resolution, the best is kept')
+    parser.add_argument('--num_threads', type=int, default=1, help='Torch threads')
+    parser.add_argument('--max_seconds', type=float, default=5.0,
+                        help='Time budget of extract_mesh at resolution {}'.format(CHECKED_RESOLUTION))
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    torch.set_num_threads(args.num_threads)
+    reconstruction = get_synthetic_splatter_image(128 * 128)
+    passed = True
+    for resolution in args.resolutions:
+        result = benchmark(reconstruction, resolution, args.chunk_size, args.repeats)
+        check = ""
+        if resolution == CHECKED_RESOLUTION:
+            within_budget = result["total_s"] <= args.max_seconds
+            passed = passed and within_budget
+            check = "  {} the {:.1f} s budget".format("within" if within_budget else "OVER", args.max_seconds)
+        print("{:4d}^3: density {:5.2f} s, marching tetrahedra {:5.2f} s, extract_mesh {:5.2f} s "
+              "({} vertices, {} faces){}".format(resolution, result["density_s"], result["surface_s"],
+                                                 result["total_s"], result["num_vertices"],
+                                                 result["num_faces"], check))
+    sys.exit(0 if passed else 1)
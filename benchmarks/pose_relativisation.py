@@ -0,0 +1,93 @@
+"""
+Compares making the cameras of an example relative to the first one and
+converting the source rotations to quaternions frame by frame (as
+SharedDataset did before) with the batched SharedDataset functions, on
+camera loops with as many views as the training (4), NMR test (24), CO3D
+(about 50) and SRN test (250) examples.
+
+    python -m benchmarks.pose_relativisation --num_views 4 50 250
+"""
+
+import argparse
+import time
+
+import torch
+
+from datasets.shared_dataset import SharedDataset
+from utils.general_utils import matrix_to_quaternion
+from utils.synthetic_utils import get_synthetic_loop_cameras
+
+def make_poses_relative_to_first_loop(images_and_camera_poses):
+    """
+    Frame by frame reference of SharedDataset.make_poses_relative_to_first.
+    """
+    inverse_first_camera = images_and_camera_poses["world_view_transforms"][0].inverse().clone()
+    for c in range(images_and_camera_poses["world_view_transforms"].shape[0]):
+        images_and_camera_poses["world_view_transforms"][c] = torch.bmm(
+                                            inverse_first_camera.unsqueeze(0),
+                                            images_and_camera_poses["world_view_transforms"][c].unsqueeze(0)).squeeze(0)
+        images_and_camera_poses["view_to_world_transforms"][c] = torch.bmm(
+                                            images_and_camera_poses["view_to_world_transforms"][c].unsqueeze(0),
+                                            inverse_first_camera.inverse().unsqueeze(0)).squeeze(0)
+        images_and_camera_poses["full_proj_transforms"][c] = torch.bmm(
+                                            inverse_first_camera.unsqueeze(0),
+                                            images_and_camera_poses["full_proj_transforms"][c].unsqueeze(0)).squeeze(0)
+        images_and_camera_poses["camera_centers"][c] = images_and_camera_poses["world_view_transforms"][c].inverse()[3, :3]
+    return images_and_camera_poses
+
+def get_source_cw2wT_loop(source_cameras_view_to_world):
+    """
+    Frame by frame reference of SharedDataset.get_source_cw2wT.
+    """
+    qs = []
+    for c_idx in range(source_cameras_view_to_world.shape[0]):
+        qs.append(matrix_to_quaternion(source_cameras_view_to_world[c_idx, :3, :3].transpose(0, 1)))
+    return torch.stack(qs, dim=0)
+
+def get_example_cameras(num_views):
+    """
+    Cameras of an example in the format of the datasets, in float32.
+    """
+    world_view_transforms, full_proj_transforms, camera_centers = get_synthetic_loop_cameras(num_views)
+    return {"world_view_transforms": world_view_transforms.float(),
+            "view_to_world_transforms": world_view_transforms.inverse().float(),
+            "full_proj_transforms": full_proj_transforms.float(),
+            "camera_centers": camera_centers.float()}
+
+def relativise_loop(cameras):
+    cameras = make_poses_relative_to_first_loop({k: v.clone() for k, v in cameras.items()})
+    cameras["source_cv2wT_quat"] = get_source_cw2wT_loop(cameras["view_to_world_transforms"])
+    return cameras
+
+def relativise_batched(cameras):
+    dataset = SharedDataset()
+    cameras = dataset.make_poses_relative_to_first({k: v.clone() for k, v in cameras.items()})
+    cameras["source_cv2wT_quat"] = dataset.get_source_cw2wT(cameras["view_to_world_transforms"])
+    return cameras
+
+def measure_time(fn, cameras, repeats):
+    """
+    Average time (ms) of one call and its output.
+    """
+    out = fn(cameras)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(cameras)
+    return 1000 * (time.perf_counter() - start) / repeats, out
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark batched pose relativisation')
+    parser.add_argument('--num_views', type=int, nargs='+', default=[4, 50, 250], help='Views per example')
+    parser.add_argument('--repeats', type=int, default=50, help='Timed calls per size')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    torch.set_num_threads(1)
+    for num_views in args.num_views:
+        cameras = get_example_cameras(num_views)
+        loop_ms, expected = measure_time(relativise_loop, cameras, args.repeats)
+        batched_ms, out = measure_time(relativise_batched, cameras, args.repeats)
+        max_error = max((out[k] - expected[k]).abs().max().item() for k in expected.keys())
+        print("{:4d} views: loop {:8.3f} ms, batched {:6.3f} ms ({:5.1f}x), max difference {:.1e}".format(
+            num_views, loop_ms, batched_ms, loop_ms / batched_ms, max_error))
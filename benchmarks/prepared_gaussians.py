@@ -0,0 +1,95 @@
+"""
+Measures the per-view savings of rendering a prepare_gaussians reconstruction
+(covariances and, for SH degree 0, colours computed once) instead of the raw
+one on a loop of cameras, as done by the gradio demo and by evaluation.
+
+    python -m benchmarks.prepared_gaussians --num_views 200
+"""
+
+import argparse
+import math
+import time
+
+import torch
+
+from gaussian_renderer import BACKENDS, prepare_gaussians
+from gaussian_renderer.torch_rasterizer import RasterizationSettings, preprocess_gaussians
+from utils.synthetic_utils import get_synthetic_splatter_image, get_synthetic_loop_cameras
+
+from .render_fps import get_benchmark_cfg, measure_fps
+
+def get_preprocess_inputs(pc):
+    """
+    Keyword arguments of preprocess_gaussians for a raw or a prepared reconstruction.
+    """
+    inputs = {"means3D": pc["xyz"], "means2D": torch.zeros_like(pc["xyz"]), "opacities": pc["opacity"]}
+    if "cov3D_precomp" in pc.keys():
+        inputs["cov3D_precomp"] = pc["cov3D_precomp"]
+    else:
+        inputs["scales"] = pc["scaling"]
+        inputs["rotations"] = pc["rotation"]
+    if "colors_precomp" in pc.keys():
+        inputs["colors_precomp"] = pc["colors_precomp"]
+    elif "shs" in pc.keys():
+        inputs["shs"] = pc["shs"]
+    else:
+        inputs["shs"] = torch.cat([pc[k] for k in ["features_dc", "features_rest"] if k in pc.keys()], dim=1)
+    return inputs
+
+@torch.no_grad()
+def measure_preprocessing_time(reconstruction, cameras, cfg, background):
+    """
+    Average time (ms) spent per view projecting the Gaussians, the part of
+    the rendering that the prepared form shortens.
+    """
+    world_view_transforms, full_proj_transforms, camera_centers = cameras
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    inputs = get_preprocess_inputs(reconstruction)
+    start = time.perf_counter()
+    for r_idx in range(world_view_transforms.shape[0]):
+        settings = RasterizationSettings(image_height=cfg.data.training_resolution,
+                                         image_width=cfg.data.training_resolution,
+                                         tanfovx=tanfov, tanfovy=tanfov, bg=background,
+                                         scale_modifier=1.0, viewmatrix=world_view_transforms[r_idx],
+                                         projmatrix=full_proj_transforms[r_idx],
+                                         sh_degree=cfg.model.max_sh_degree,
+                                         campos=camera_centers[r_idx], prefiltered=False, debug=False)
+        preprocess_gaussians(raster_settings=settings, **inputs)
+    if background.is_cuda:
+        torch.cuda.synchronize()
+    return 1000 * (time.perf_counter() - start) / world_view_transforms.shape[0]
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark rendering of prepared reconstructions')
+    parser.add_argument('--backends', type=str, nargs='+', default=['torch', 'cpu_fast'],
+                        choices=list(BACKENDS.keys()), help='Backends to benchmark')
+    parser.add_argument('--num_views', type=int, default=200, help='Number of views in the camera loop')
+    parser.add_argument('--resolution', type=int, default=128, help='Side of the splatter image and of the renders')
+    parser.add_argument('--sh_degree', type=int, default=1, choices=[0, 1], help='SH degree of the colours')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to render on')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cfg = get_benchmark_cfg(args.resolution)
+    cfg.model.max_sh_degree = args.sh_degree
+    reconstruction = get_synthetic_splatter_image(args.resolution * args.resolution, device=args.device)
+    if args.sh_degree == 0:
+        reconstruction.pop("features_rest")
+    cameras = get_synthetic_loop_cameras(args.num_views, device=args.device)
+    background = torch.ones(3, dtype=torch.float32, device=args.device)
+
+    start = time.perf_counter()
+    prepared = prepare_gaussians(reconstruction, cfg)
+    prepare_ms = 1000 * (time.perf_counter() - start)
+
+    print("{} Gaussians, {} views at {}x{}, SH degree {}".format(
+        reconstruction["xyz"].shape[0], args.num_views, args.resolution, args.resolution, args.sh_degree))
+    print("prepare_gaussians (once): {:8.2f} ms".format(prepare_ms))
+    for name, pc in [("raw", reconstruction), ("prepared", prepared)]:
+        print("{:>10s} preprocessing: {:8.2f} ms/view".format(
+            name, measure_preprocessing_time(pc, cameras, cfg, background)))
+    for backend in args.backends:
+        for name, pc in [("raw", reconstruction), ("prepared", prepared)]:
+            fps = measure_fps(backend, pc, cameras, cfg, background)
+            print("{:>10s} {:>8s}: {:8.2f} frames/sec".format(backend, name, fps))
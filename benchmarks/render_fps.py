@@ -0,0 +1,80 @@
+"""
+Measures rendering throughput (frames/sec) of the rasterization backends on a
+loop of cameras around a synthetic 128x128 splatter image.
+
+    python -m benchmarks.render_fps --backends torch cpu_fast --num_views 200
+
+With --num_workers the loop is also rendered by render_loop_parallel with the
+given numbers of processes (CPU only, process start-up included).
+"""
+
+import argparse
+import time
+
+import torch
+from omegaconf import OmegaConf
+
+from gaussian_renderer import BACKENDS, render_predicted
+from gaussian_renderer.cpu_rasterizer import set_num_threads
+from gaussian_renderer.parallel import render_loop_parallel
+from utils.synthetic_utils import get_synthetic_splatter_image, get_synthetic_loop_cameras
+
+def get_benchmark_cfg(resolution):
+    return OmegaConf.create({"data": {"fov": 49.134342641202636,
+                                      "training_resolution": resolution},
+                             "model": {"max_sh_degree": 1}})
+
+@torch.no_grad()
+def measure_fps(backend, reconstruction, cameras, cfg, background, warmup=2):
+    world_view_transforms, full_proj_transforms, camera_centers = cameras
+    for r_idx in range(min(warmup, world_view_transforms.shape[0])):
+        render_predicted(reconstruction, world_view_transforms[r_idx], full_proj_transforms[r_idx],
+                         camera_centers[r_idx], background, cfg, backend=backend)
+    if background.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for r_idx in range(world_view_transforms.shape[0]):
+        render_predicted(reconstruction, world_view_transforms[r_idx], full_proj_transforms[r_idx],
+                         camera_centers[r_idx], background, cfg, backend=backend)
+    if background.is_cuda:
+        torch.cuda.synchronize()
+    return world_view_transforms.shape[0] / (time.perf_counter() - start)
+
+@torch.no_grad()
+def measure_parallel_fps(num_workers, reconstruction, cameras, cfg, background):
+    start = time.perf_counter()
+    render_loop_parallel(reconstruction, *cameras, background, cfg, num_workers=num_workers)
+    return cameras[0].shape[0] / (time.perf_counter() - start)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark rendering backends')
+    parser.add_argument('--backends', type=str, nargs='+', default=['torch', 'cpu_fast'],
+                        choices=list(BACKENDS.keys()), help='Backends to benchmark')
+    parser.add_argument('--num_views', type=int, default=200, help='Number of views in the camera loop')
+    parser.add_argument('--resolution', type=int, default=128, help='Side of the splatter image and of the renders')
+    parser.add_argument('--num_threads', type=int, nargs='+', default=[None],
+                        help='Thread counts to try for the cpu_fast backend (default: all cores)')
+    parser.add_argument('--num_workers', type=int, nargs='*', default=[],
+                        help='Process counts to try for parallel loop rendering with cpu_fast')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to render on')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    cfg = get_benchmark_cfg(args.resolution)
+    reconstruction = get_synthetic_splatter_image(args.resolution * args.resolution, device=args.device)
+    cameras = get_synthetic_loop_cameras(args.num_views, device=args.device)
+    background = torch.ones(3, dtype=torch.float32, device=args.device)
+
+    print("{} Gaussians, {} views at {}x{}".format(
+        reconstruction["xyz"].shape[0], args.num_views, args.resolution, args.resolution))
+    for backend in args.backends:
+        for num_threads in (args.num_threads if backend == "cpu_fast" else [None]):
+            if backend == "cpu_fast":
+                set_num_threads(num_threads)
+            fps = measure_fps(backend, reconstruction, cameras, cfg, background)
+            print("{:>10s} threads={:>4s}: {:8.2f} frames/sec".format(
+                backend, str(num_threads or "all"), fps))
+    for num_workers in args.num_workers:
+        fps = measure_parallel_fps(num_workers, reconstruction, cameras, cfg, background)
+        print("{:>10s} workers={:>4d}: {:8.2f} frames/sec".format("parallel", num_workers, fps))
@@ -0,0 +1,87 @@
+"""
+Build and query times of SpatialIndex against full scans over the Gaussians
+of synthetic splatter images.
+
+    python -m benchmarks.spatial_index --sizes 16384 1000000
+"""
+
+import argparse
+import math
+import time
+
+import torch
+
+from gaussian_renderer.culling import build_culling_index, cull_gaussians, CullingSettings
+from utils.spatial_index import SpatialIndex
+from utils.synthetic_utils import get_synthetic_splatter_image, get_synthetic_loop_cameras
+
+from .render_fps import get_benchmark_cfg
+
+def timed(fn, repeats=3):
+    """
+    Smallest time (ms) of repeats calls and the result of the last one.
+    """
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return 1000 * best, result
+
+def full_scan_knn(points, queries, k, chunk_size=256):
+    return torch.cat([torch.topk(torch.cdist(queries[i:i + chunk_size], points), k, dim=1, largest=False).values
+                      for i in range(0, queries.shape[0], chunk_size)])
+
+@torch.no_grad()
+def benchmark(num_gaussians, num_queries, k, radius, resolution, device):
+    reconstruction = get_synthetic_splatter_image(num_gaussians, device=device)
+    xyz = reconstruction["xyz"]
+    generator = torch.Generator().manual_seed(0)
+    queries = (xyz[torch.randint(num_gaussians, (num_queries,), generator=generator)] +
+               0.01 * torch.randn(num_queries, 3, generator=generator)).to(device)
+    world_view_transforms, full_proj_transforms, _ = get_synthetic_loop_cameras(1, device=device)
+    world_view_transform, full_proj_transform = world_view_transforms[0].float(), full_proj_transforms[0].float()
+    # move the camera so that the view sees part of the object
+    world_view_transform[3, 0] += 1.2
+    full_proj_transform = world_view_transform @ torch.linalg.inv(world_view_transforms[0].float()) @ \
+        full_proj_transforms[0].float()
+    cfg = get_benchmark_cfg(resolution)
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    culling_settings = CullingSettings(opacity_threshold=1.0 / 255.0, frustum=True, min_footprint=0.0)
+
+    rows = []
+    build_ms, index = timed(lambda: SpatialIndex(xyz))
+    rows.append(("build", build_ms, None))
+    knn_ms, _ = timed(lambda: index.knn(queries, k=k))
+    scan_ms, _ = timed(lambda: full_scan_knn(xyz, queries, k), repeats=1)
+    rows.append(("knn (k={})".format(k), knn_ms, scan_ms))
+    radius_ms, _ = timed(lambda: index.radius_query(queries, radius))
+    scan_ms, _ = timed(lambda: [torch.nonzero(torch.cdist(queries[i:i + 256], xyz) <= radius)
+                                for i in range(0, num_queries, 256)], repeats=1)
+    rows.append(("radius ({})".format(radius), radius_ms, scan_ms))
+    culling_index = build_culling_index(reconstruction)
+    args = (reconstruction, world_view_transform, full_proj_transform, tanfov, tanfov,
+            resolution, resolution, culling_settings)
+    indexed_ms, kept = timed(lambda: cull_gaussians(*args, spatial_index=culling_index))
+    scan_ms, _ = timed(lambda: cull_gaussians(*args))
+    rows.append(("frustum cull ({:.0f}% kept)".format(100 * kept.shape[0] / num_gaussians), indexed_ms, scan_ms))
+    return rows
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the spatial index over Gaussians')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[16384, 1000000], help='Numbers of Gaussians')
+    parser.add_argument('--num_queries', type=int, default=4096, help='Query points for knn and radius queries')
+    parser.add_argument('--k', type=int, default=8, help='Neighbours of the knn queries')
+    parser.add_argument('--radius', type=float, default=0.02, help='Radius of the radius queries')
+    parser.add_argument('--resolution', type=int, default=128, help='Render resolution of the culled view')
+    parser.add_argument('--device', type=str, default='cpu', help='Device to run on')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    for num_gaussians in args.sizes:
+        print("{} Gaussians, {} queries".format(num_gaussians, args.num_queries))
+        for name, index_ms, scan_ms in benchmark(num_gaussians, args.num_queries, args.k, args.radius,
+                                                 args.resolution, args.device):
+            print("{:>28s}: {:10.2f} ms index {}".format(
+                name, index_ms, "" if scan_ms is None else "{:10.2f} ms full scan".format(scan_ms)))
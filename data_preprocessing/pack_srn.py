@@ -0,0 +1,121 @@
+"""
+Packs a split of SRN ShapeNet into memory-mapped arrays read by SRNDataset
+with data.packed=true (see datasets.srn.get_packed_path for the layout).
+Images are resized once, as SRNDataset does when it first reads an object,
+so that training reads them without decoding PNGs or parsing pose files.
+After packing, the first epoch of the split is timed with the files and with
+the packed arrays, each in a fresh process that also reports its peak RSS.
+
+    python -m data_preprocessing.pack_srn cars train
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import resource
+import time
+
+import numpy as np
+from omegaconf import OmegaConf
+from PIL import Image
+
+from datasets import srn
+from datasets.srn import SRNDataset, get_packed_path
+
+def get_object_folders(base_path):
+    return [os.path.dirname(p) for p in sorted(glob.glob(os.path.join(base_path, "*", "intrinsics.txt")))]
+
+def pack_srn(base_path, resolution=128):
+    """
+    Writes the packed arrays of the split in base_path.
+    Returns the folder of the packed split.
+    """
+    object_folders = get_object_folders(base_path)
+    if len(object_folders) == 0:
+        raise FileNotFoundError("No SRN objects found in {}".format(base_path))
+    rgb_paths = [sorted(glob.glob(os.path.join(folder, "rgb", "*"))) for folder in object_folders]
+    pose_paths = [sorted(glob.glob(os.path.join(folder, "pose", "*"))) for folder in object_folders]
+    num_views = [len(paths) for paths in rgb_paths]
+    max_views = max(num_views)
+
+    out_path = get_packed_path(base_path, resolution)
+    os.makedirs(out_path, exist_ok=True)
+    images = np.lib.format.open_memmap(os.path.join(out_path, "images.npy"), mode="w+", dtype=np.uint8,
+                                       shape=(len(object_folders), max_views, resolution, resolution, 3))
+    poses = np.lib.format.open_memmap(os.path.join(out_path, "poses.npy"), mode="w+", dtype=np.float32,
+                                      shape=(len(object_folders), max_views, 4, 4))
+    for o_idx, (object_rgb_paths, object_pose_paths) in enumerate(zip(rgb_paths, pose_paths)):
+        assert len(object_rgb_paths) == len(object_pose_paths)
+        for v_idx, (rgb_path, pose_path) in enumerate(zip(object_rgb_paths, object_pose_paths)):
+            # same resizing as PILtoTorch
+            images[o_idx, v_idx] = np.array(Image.open(rgb_path).resize((resolution, resolution)))[..., :3]
+            poses[o_idx, v_idx] = np.loadtxt(pose_path, dtype=np.float32).reshape(4, 4)
+    images.flush()
+    poses.flush()
+    with open(os.path.join(out_path, "index.json"), "w") as f:
+        json.dump({"example_ids": [os.path.basename(folder) for folder in object_folders],
+                   "num_views": num_views,
+                   "resolution": resolution}, f)
+    return out_path
+
+def get_dataset_cfg(category, resolution=128, packed=False, subset=-1):
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs")
+    cfg = OmegaConf.merge(OmegaConf.load(os.path.join(config_path, "default_config.yaml")),
+                          OmegaConf.load(os.path.join(config_path, "dataset", "{}.yaml".format(category))))
+    cfg.data.training_resolution = resolution
+    cfg.data.packed = packed
+    cfg.data.subset = subset
+    return cfg
+
+def measure_epoch(root, category, split, resolution, packed, num_examples):
+    """
+    Time of reading num_examples examples of the split (-1 for all) and the
+    growth of the peak RSS of the process meanwhile, like one data loader
+    worker does in the first epoch.
+    """
+    srn.SHAPENET_DATASET_ROOT = root
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    dataset = SRNDataset(get_dataset_cfg(category, resolution, packed, subset=num_examples), split)
+    start = time.perf_counter()
+    for idx in range(len(dataset)):
+        dataset[idx]
+    seconds = time.perf_counter() - start
+    return {"examples_per_second": len(dataset) / seconds,
+            "rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024}
+
+def compare_epochs(root, category, split, resolution, num_examples):
+    """
+    First epoch with the files and with the packed arrays, each in a fresh
+    process.
+    """
+    context = mp.get_context("spawn")
+    results = {}
+    for name, packed in [("files", False), ("packed", True)]:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(measure_epoch, (root, category, split, resolution, packed, num_examples))
+    return results
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Pack a split of SRN ShapeNet into memory-mapped arrays')
+    parser.add_argument('category', type=str, choices=['cars', 'chairs'], help='SRN category')
+    parser.add_argument('split', type=str, choices=['train', 'val', 'test'], help='Split to pack')
+    parser.add_argument('--root', type=str, default=srn.SHAPENET_DATASET_ROOT, help='SRN dataset root')
+    parser.add_argument('--resolution', type=int, default=128, help='Training resolution of the packed images')
+    parser.add_argument('--benchmark_examples', type=int, default=-1,
+                        help='Examples read to compare the first epochs, -1 for the whole split, 0 to skip')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    srn.SHAPENET_DATASET_ROOT = args.root
+    base_path = SRNDataset(get_dataset_cfg(args.category, args.resolution), args.split).base_path
+    start = time.perf_counter()
+    out_path = pack_srn(base_path, args.resolution)
+    print("Packed {} in {:.1f} s".format(out_path, time.perf_counter() - start))
+    if args.benchmark_examples != 0:
+        results = compare_epochs(args.root, args.category, args.split, args.resolution, args.benchmark_examples)
+        for name, result in results.items():
+            print("{:>8s}: {:8.1f} examples/s, peak RSS +{:.0f} MB".format(
+                name, result["examples_per_second"], result["rss_mb"]))
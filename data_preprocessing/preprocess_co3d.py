@@ -18,6 +18,9 @@ CO3D_OUT_ROOT = None # change to your folder here
 assert CO3D_RAW_ROOT is not None, "Change CO3D_RAW_ROOT to where your raw CO3D data resides"
 assert CO3D_OUT_ROOT is not None, "Change CO3D_OUT_ROOT to where you want to save the processed CO3D data"
 
+# the sequence point clouds are subsampled to at most this many points
+POINT_CLOUD_MAX_POINTS = 20000
+
 def update_scores(top_scores, top_names, new_score, new_name):
     for sc_idx, sc in enumerate(top_scores):
         if new_score > sc:
@@ -167,6 +170,14 @@ def main(dataset_name, category):
 
             with open(os.path.join(folder_outname, "frame_order.txt"), "w+") as f:
                 f.writelines([fname + "\n" for fname in fname_order])
+
+            # sequence point cloud in world coordinates, used for geometry metrics
+            point_cloud = created_dataset[frame_idxs[0]].sequence_point_cloud
+            if point_cloud is not None:
+                points = point_cloud.points_packed()
+                if points.shape[0] > POINT_CLOUD_MAX_POINTS:
+                    points = points[torch.randperm(points.shape[0])[:POINT_CLOUD_MAX_POINTS]]
+                np.save(os.path.join(folder_outname, "point_cloud.npy"), points.numpy())
         else:
             print("Warning! bad sequence {}".format(sequence_name))
             bad_sequences.append(sequence_name)
@@ -0,0 +1,300 @@
+"""
+Per-object cache of the dataset classes that decode all the views of an
+object the first time it is read. Every data loader worker holds its own
+dataset, so an unbounded cache grows in every worker until it holds the whole
+split: ExampleCache holds at most max_bytes of tensors and evicts the least
+recently used objects.
+
+SharedExampleCache instead keeps the decoded tensors in a shared memory slab
+created with the dataset, before the data loader starts its workers. An
+object decoded by one worker is then read by all of them without copies.
+Every dataset instance (e.g. the train and the val datasets) has its own
+slab. /dev/shm pages are only allocated when they are written, and writing
+past the free space kills the process with SIGBUS, so slabs are capped to
+the space that is free when they are created (64 MB by default in Docker).
+"""
+
+import hashlib
+import multiprocessing as mp
+import os
+import pickle
+import weakref
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+
+def get_nbytes(value):
+    """
+    Bytes of the tensors and arrays in a value, a dict, list or tuple of them.
+    """
+    if isinstance(value, dict):
+        return sum(get_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(get_nbytes(v) for v in value)
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    return getattr(value, "nbytes", 0)
+
+class ExampleCache:
+    """
+    LRU cache of examples with a byte budget, and hit, miss and eviction
+    counters.
+    """
+    def __init__(self, max_bytes):
+        """
+        Args:
+            max_bytes: budget of the cached tensors, None for no limit. The
+                last example put is kept even if it exceeds the budget alone.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        """
+        Cached value of key, None (and a miss) if it is not cached.
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, value):
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+        nbytes = get_nbytes(value)
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while self.max_bytes is not None and self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_nbytes) = self.entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            self.evictions += 1
+        return value
+
+    def stats(self):
+        """
+        Counters for logging.
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.entries), "megabytes": self.nbytes / 2 ** 20}
+
+SHARED_MEMORY_PATH = "/dev/shm"
+
+# slabs created by this process, which may still be filled
+LIVE_SLABS = weakref.WeakSet()
+
+def get_free_shared_memory():
+    """
+    Bytes free in /dev/shm that the slabs of this process cannot fill
+    anymore, None if there is no /dev/shm.
+    """
+    if not os.path.isdir(SHARED_MEMORY_PATH):
+        return None
+    stats = os.statvfs(SHARED_MEMORY_PATH)
+    unwritten = sum(cache.slab.size - int(cache.header[1]) for cache in LIVE_SLABS)
+    return stats.f_bavail * stats.f_frsize - unwritten
+
+# tensors in the slab start at multiples of this many bytes
+SLAB_ALIGNMENT = 64
+SLAB_ENTRY = np.dtype([("key", "S20"), ("offset", "<i8"), ("layout_nbytes", "<i8"), ("nbytes", "<i8")])
+
+def get_key_digest(key):
+    return hashlib.sha1(str(key).encode()).digest()
+
+def align(nbytes):
+    return (nbytes + SLAB_ALIGNMENT - 1) // SLAB_ALIGNMENT * SLAB_ALIGNMENT
+
+def release_slab(slab, owner_pid):
+    try:
+        slab.close()
+    except BufferError:
+        # tensors still view the slab, the mapping goes away with the process
+        pass
+    if os.getpid() == owner_pid:
+        slab.unlink()
+
+class SharedExampleCache:
+    """
+    Cache of examples (tensors or dicts of tensors) in a shared memory slab
+    that every process holding the dataset reads and fills: the process that
+    creates it and the data loader workers, forked or spawned.
+    Objects are appended to the slab and never evicted. When it is full, new
+    objects go to the fallback cache of the process, if there is one.
+    """
+    def __init__(self, max_bytes, max_entries=None, fallback=None):
+        """
+        Args:
+            max_bytes: bytes of the tensors in the slab, capped to the free
+                shared memory
+            max_entries: objects in the slab, by default one per 16 KB
+            fallback: cache of the objects that do not fit, e.g. an ExampleCache
+        """
+        if max_entries is None:
+            max_entries = max(1024, max_bytes // 2 ** 14)
+        self.max_entries = max_entries
+        self.data_offset = align(2 * 8 + max_entries * SLAB_ENTRY.itemsize)
+        free = get_free_shared_memory()
+        if free is not None and self.data_offset + max_bytes > free:
+            print("Only {:.0f} MB free in {}, the shared cache is capped to them".format(
+                free / 2 ** 20, SHARED_MEMORY_PATH))
+            max_bytes = max(0, free - self.data_offset)
+        self.slab = shared_memory.SharedMemory(create=True, size=self.data_offset + max_bytes)
+        # forked workers inherit a spawn lock, spawned workers unpickle it
+        self.lock = mp.get_context("spawn").Lock()
+        self.fallback = fallback
+        self.attach()
+        self.header[:] = [0, self.data_offset]
+        self.finalizer = weakref.finalize(self, release_slab, self.slab, os.getpid())
+        LIVE_SLABS.add(self)
+
+    def attach(self):
+        """
+        Views of the slab index and the cached objects seen by this process.
+        """
+        # number of entries and first free byte
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.slab.buf)
+        self.entries = np.ndarray((self.max_entries,), dtype=SLAB_ENTRY, buffer=self.slab.buf, offset=16)
+        self.values = {}
+        self.num_seen = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # the lock can only be pickled when a worker is spawned
+        state = {k: v for k, v in self.__dict__.items()
+                 if k not in ["slab", "finalizer", "header", "entries", "values"]}
+        state["slab_name"] = self.slab.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.slab = shared_memory.SharedMemory(name=self.__dict__.pop("slab_name"))
+        self.attach()
+
+    def __len__(self):
+        return int(self.header[0]) + (0 if self.fallback is None else len(self.fallback))
+
+    def __contains__(self, key):
+        return self.lookup(get_key_digest(key)) is not None or \
+            (self.fallback is not None and key in self.fallback)
+
+    def read_new_entries(self):
+        """
+        Views of the objects added to the slab since the last call.
+        """
+        for entry in self.entries[self.num_seen:int(self.header[0])]:
+            offset, layout_nbytes = int(entry["offset"]), int(entry["layout_nbytes"])
+            layout = pickle.loads(self.slab.buf[offset:offset + layout_nbytes])
+            tensors = {}
+            tensors_offset = offset + align(layout_nbytes)
+            for name, dtype, shape, tensor_offset in layout:
+                numel = int(np.prod(shape))
+                if numel == 0:
+                    tensors[name] = torch.empty(shape, dtype=dtype)
+                else:
+                    tensors[name] = torch.frombuffer(self.slab.buf, dtype=dtype, count=numel,
+                                                     offset=tensors_offset + tensor_offset).view(shape)
+            self.values[bytes(entry["key"])] = tensors[None] if None in tensors else tensors
+            self.num_seen += 1
+
+    def lookup(self, digest):
+        if digest not in self.values and self.num_seen < self.header[0]:
+            with self.lock:
+                self.read_new_entries()
+        return self.values.get(digest)
+
+    def get(self, key):
+        """
+        Cached value of key, None (and a miss) if it is not cached.
+        """
+        value = self.lookup(get_key_digest(key))
+        if value is not None:
+            self.hits += 1
+            return value
+        if self.fallback is not None:
+            return self.fallback.get(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Copies value to the slab and returns its view there, or the value
+        cached by the fallback if the slab is full.
+        """
+        digest = get_key_digest(key)
+        tensors = value if isinstance(value, dict) else {None: value}
+        layout = []
+        nbytes = 0
+        for name, tensor in tensors.items():
+            layout.append((name, tensor.dtype, tuple(tensor.shape), nbytes))
+            nbytes = align(nbytes + tensor.element_size() * tensor.nelement())
+        # tensor offsets are relative to the end of the layout
+        layout_bytes = pickle.dumps(layout)
+        layout_nbytes = align(len(layout_bytes))
+        with self.lock:
+            # another process may have decoded the object meanwhile
+            self.read_new_entries()
+            if digest in self.values:
+                return self.values[digest]
+            num_entries, offset = int(self.header[0]), int(self.header[1])
+            if num_entries == self.max_entries or offset + layout_nbytes + nbytes > self.slab.size:
+                return value if self.fallback is None else self.fallback.put(key, value)
+            self.slab.buf[offset:offset + len(layout_bytes)] = layout_bytes
+            for (name, _, _, tensor_offset) in layout:
+                tensor = tensors[name]
+                if tensor.nelement() > 0:
+                    torch.frombuffer(self.slab.buf, dtype=tensor.dtype, count=tensor.nelement(),
+                                     offset=offset + layout_nbytes + tensor_offset).copy_(tensor.reshape(-1))
+            self.entries[num_entries] = (digest, offset, len(layout_bytes), layout_nbytes + nbytes)
+            # the entry is complete before other processes count it
+            self.header[1] = offset + layout_nbytes + nbytes
+            self.header[0] = num_entries + 1
+            self.read_new_entries()
+        return self.values[digest]
+
+    def stats(self):
+        """
+        Counters for logging. The shared entries and megabytes are those of
+        all the processes, the other counters of this process.
+        """
+        stats = {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "megabytes": 0.0} \
+            if self.fallback is None else self.fallback.stats()
+        stats["hits"] += self.hits
+        stats["misses"] += self.misses
+        stats["shared_entries"] = int(self.header[0])
+        stats["shared_megabytes"] = (int(self.header[1]) - self.data_offset) / 2 ** 20
+        return stats
+
+def get_shared_example_cache(cfg, fallback=None):
+    """
+    Shared cache with the budget of cfg.data.shared_cache_mb, None if it is
+    not set or not positive.
+    """
+    shared_cache_mb = cfg.data.get("shared_cache_mb", 0)
+    if shared_cache_mb is None or shared_cache_mb <= 0:
+        return None
+    return SharedExampleCache(int(shared_cache_mb * 2 ** 20), fallback=fallback)
+
+def get_example_cache(cfg):
+    """
+    Cache with the budget of cfg.data.cache_mb (per dataset, so per data loader
+    worker), unbounded if it is not set or negative. With
+    cfg.data.shared_cache_mb the objects are first cached in shared memory.
+    """
+    cache_mb = cfg.data.get("cache_mb", -1)
+    cache = ExampleCache(None if cache_mb is None or cache_mb < 0 else int(cache_mb * 2 ** 20))
+    shared_cache = get_shared_example_cache(cfg, fallback=cache)
+    return cache if shared_cache is None else shared_cache
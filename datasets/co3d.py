@@ -17,6 +17,7 @@ from .bad_sequences import (
     LOW_QUALITY_SEQUENCE
     )
 
+from .cache import get_example_cache
 from .shared_dataset import SharedDataset
 
 from .dataset_readers import readCamerasFromNpy
@@ -76,6 +77,7 @@ class CO3DDataset(SharedDataset):
             raise NotImplementedError
 
         self.init_ray_dirs()
+        self.cache = get_example_cache(cfg)
 
     def __len__(self):
         return len(self.frame_order_files)
@@ -113,8 +115,11 @@ class CO3DDataset(SharedDataset):
     def load_example_id(self, example_id, intrin_path,
                         trans = np.array([0.0, 0.0, 0.0]), scale=1.0):
         """
-        Reads an example from storage if it has not been read already.
+        Reads an example from storage if it is not cached.
         """
+        example = self.cache.get(example_id)
+        if example is not None:
+            return example
 
         dir_path = os.path.dirname(intrin_path)
         focals_folder_path = os.path.join(self.base_path,
@@ -122,79 +127,66 @@ class CO3DDataset(SharedDataset):
 
         rgb_path = os.path.join(dir_path, "images_fg.npy")
 
-        if not hasattr(self, "all_rgbs"):
-            self.all_rgbs = {}
-            self.all_origin_distances = {}
-            self.all_ray_embeddings = {}
-
-            self.all_world_view_transforms = {}
-            self.all_view_to_world_transforms = {}
-            self.all_full_proj_transforms = {}
-            self.all_camera_centers = {}
-            self.all_focals_pixels = {}
-
-        if example_id not in self.all_rgbs.keys():
-            self.all_world_view_transforms[example_id] = []
-            self.all_full_proj_transforms[example_id] = []
-            self.all_camera_centers[example_id] = []
-            self.all_view_to_world_transforms[example_id] = []
-            self.all_focals_pixels[example_id] = []
-
-            self.all_ray_embeddings[example_id] = []
-            self.all_origin_distances[example_id] = []
-
-            images = np.load(rgb_path)
-            self.all_rgbs[example_id] = torch.from_numpy(images)
-
-            print("Loaded example with {} frames".format(len(images)))
-            print("Loading focals from {}".format(focals_folder_path))
-            w2c_Ts_rmo = self.Ts[example_id]
-            w2c_Rs_rmo = self.Rs[example_id]
-
-            # Read cameras, convert into our camera convention and compute full projection matrices
-            cam_infos = readCamerasFromNpy(dir_path, 
-                                           w2c_Rs_rmo=w2c_Rs_rmo, 
-                                           w2c_Ts_rmo=w2c_Ts_rmo,
-                                           focals_folder_path=focals_folder_path)
-
-            for cam_info in cam_infos:
-                R = cam_info.R
-                T = cam_info.T
-
-                world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1)
-                view_world_transform = torch.tensor(getView2World(R, T, trans, scale)).transpose(0, 1)
-
-                projection_matrix = getProjectionMatrix(
-                        znear=self.cfg.data.znear, zfar=self.cfg.data.zfar,
-                        fovX=cam_info.FovX, 
-                        fovY=cam_info.FovY
-                    ).transpose(0,1)
-
-                full_proj_transform = (world_view_transform.unsqueeze(0).bmm(projection_matrix.unsqueeze(0))).squeeze(0)
-                camera_center = world_view_transform.inverse()[3, :3]
-
-                self.all_world_view_transforms[example_id].append(world_view_transform)
-                self.all_view_to_world_transforms[example_id].append(view_world_transform)
-                self.all_full_proj_transforms[example_id].append(full_proj_transform)
-                self.all_camera_centers[example_id].append(camera_center)
-                self.all_focals_pixels[example_id].append(torch.tensor([fov2focal(cam_info.FovX, 128),
-                                                                        fov2focal(cam_info.FovY, 128)]))
-
-                ray_dirs = self.ray_dirs.clone()[0]
-                ray_dirs[:2, ...] = ray_dirs[:2, ...] / self.all_focals_pixels[example_id][-1].unsqueeze(1).unsqueeze(2)
-                self.all_ray_embeddings[example_id].append(ray_dirs)
-
-                self.all_origin_distances[example_id].append(
-                    self.get_origin_distance(self.all_view_to_world_transforms[example_id][-1]))
-
-            self.all_world_view_transforms[example_id] = torch.stack(self.all_world_view_transforms[example_id])
-            self.all_view_to_world_transforms[example_id] = torch.stack(self.all_view_to_world_transforms[example_id])
-            self.all_full_proj_transforms[example_id] = torch.stack(self.all_full_proj_transforms[example_id])
-            self.all_camera_centers[example_id] = torch.stack(self.all_camera_centers[example_id])
-            self.all_focals_pixels[example_id] = torch.stack(self.all_focals_pixels[example_id])
-            self.all_origin_distances[example_id] = torch.stack(self.all_origin_distances[example_id])
-            self.all_ray_embeddings[example_id] = torch.stack(self.all_ray_embeddings[example_id])
+        example = {"world_view_transforms": [],
+                   "view_to_world_transforms": [],
+                   "full_proj_transforms": [],
+                   "camera_centers": [],
+                   "focals_pixels": [],
+                   "ray_embeddings": [],
+                   "origin_distances": []}
 
+        images = np.load(rgb_path)
+
+        print("Loaded example with {} frames".format(len(images)))
+        print("Loading focals from {}".format(focals_folder_path))
+        w2c_Ts_rmo = self.Ts[example_id]
+        w2c_Rs_rmo = self.Rs[example_id]
+
+        # Read cameras, convert into our camera convention and compute full projection matrices
+        cam_infos = readCamerasFromNpy(dir_path, 
+                                       w2c_Rs_rmo=w2c_Rs_rmo, 
+                                       w2c_Ts_rmo=w2c_Ts_rmo,
+                                       focals_folder_path=focals_folder_path)
+
+        for cam_info in cam_infos:
+            R = cam_info.R
+            T = cam_info.T
+
+            world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1)
+            view_world_transform = torch.tensor(getView2World(R, T, trans, scale)).transpose(0, 1)
+
+            projection_matrix = getProjectionMatrix(
+                    znear=self.cfg.data.znear, zfar=self.cfg.data.zfar,
+                    fovX=cam_info.FovX, 
+                    fovY=cam_info.FovY
+                ).transpose(0,1)
+
+            full_proj_transform = (world_view_transform.unsqueeze(0).bmm(projection_matrix.unsqueeze(0))).squeeze(0)
+            camera_center = world_view_transform.inverse()[3, :3]
+
+            example["world_view_transforms"].append(world_view_transform)
+            example["view_to_world_transforms"].append(view_world_transform)
+            example["full_proj_transforms"].append(full_proj_transform)
+            example["camera_centers"].append(camera_center)
+            example["focals_pixels"].append(torch.tensor([fov2focal(cam_info.FovX, 128),
+                                                          fov2focal(cam_info.FovY, 128)]))
+
+            ray_dirs = self.ray_dirs.clone()[0]
+            ray_dirs[:2, ...] = ray_dirs[:2, ...] / example["focals_pixels"][-1].unsqueeze(1).unsqueeze(2)
+            example["ray_embeddings"].append(ray_dirs)
+
+            example["origin_distances"].append(
+                self.get_origin_distance(example["view_to_world_transforms"][-1]))
+
+        example = {k: torch.stack(v) for k, v in example.items()}
+        example["rgbs"] = torch.from_numpy(images)
+
+        # sequence point cloud in world coordinates, saved by newer preprocessing
+        point_cloud_path = os.path.join(dir_path, "point_cloud.npy")
+        if os.path.exists(point_cloud_path):
+            example["point_cloud"] = torch.from_numpy(np.load(point_cloud_path)).float()
+
+        return self.cache.put(example_id, example)
 
     def get_example_id(self, index):
         intrin_path = self.frame_order_files[index]
@@ -205,28 +197,35 @@ class CO3DDataset(SharedDataset):
         intrin_path = self.frame_order_files[index]
         example_id = os.path.basename(os.path.dirname(intrin_path))
          
-        self.load_example_id(example_id, intrin_path)
+        example = self.load_example_id(example_id, intrin_path)
         if self.dataset_name == "train":
             frame_idxs = torch.randperm(
-                    len(self.all_rgbs[example_id])
+                    len(example["rgbs"])
                     )[:self.imgs_per_obj]
             frame_idxs = torch.cat([frame_idxs[:self.cfg.data.input_images], frame_idxs], dim=0)
         else:
             input_idxs = self.test_input_idxs
             frame_idxs = torch.cat([torch.tensor(input_idxs), 
-                                    torch.tensor([i for i in range(len(self.all_rgbs[example_id])) if i not in input_idxs])], dim=0) 
+                                    torch.tensor([i for i in range(len(example["rgbs"])) if i not in input_idxs])], dim=0) 
 
         images_and_camera_poses = {
-            "gt_images": self.all_rgbs[example_id][frame_idxs].clone(),
-            "world_view_transforms": self.all_world_view_transforms[example_id][frame_idxs],
-            "view_to_world_transforms": self.all_view_to_world_transforms[example_id][frame_idxs],
-            "full_proj_transforms": self.all_full_proj_transforms[example_id][frame_idxs],
-            "camera_centers": self.all_camera_centers[example_id][frame_idxs],
-            "focals_pixels": self.all_focals_pixels[example_id][frame_idxs].clone(),
-            "origin_distances": self.all_origin_distances[example_id][frame_idxs],
-            "ray_embeddings": self.all_ray_embeddings[example_id][frame_idxs]
+            "gt_images": example["rgbs"][frame_idxs].clone(),
+            "world_view_transforms": example["world_view_transforms"][frame_idxs],
+            "view_to_world_transforms": example["view_to_world_transforms"][frame_idxs],
+            "full_proj_transforms": example["full_proj_transforms"][frame_idxs],
+            "camera_centers": example["camera_centers"][frame_idxs],
+            "focals_pixels": example["focals_pixels"][frame_idxs].clone(),
+            "origin_distances": example["origin_distances"][frame_idxs],
+            "ray_embeddings": example["ray_embeddings"][frame_idxs]
         }
 
+        if self.dataset_name != "train" and "point_cloud" in example:
+            # the reconstruction is in the coordinates of the first camera
+            point_cloud = example["point_cloud"]
+            images_and_camera_poses["point_cloud"] = torch.cat(
+                [point_cloud, torch.ones_like(point_cloud[:, :1])], dim=1
+                ) @ images_and_camera_poses["world_view_transforms"][0][:, :3].float()
+
         images_and_camera_poses = self.make_poses_relative_to_first(images_and_camera_poses)
 
         images_and_camera_poses["source_cv2wT_quat"] = self.get_source_cw2wT(images_and_camera_poses["view_to_world_transforms"])
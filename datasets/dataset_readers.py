@@ -21,6 +21,11 @@ class CameraInfo(NamedTuple):
     height: int
 
 
+def readPoseFromTxt(pose_path):
+    # 16 numbers, parsed without np.loadtxt which is slow for tiny files
+    with open(pose_path) as f:
+        return np.array(f.read().split(), dtype=np.float32).reshape(4, 4)
+
 def readCamerasFromTxt(rgb_paths, pose_paths, idxs):
     cam_infos = []
     # Transform fov from degrees to radians
@@ -31,7 +36,7 @@ def readCamerasFromTxt(rgb_paths, pose_paths, idxs):
         # SRN cameras are camera-to-world transforms
         # no need to change from SRN camera axes (x right, y down, z away) 
         # it's the same as COLMAP (x right, y down, z forward)
-        c2w = np.loadtxt(cam_name, dtype=np.float32).reshape(4, 4)
+        c2w = readPoseFromTxt(cam_name)
 
         # get the world-to-camera transform and set R, T
         w2c = np.linalg.inv(c2w)
@@ -13,6 +13,7 @@ from utils.general_utils import PILtoTorch
 from utils.graphics_utils import getProjectionMatrix
 from utils.camera_utils import get_loop_cameras
 
+from .cache import get_shared_example_cache
 from .shared_dataset import SharedDataset
 
 NMR_DATASET_ROOT = None # Change this to your data directory
@@ -107,6 +108,18 @@ class NMRDataset(SharedDataset):
         if cfg.data.subset != -1:
             self.paths = self.paths[:cfg.data.subset]
 
+        # views are decoded on every read unless they are shared between workers
+        self.cache = get_shared_example_cache(cfg)
+
+    def load_image(self, rgb_path):
+        img = None if self.cache is None else self.cache.get(rgb_path)
+        if img is None:
+            img = PILtoTorch(Image.open(rgb_path), (self.cfg.data.training_resolution,
+                                                    self.cfg.data.training_resolution))
+            if self.cache is not None:
+                img = self.cache.put(rgb_path, img)
+        return img
+
     def load_imgs_and_convert_cameras(self, rgb_paths, cam_path, num_views):
         """
         Load the images, camera matrices and projection matrices for a given object 
@@ -134,9 +147,7 @@ class NMRDataset(SharedDataset):
         for frame_idx in indexes:
 
             rgb_path = rgb_paths[frame_idx]
-            img = PILtoTorch(Image.open(rgb_path), (self.cfg.data.training_resolution,
-                                                    self.cfg.data.training_resolution))
-            imgs.append(img)
+            imgs.append(self.load_image(rgb_path))
 
             # Read off extrinsic matrix
             wmat_inv_key = "world_mat_inv_" + str(frame_idx.item())
@@ -1,7 +1,7 @@
-import torch
 from torch.utils.data import Dataset
 
-from utils.general_utils import matrix_to_quaternion
+from utils.general_utils import matrix_to_quaternion_batch
+from utils.graphics_utils import invert_rigid_transforms
 
 class SharedDataset(Dataset):
     """
@@ -11,24 +11,24 @@ class SharedDataset(Dataset):
         super().__init__()
 
     def make_poses_relative_to_first(self, images_and_camera_poses):
-        inverse_first_camera = images_and_camera_poses["world_view_transforms"][0].inverse().clone()
-        for c in range(images_and_camera_poses["world_view_transforms"].shape[0]):
-            images_and_camera_poses["world_view_transforms"][c] = torch.bmm(
-                                                inverse_first_camera.unsqueeze(0),
-                                                images_and_camera_poses["world_view_transforms"][c].unsqueeze(0)).squeeze(0)
-            images_and_camera_poses["view_to_world_transforms"][c] = torch.bmm(
-                                                images_and_camera_poses["view_to_world_transforms"][c].unsqueeze(0),
-                                                inverse_first_camera.inverse().unsqueeze(0)).squeeze(0)
-            images_and_camera_poses["full_proj_transforms"][c] = torch.bmm(
-                                                inverse_first_camera.unsqueeze(0),
-                                                images_and_camera_poses["full_proj_transforms"][c].unsqueeze(0)).squeeze(0)
-            images_and_camera_poses["camera_centers"][c] = images_and_camera_poses["world_view_transforms"][c].inverse()[3, :3]
+        """
+        Transforms the cameras of all the views at once so that the first
+        camera is at the origin, with the world to view transform of the first
+        camera assumed rigid.
+        """
+        world_view_transforms = images_and_camera_poses["world_view_transforms"]
+        first_camera = world_view_transforms[0].unsqueeze(0)
+        inverse_first_camera = invert_rigid_transforms(first_camera)
+        world_view_transforms = inverse_first_camera @ world_view_transforms
+        images_and_camera_poses["world_view_transforms"] = world_view_transforms
+        images_and_camera_poses["view_to_world_transforms"] = \
+            images_and_camera_poses["view_to_world_transforms"] @ first_camera
+        images_and_camera_poses["full_proj_transforms"] = \
+            inverse_first_camera @ images_and_camera_poses["full_proj_transforms"]
+        images_and_camera_poses["camera_centers"] = invert_rigid_transforms(world_view_transforms)[:, 3, :3]
         return images_and_camera_poses
     
     def get_source_cw2wT(self, source_cameras_view_to_world):
         # Compute view to world transforms in quaternion representation.
         # Used for transforming predicted rotations
-        qs = []
-        for c_idx in range(source_cameras_view_to_world.shape[0]):
-            qs.append(matrix_to_quaternion(source_cameras_view_to_world[c_idx, :3, :3].transpose(0, 1)))
-        return torch.stack(qs, dim=0)
\ No newline at end of file
+        return matrix_to_quaternion_batch(source_cameras_view_to_world[:, :3, :3].transpose(1, 2))
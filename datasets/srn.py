@@ -1,11 +1,14 @@
 import glob
+import json
 import os
 
 import numpy as np
 import torch
+from PIL import Image
 from torch.utils.data import Dataset
 
-from .dataset_readers import readCamerasFromTxt
+from .cache import get_example_cache
+from .dataset_readers import readCamerasFromTxt, readPoseFromTxt
 from utils.general_utils import PILtoTorch, matrix_to_quaternion
 from utils.graphics_utils import getWorld2View2, getProjectionMatrix, getView2World
 
@@ -14,6 +17,19 @@ from .shared_dataset import SharedDataset
 SHAPENET_DATASET_ROOT = "/content/cv"  # Change this to your data directory
 assert SHAPENET_DATASET_ROOT is not None, "Update the location of the SRN Shapenet Dataset"
 
+def get_rgb_paths(intrin_path):
+    return sorted(glob.glob(os.path.join(os.path.dirname(intrin_path), "rgb", "*")))
+
+def get_packed_path(base_path, resolution):
+    """
+    Folder of the packed split written by data_preprocessing/pack_srn.py:
+    images.npy, uint8 [num_objects, num_views, H, W, 3] (objects with fewer
+    views are padded), poses.npy, float32 [num_objects, num_views, 4, 4]
+    camera-to-world transforms, and index.json with the example ids and the
+    number of views of every object.
+    """
+    return os.path.join(base_path, "packed_{}".format(resolution))
+
 class SRNDataset(SharedDataset):
     def __init__(self, cfg, dataset_name="train"):
         super().__init__()
@@ -34,11 +50,29 @@ class SRNDataset(SharedDataset):
             if os.path.exists(tmp):
                 self.base_path = tmp
 
-        self.intrins = sorted(glob.glob(os.path.join(self.base_path, "*", "intrinsics.txt")))
+        # read the packed arrays instead of the PNGs and pose files
+        self.packed = cfg.data.get("packed", False)
+        if self.packed:
+            self.packed_path = get_packed_path(self.base_path, cfg.data.training_resolution)
+            with open(os.path.join(self.packed_path, "index.json")) as f:
+                index = json.load(f)
+            self.example_ids = index["example_ids"]
+            self.num_views = index["num_views"]
+            if cfg.data.subset != -1:
+                self.example_ids = self.example_ids[:cfg.data.subset]
+            # memory maps are opened in the process that reads them, so that
+            # data loader workers do not receive copies
+            self.packed_images = None
+            self.packed_poses = None
+        else:
+            self.intrins = sorted(glob.glob(os.path.join(self.base_path, "*", "intrinsics.txt")))
 
-        print(f"Number of intrinsic files found: {len(self.intrins)}")
-        if cfg.data.subset != -1:
-            self.intrins = self.intrins[:cfg.data.subset]
+            print(f"Number of intrinsic files found: {len(self.intrins)}")
+            if cfg.data.subset != -1:
+                self.intrins = self.intrins[:cfg.data.subset]
+            self.cache = get_example_cache(cfg)
+            # in training only the sampled views are decoded, the decoded views are cached
+            self.lazy_frames = cfg.data.get("lazy_frames", False) and self.dataset_name == "train"
 
         self.projection_matrix = getProjectionMatrix(
             znear=self.cfg.data.znear, zfar=self.cfg.data.zfar,
@@ -48,66 +82,130 @@ class SRNDataset(SharedDataset):
         self.imgs_per_obj = self.cfg.opt.imgs_per_obj
 
     def __len__(self):
+        if self.packed:
+            return len(self.example_ids)
         return len(self.intrins)
 
     def load_example_id(self, example_id, intrin_path, trans=np.array([0.0, 0.0, 0.0]), scale=1.0):
+        """
+        Images and cameras of all the views of an example, read from storage
+        if they are not cached. With lazy frames the images are not decoded
+        and the example has no "rgbs".
+        """
+        example = self.cache.get(example_id)
+        if example is not None:
+            return example
+
         dir_path = os.path.dirname(intrin_path)
-        rgb_paths = sorted(glob.glob(os.path.join(dir_path, "rgb", "*")))
+        rgb_paths = get_rgb_paths(intrin_path)
         pose_paths = sorted(glob.glob(os.path.join(dir_path, "pose", "*")))
         assert len(rgb_paths) == len(pose_paths)
 
-        if not hasattr(self, "all_rgbs"):
-            self.all_rgbs = {}
-            self.all_world_view_transforms = {}
-            self.all_view_to_world_transforms = {}
-            self.all_full_proj_transforms = {}
-            self.all_camera_centers = {}
-
-        if example_id not in self.all_rgbs.keys():
-            self.all_rgbs[example_id] = []
-            self.all_world_view_transforms[example_id] = []
-            self.all_full_proj_transforms[example_id] = []
-            self.all_camera_centers[example_id] = []
-            self.all_view_to_world_transforms[example_id] = []
-
-            cam_infos = readCamerasFromTxt(rgb_paths, pose_paths, [i for i in range(len(rgb_paths))])
-
-            for cam_info in cam_infos:
-                R = cam_info.R
-                T = cam_info.T
-
-                self.all_rgbs[example_id].append(PILtoTorch(cam_info.image, 
-                                                            (self.cfg.data.training_resolution, self.cfg.data.training_resolution)).clamp(0.0, 1.0)[:3, :, :])
-
-                world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1)
-                view_world_transform = torch.tensor(getView2World(R, T, trans, scale)).transpose(0, 1)
-
-                full_proj_transform = (world_view_transform.unsqueeze(0).bmm(self.projection_matrix.unsqueeze(0))).squeeze(0)
-                camera_center = world_view_transform.inverse()[3, :3]
-
-                self.all_world_view_transforms[example_id].append(world_view_transform)
-                self.all_view_to_world_transforms[example_id].append(view_world_transform)
-                self.all_full_proj_transforms[example_id].append(full_proj_transform)
-                self.all_camera_centers[example_id].append(camera_center)
-            
-            self.all_world_view_transforms[example_id] = torch.stack(self.all_world_view_transforms[example_id])
-            self.all_view_to_world_transforms[example_id] = torch.stack(self.all_view_to_world_transforms[example_id])
-            self.all_full_proj_transforms[example_id] = torch.stack(self.all_full_proj_transforms[example_id])
-            self.all_camera_centers[example_id] = torch.stack(self.all_camera_centers[example_id])
-            self.all_rgbs[example_id] = torch.stack(self.all_rgbs[example_id])
+        if self.lazy_frames:
+            # cameras of all the views at once, as for the packed split
+            cameras_to_world = torch.from_numpy(np.stack([readPoseFromTxt(p) for p in pose_paths]))
+            world_view_transforms, view_world_transforms, full_proj_transforms, camera_centers = \
+                self.get_cameras(cameras_to_world)
+            return self.cache.put(example_id, {"world_view_transforms": world_view_transforms,
+                                               "view_to_world_transforms": view_world_transforms,
+                                               "full_proj_transforms": full_proj_transforms,
+                                               "camera_centers": camera_centers})
+
+        example = {"rgbs": [],
+                   "world_view_transforms": [],
+                   "view_to_world_transforms": [],
+                   "full_proj_transforms": [],
+                   "camera_centers": []}
+
+        cam_infos = readCamerasFromTxt(rgb_paths, pose_paths, [i for i in range(len(rgb_paths))])
+
+        for cam_info in cam_infos:
+            R = cam_info.R
+            T = cam_info.T
+
+            example["rgbs"].append(self.decode_frame(cam_info.image))
+
+            world_view_transform = torch.tensor(getWorld2View2(R, T, trans, scale)).transpose(0, 1)
+            view_world_transform = torch.tensor(getView2World(R, T, trans, scale)).transpose(0, 1)
+
+            full_proj_transform = (world_view_transform.unsqueeze(0).bmm(self.projection_matrix.unsqueeze(0))).squeeze(0)
+            camera_center = world_view_transform.inverse()[3, :3]
+
+            example["world_view_transforms"].append(world_view_transform)
+            example["view_to_world_transforms"].append(view_world_transform)
+            example["full_proj_transforms"].append(full_proj_transform)
+            example["camera_centers"].append(camera_center)
+
+        return self.cache.put(example_id, {k: torch.stack(v) for k, v in example.items()})
+
+    def decode_frame(self, image):
+        return PILtoTorch(image, (self.cfg.data.training_resolution,
+                                  self.cfg.data.training_resolution)).clamp(0.0, 1.0)[:3, :, :]
+
+    def load_frames(self, example_id, intrin_path, frame_idxs):
+        """
+        Images [len(frame_idxs), 3, H, W] of some views of an example, decoded
+        if they are not cached.
+        """
+        rgb_paths = get_rgb_paths(intrin_path)
+        frames = {}
+        for frame_idx in frame_idxs.tolist():
+            if frame_idx in frames:
+                continue
+            key = "{}/{}".format(example_id, frame_idx)
+            frames[frame_idx] = self.cache.get(key)
+            if frames[frame_idx] is None:
+                frames[frame_idx] = self.cache.put(key, self.decode_frame(Image.open(rgb_paths[frame_idx])))
+        return torch.stack([frames[frame_idx] for frame_idx in frame_idxs.tolist()])
+
+    def get_cameras(self, cameras_to_world):
+        """
+        World to view, view to world and full projection transforms [V, 4, 4]
+        and camera centers [V, 3] of camera-to-world transforms [V, 4, 4],
+        computed as in load_example_id for all views at once.
+        """
+        world_to_cameras = torch.linalg.inv(cameras_to_world)
+        view_world_transforms = torch.linalg.inv(world_to_cameras.double())
+        world_view_transforms = torch.linalg.inv(view_world_transforms).float().transpose(1, 2)
+        view_world_transforms = view_world_transforms.float().transpose(1, 2)
+        full_proj_transforms = world_view_transforms.bmm(
+            self.projection_matrix.unsqueeze(0).expand(world_view_transforms.shape[0], 4, 4))
+        camera_centers = world_view_transforms.inverse()[:, 3, :3]
+        return world_view_transforms, view_world_transforms, full_proj_transforms, camera_centers
+
+    def get_packed_example(self, index, frame_idxs):
+        """
+        Images and cameras of the frames of an object of the packed split.
+        """
+        if self.packed_images is None:
+            self.packed_images = np.load(os.path.join(self.packed_path, "images.npy"), mmap_mode="r")
+            self.packed_poses = np.load(os.path.join(self.packed_path, "poses.npy"), mmap_mode="r")
+        # fancy indexing copies only the frames out of the memory maps
+        images = torch.from_numpy(self.packed_images[index, frame_idxs.numpy()])
+        cameras_to_world = torch.from_numpy(self.packed_poses[index, frame_idxs.numpy()])
+        world_view_transforms, view_world_transforms, full_proj_transforms, camera_centers = \
+            self.get_cameras(cameras_to_world)
+        return {"gt_images": images.permute(0, 3, 1, 2).float() / 255.0,
+                "world_view_transforms": world_view_transforms,
+                "view_to_world_transforms": view_world_transforms,
+                "full_proj_transforms": full_proj_transforms,
+                "camera_centers": camera_centers}
 
     def get_example_id(self, index):
+        if self.packed:
+            return self.example_ids[index]
         intrin_path = self.intrins[index]
         example_id = os.path.basename(os.path.dirname(intrin_path))
         return example_id
 
     def __getitem__(self, index):
-        intrin_path = self.intrins[index]
-        example_id = os.path.basename(os.path.dirname(intrin_path))
-        self.load_example_id(example_id, intrin_path)
-
-        # Dynamically adjust the test_input_idxs based on available frames
-        num_frames = len(self.all_rgbs[example_id])
+        example_id = self.get_example_id(index)
+        if self.packed:
+            num_frames = self.num_views[index]
+        else:
+            example = self.load_example_id(example_id, self.intrins[index])
+            # Dynamically adjust the test_input_idxs based on available frames
+            num_frames = len(example["world_view_transforms"])
 
         if self.dataset_name == "train":
             frame_idxs = torch.randperm(num_frames)[:self.imgs_per_obj]
@@ -125,14 +223,18 @@ class SRNDataset(SharedDataset):
             frame_idxs = torch.cat([torch.tensor(input_idxs), 
                                     torch.tensor([i for i in range(num_frames) if i not in input_idxs])], dim=0)
 
-        images_and_camera_poses = {
-            "sample_id": example_id,
-            "gt_images": self.all_rgbs[example_id][frame_idxs].clone(),
-            "world_view_transforms": self.all_world_view_transforms[example_id][frame_idxs],
-            "view_to_world_transforms": self.all_view_to_world_transforms[example_id][frame_idxs],
-            "full_proj_transforms": self.all_full_proj_transforms[example_id][frame_idxs],
-            "camera_centers": self.all_camera_centers[example_id][frame_idxs]
-        }
+        if self.packed:
+            images_and_camera_poses = {"sample_id": example_id, **self.get_packed_example(index, frame_idxs)}
+        else:
+            images_and_camera_poses = {
+                "sample_id": example_id,
+                "gt_images": self.load_frames(example_id, self.intrins[index], frame_idxs) \
+                    if self.lazy_frames else example["rgbs"][frame_idxs].clone(),
+                "world_view_transforms": example["world_view_transforms"][frame_idxs],
+                "view_to_world_transforms": example["view_to_world_transforms"][frame_idxs],
+                "full_proj_transforms": example["full_proj_transforms"][frame_idxs],
+                "camera_centers": example["camera_centers"][frame_idxs]
+            }
 
         images_and_camera_poses = self.make_poses_relative_to_first(images_and_camera_poses)
         images_and_camera_poses["source_cv2wT_quat"] = self.get_source_cw2wT(images_and_camera_poses["view_to_world_transforms"])
@@ -14,10 +14,15 @@ import torchvision
 from torchvision import transforms
 from torch.utils.data import DataLoader
 
-from gaussian_renderer import render_predicted
+from gaussian_renderer import render_predicted, render_batch, prepare_gaussians, get_camera_intrinsics
+from gaussian_renderer.parallel import RenderPool, render_loop_parallel
+from gaussian_renderer.culling import get_culling_settings
+from gaussian_renderer.diagnostics import summarise_reconstruction
 from scene.gaussian_predictor import GaussianSplatPredictor
 from datasets.dataset_factory import get_dataset
 from utils.loss_utils import ssim as ssim_fn
+from utils.geometry_utils import evaluate_geometry
+from gaussian_renderer.compaction import compact_reconstruction
 from utils.vis_utils import vis_image_preds
 
 class Metricator():
@@ -29,14 +34,48 @@ class Metricator():
         ssim = ssim_fn(image, target).item()
         return psnr, ssim, lpips
 
+def save_render_diagnostics(diagnostics, reconstruction, out_example_diagnostics):
+    """
+    Saves the overdraw heatmap of every view as a PNG (normalised by the
+    largest overdraw of the example) and the per-view statistics together
+    with the opacity and scaling statistics of the reconstruction as json.
+    """
+    os.makedirs(out_example_diagnostics, exist_ok=True)
+    max_overdraw = max(max(d["overdraw"].max().item() for d in diagnostics), 1)
+    views = []
+    for r_idx, d in enumerate(diagnostics):
+        torchvision.utils.save_image(d["overdraw"].float().unsqueeze(0) / max_overdraw,
+                                     os.path.join(out_example_diagnostics, '{0:05d}'.format(r_idx) + ".png"))
+        views.append({"mean_contributing_gaussians": d["mean_contributing_gaussians"],
+                      "max_contributing_gaussians": d["overdraw"].max().item(),
+                      "visible_fraction": d["visible_fraction"],
+                      "tile_gaussian_counts": d["tile_gaussian_counts"].tolist()})
+    with open(os.path.join(out_example_diagnostics, "diagnostics.json"), "w+") as f:
+        json.dump({"reconstruction": summarise_reconstruction(reconstruction),
+                   "max_overdraw": max_overdraw,
+                   "views": views}, f)
+
 @torch.no_grad()
-def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folder=None, si_target_path=None
-                     ):
+def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folder=None, si_target_path=None,
+                     save_diagnostics=False, render_workers=0, compact=None, geometry=None):
     """
     Runs evaluation on the dataset passed in the dataloader. 
     Computes, prints and saves PSNR, SSIM, LPIPS.
     Args:
         save_vis: how many examples will have visualisations saved
+        save_diagnostics: also save render diagnostics (overdraw heatmaps,
+            per-tile Gaussian counts, opacity/scaling statistics) for them
+        render_workers: on CPU, render the views of every example with this
+            many worker processes (0 renders them in the main process)
+        compact: keyword arguments of compact_reconstruction (target_count,
+            min_psnr) to also score pruned and merged reconstructions, None
+            to skip. Scores then include the novel view PSNR of the compact
+            renders, its drop from the PSNR of the unpruned renders and the Gaussian
+            counts.
+        geometry: keyword arguments of evaluate_geometry (num_points,
+            threshold) to also score the geometry against the point clouds
+            of datasets that provide them (CO3D), None to skip. Scores then
+            include the Chamfer distance and the F-score.
     """
     print("check  to repository")
     if save_vis > 0:
@@ -49,7 +88,7 @@ def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folde
         f.write("")
 
     bg_color = [1, 1, 1] if model_cfg.data.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    background = torch.tensor(bg_color, dtype=torch.float32, device=device)
 
     # instantiate metricator
     metricator = Metricator(device)
@@ -62,6 +101,15 @@ def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folde
     ssim_all_examples_cond = []
     lpips_all_examples_cond = []
 
+    culled_fraction_all_examples = []
+    psnr_all_examples_compact = []
+    psnr_to_unpruned_all_examples = []
+    num_gaussians_all_examples_compact = []
+    geometry_all_examples = []
+
+    # one pool of rendering workers for all the examples
+    render_pool = RenderPool(render_workers) if render_workers > 0 and device.type == "cpu" else None
+
     for d_idx, data in enumerate(tqdm.tqdm(dataloader)):
         psnr_all_renders_novel = []
         ssim_all_renders_novel = []
@@ -103,6 +151,7 @@ def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folde
             out_example = os.path.join(out_folder, "{}_".format(d_idx) + example_id)
             os.makedirs(out_example_gt, exist_ok=True)
             os.makedirs(out_example, exist_ok=True)
+        export_diagnostics = save_diagnostics and d_idx < save_vis
 
         # batch has length 1, the first image is conditioning
         reconstruction = model(input_images,
@@ -119,18 +168,65 @@ def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folde
         # to here
 
 
+        # render all the views of the example at once
+        if "focals_pixels" in data.keys():
+            focals_pixels_render = data["focals_pixels"][:1]
+        else:
+            focals_pixels_render = None
+        if render_pool is not None and not export_diagnostics:
+            rendered = render_loop_parallel({k: v[0] for k, v in reconstruction.items()},
+                                            data["world_view_transforms"][0],
+                                            data["full_proj_transforms"][0],
+                                            data["camera_centers"][0],
+                                            background,
+                                            model_cfg,
+                                            focals_pixels=None if focals_pixels_render is None else focals_pixels_render[0],
+                                            pool=render_pool)
+        else:
+            rendered = render_batch({k: v[:1] for k, v in reconstruction.items()},
+                                    data["world_view_transforms"][:1],
+                                    data["full_proj_transforms"][:1],
+                                    data["camera_centers"][:1],
+                                    background,
+                                    model_cfg,
+                                    focals_pixels=focals_pixels_render,
+                                    return_diagnostics=export_diagnostics)
+        images = rendered["render"]
+        if export_diagnostics:
+            save_render_diagnostics(rendered["diagnostics"],
+                                    {k: v[0] for k, v in reconstruction.items()},
+                                    os.path.join(out_folder, "{}_".format(d_idx) + example_id + "_diagnostics"))
+        culled_fraction_all_examples.append(rendered["culled_fraction"])
+
+        if compact is not None:
+            # pruned and scored with the cameras of the renders below
+            reconstruction_compact, compact_report = compact_reconstruction(
+                {k: v[0] for k, v in reconstruction.items()}, model_cfg,
+                cameras=(data["world_view_transforms"][0], data["full_proj_transforms"][0],
+                         data["camera_centers"][0],
+                         None if focals_pixels_render is None else focals_pixels_render[0]),
+                bg_color=background, **compact)
+            images_compact = render_batch({k: v.unsqueeze(0) for k, v in reconstruction_compact.items()},
+                                          data["world_view_transforms"][:1],
+                                          data["full_proj_transforms"][:1],
+                                          data["camera_centers"][:1],
+                                          background,
+                                          model_cfg,
+                                          focals_pixels=focals_pixels_render)["render"]
+            psnr_all_renders_compact = [
+                -10 * torch.log10(torch.mean((images_compact[r_idx] - data["gt_images"][0, r_idx]) ** 2)).item()
+                for r_idx in range(model_cfg.data.input_images, data["gt_images"].shape[1])
+                if not torch.all(data["gt_images"][0, r_idx, ...] == 0)]
+            psnr_all_examples_compact.append(sum(psnr_all_renders_compact) / len(psnr_all_renders_compact))
+            psnr_to_unpruned_all_examples.append(compact_report["psnr_to_unpruned"])
+            num_gaussians_all_examples_compact.append(compact_report["num_compact"])
+
+        if geometry is not None and "point_cloud" in data.keys():
+            geometry_all_examples.append(evaluate_geometry({k: v[0] for k, v in reconstruction.items()},
+                                                           data["point_cloud"][0], **geometry))
+
         for r_idx in range(data["gt_images"].shape[1]):
-            if "focals_pixels" in data.keys():
-                focals_pixels_render = data["focals_pixels"][0, r_idx]
-            else:
-                focals_pixels_render = None
-            image = render_predicted({k: v[0].contiguous() for k, v in reconstruction.items()},
-                                     data["world_view_transforms"][0, r_idx],
-                                     data["full_proj_transforms"][0, r_idx],
-                                     data["camera_centers"][0, r_idx],
-                                     background,
-                                     model_cfg,
-                                     focals_pixels=focals_pixels_render)["render"]
+            image = images[r_idx]
 
             if d_idx < save_vis:
                 # uncomment to visulize
@@ -164,12 +260,25 @@ def evaluate_dataset(model, dataloader, device, model_cfg, save_vis=0, out_folde
                     " " + str(ssim_all_examples_novel[-1]) + \
                     " " + str(lpips_all_examples_novel[-1]) + "\n")
 
+    if render_pool is not None:
+        render_pool.close()
+
     scores = {"PSNR_cond": sum(psnr_all_examples_cond) / len(psnr_all_examples_cond),
               "SSIM_cond": sum(ssim_all_examples_cond) / len(ssim_all_examples_cond),
               "LPIPS_cond": sum(lpips_all_renders_cond) / len(lpips_all_renders_cond),
               "PSNR_novel": sum(psnr_all_examples_novel) / len(psnr_all_examples_novel),
               "SSIM_novel": sum(ssim_all_examples_novel) / len(ssim_all_examples_novel),
               "LPIPS_novel": sum(lpips_all_renders_novel) / len(lpips_all_renders_novel)}
+    if get_culling_settings(model_cfg) is not None:
+        scores["culled_fraction"] = sum(culled_fraction_all_examples) / len(culled_fraction_all_examples)
+    if compact is not None:
+        scores["PSNR_novel_compact"] = sum(psnr_all_examples_compact) / len(psnr_all_examples_compact)
+        scores["PSNR_drop_compact"] = scores["PSNR_novel"] - scores["PSNR_novel_compact"]
+        scores["PSNR_to_unpruned_compact"] = sum(psnr_to_unpruned_all_examples) / len(psnr_to_unpruned_all_examples)
+        scores["num_gaussians_compact"] = sum(num_gaussians_all_examples_compact) / len(num_gaussians_all_examples_compact)
+    if len(geometry_all_examples) > 0:
+        for k in ["chamfer", "fscore"]:
+            scores[k] = sum(g[k] for g in geometry_all_examples) / len(geometry_all_examples)
 
     return scores
 
@@ -181,7 +290,7 @@ def eval_robustness(model, dataloader, device, model_cfg, out_folder=None):
     os.makedirs(out_folder, exist_ok=True)
 
     bg_color = [1, 1, 1] if model_cfg.data.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    background = torch.tensor(bg_color, dtype=torch.float32, device=device)
 
     obj_idx = 98
 
@@ -242,28 +351,34 @@ def eval_robustness(model, dataloader, device, model_cfg, out_folder=None):
                                 rot_transform_quats,
                                 focals_pixels_pred)
 
+        # covariances and colours are shared by all the rendered views
+        prepared = prepare_gaussians({k: v[0].contiguous() for k, v in reconstruction.items()}, model_cfg)
+        if "focals_pixels" in data.keys():
+            intrinsics = get_camera_intrinsics(model_cfg, data["focals_pixels"][0])
+        else:
+            intrinsics = [get_camera_intrinsics(model_cfg)] * data["gt_images"].shape[1]
         for r_idx in range( data["gt_images"].shape[1]):
-            if "focals_pixels" in data.keys():
-                focals_pixels_render = data["focals_pixels"][0, r_idx]
-            else:
-                focals_pixels_render = None
-            image = render_predicted({k: v[0].contiguous() for k, v in reconstruction.items()},
+            image = render_predicted(prepared,
                                         data["world_view_transforms"][0, r_idx],
                                         data["full_proj_transforms"][0, r_idx], 
                                         data["camera_centers"][0, r_idx],
                                         background,
                                         model_cfg,
-                                        focals_pixels=focals_pixels_render)["render"]
+                                        intrinsics=intrinsics[r_idx])["render"]
 
             torchvision.utils.save_image(image, os.path.join(out_example, '{0:05d}'.format(r_idx) + ".png"))
             torchvision.utils.save_image(data["gt_images"][0, r_idx, ...], os.path.join(out_example_gt, '{0:05d}'.format(r_idx) + ".png"))
 
 @torch.no_grad()
-def main(dataset_name, experiment_path, device_idx, split='test', save_vis=0, out_folder=None, si_target_path = None):
+def main(dataset_name, experiment_path, device_idx, split='test', save_vis=0, out_folder=None, si_target_path = None,
+         save_diagnostics=False, render_workers=0, compact=None, geometry=None):
     
     # set device and random seed
-    device = torch.device("cuda:{}".format(device_idx))
-    torch.cuda.set_device(device)
+    if torch.cuda.is_available():
+        device = torch.device("cuda:{}".format(device_idx))
+        torch.cuda.set_device(device)
+    else:
+        device = torch.device("cpu")
 
     if args.experiment_path is None:
         cfg_path = hf_hub_download(repo_id="szymanowiczs/splatter-image-v1", 
@@ -306,7 +421,9 @@ def main(dataset_name, experiment_path, device_idx, split='test', save_vis=0, ou
     dataloader = DataLoader(dataset, batch_size=1, shuffle=False,
                             persistent_workers=True, pin_memory=True, num_workers=1)
     
-    scores = evaluate_dataset(model, dataloader, device, training_cfg, save_vis=save_vis, out_folder=out_folder, si_target_path=si_target_path)
+    scores = evaluate_dataset(model, dataloader, device, training_cfg, save_vis=save_vis, out_folder=out_folder, si_target_path=si_target_path,
+                              save_diagnostics=save_diagnostics, render_workers=render_workers, compact=compact,
+                              geometry=geometry)
     if split != 'vis':
         print(scores)
     return scores
@@ -324,6 +441,20 @@ def parse_arguments():
                         You can also use this to evaluate on the training or validation splits.')
     parser.add_argument('--out_folder', type=str, default='out', help='Output folder to save renders (default: out)')
     parser.add_argument('--save_vis', type=int, default=0, help='Number of examples for which to save renders (default: 0)')
+    parser.add_argument('--save_diagnostics', action='store_true',
+                        help='Also save render diagnostics (overdraw, per-tile load) for the --save_vis examples')
+    parser.add_argument('--render_workers', type=int, default=0,
+                        help='Number of processes rendering the views of every example on CPU hosts, e.g. the vis loops (default: 0)')
+    parser.add_argument('--compact_target_count', type=int, default=None,
+                        help='Also score reconstructions pruned and merged down to this many Gaussians')
+    parser.add_argument('--compact_min_psnr', type=float, default=None,
+                        help='Also score reconstructions pruned and merged while their renders keep this PSNR \
+                        w.r.t. the unpruned renders')
+    parser.add_argument('--geometry_points', type=int, default=None,
+                        help='Also score the geometry against the dataset point clouds (CO3D) with this many \
+                        points sampled from the Gaussians')
+    parser.add_argument('--fscore_threshold', type=float, default=0.05,
+                        help='Distance threshold of the geometry F-score, in scene units (default: 0.05)')
     return parser.parse_args()
 
 if __name__ == "__main__":
@@ -346,7 +477,17 @@ if __name__ == "__main__":
     if save_vis == 0:
         print("Not saving any renders (only computing scores). To save renders use flag --save_vis")
 
-    scores = main(dataset_name, experiment_path, 0, split=split, save_vis=save_vis, out_folder=out_folder, si_target_path = si_target_path)
+    compact = None
+    if args.compact_target_count is not None or args.compact_min_psnr is not None:
+        compact = {"target_count": args.compact_target_count, "min_psnr": args.compact_min_psnr}
+
+    geometry = None
+    if args.geometry_points is not None:
+        geometry = {"num_points": args.geometry_points, "threshold": args.fscore_threshold}
+
+    scores = main(dataset_name, experiment_path, 0, split=split, save_vis=save_vis, out_folder=out_folder, si_target_path = si_target_path,
+                  save_diagnostics=args.save_diagnostics, render_workers=args.render_workers,
+                  compact=compact, geometry=geometry)
     # save scores to json in the experiment folder if appropriate split was used
     if split != "vis":
         if experiment_path is not None:
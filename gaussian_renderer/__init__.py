@@ -1,11 +1,123 @@
 import math
 import torch
 import numpy as np
-import matplotlib.pyplot as plt
-from IPython.display import display
-from PIL import Image
-from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
-from utils.graphics_utils import focal2fov
+from omegaconf import OmegaConf
+from utils.general_utils import build_scaling_rotation, strip_symmetric
+from utils.graphics_utils import CameraIntrinsics, focal2fov, getCropMatrix
+from utils.sh_utils import SH2RGB
+from utils.splatter_image import SplatterImage
+from .torch_rasterizer import (DepthOrderCache, RasterizationSettings, TorchGaussianRasterizer,
+                               expected_depth, preprocess_gaussians)
+from .cpu_rasterizer import CPUTileRasterizer
+from .culling import build_culling_index, cull_gaussians, get_culling_settings
+from .diagnostics import compute_render_diagnostics
+
+# Available rasterization backends: name -> (settings class, rasterizer class)
+BACKENDS = {
+    "torch": (RasterizationSettings, TorchGaussianRasterizer),
+    "cpu_fast": (RasterizationSettings, CPUTileRasterizer),
+}
+
+try:
+    from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+    BACKENDS["cuda"] = (GaussianRasterizationSettings, GaussianRasterizer)
+except ImportError:
+    # CPU-only hosts: fall back to the pure PyTorch rasterizer
+    pass
+
+def get_backend(cfg, backend=None):
+    """
+    Resolves the rasterization backend. An explicit argument takes precedence
+    over cfg.render.backend, otherwise the CUDA rasterizer is used if installed.
+    """
+    if backend is None:
+        backend = OmegaConf.select(cfg, "render.backend", default=None)
+    if backend is None:
+        backend = "cuda" if "cuda" in BACKENDS else "torch"
+    if backend not in BACKENDS:
+        raise ValueError("Unknown or unavailable rendering backend '{}', available: {}".format(
+            backend, list(BACKENDS.keys())))
+    return backend
+
+# One rasterizer per backend, its settings are swapped for every view
+_rasterizers = {}
+
+def get_rasterizer(backend, intrinsics, scale_modifier, sh_degree, bg, viewmatrix, projmatrix, campos,
+                   supersampling=1):
+    """
+    Returns the rasterizer of the backend set up for the given view. The
+    view-independent settings are built once per CameraIntrinsics and kept in
+    its raster_settings, every view only swaps in its background, matrices
+    and camera centre. Not safe to share between threads.
+    """
+    image_height = int(intrinsics.image_height * supersampling)
+    image_width = int(intrinsics.image_width * supersampling)
+    key = (backend, image_height, image_width, scale_modifier, sh_degree)
+    templates = intrinsics.raster_settings
+    template = None if templates is None else templates.get(key)
+    if template is None:
+        settings_cls, rasterizer_cls = BACKENDS[backend]
+        template = settings_cls(
+            image_height=image_height,
+            image_width=image_width,
+            tanfovx=intrinsics.tanfovx,
+            tanfovy=intrinsics.tanfovy,
+            bg=bg,
+            scale_modifier=scale_modifier,
+            viewmatrix=viewmatrix,
+            projmatrix=projmatrix,
+            sh_degree=sh_degree,
+            campos=campos,
+            prefiltered=False,
+            debug=False
+        )
+        if templates is not None:
+            templates[key] = template
+        if backend not in _rasterizers:
+            _rasterizers[backend] = rasterizer_cls(raster_settings=template)
+    rasterizer = _rasterizers[backend]
+    rasterizer.raster_settings = template._replace(bg=bg, viewmatrix=viewmatrix,
+                                                   projmatrix=projmatrix, campos=campos)
+    return rasterizer
+
+def get_camera_intrinsics(cfg, focals_pixels=None, image_height=None, image_width=None):
+    """
+    Camera intrinsics for rendering at the given size (training resolution
+    by default). Without focals_pixels the field of view of cfg.data.fov is
+    used. focals_pixels [..., 2] are in pixels of the training resolution and
+    are copied to the host at once: one CameraIntrinsics is returned per
+    camera, flattened over the leading dimensions. The rasterization
+    settings built for them are kept with them, so they are worth reusing
+    across the views and the iterations of an item.
+    """
+    if image_height is None:
+        image_height = int(cfg.data.training_resolution)
+    if image_width is None:
+        image_width = int(cfg.data.training_resolution)
+    if focals_pixels is None:
+        tanfov = math.tan(cfg.data.fov * np.pi / 360)
+        return CameraIntrinsics(tanfovx=tanfov, tanfovy=tanfov,
+                                image_height=image_height, image_width=image_width, raster_settings={})
+    focals = focals_pixels.reshape(-1, 2).tolist()
+    intrinsics = [CameraIntrinsics(tanfovx=math.tan(0.5 * focal2fov(fx, cfg.data.training_resolution)),
+                                   tanfovy=math.tan(0.5 * focal2fov(fy, cfg.data.training_resolution)),
+                                   image_height=image_height, image_width=image_width, raster_settings={})
+                  for fx, fy in focals]
+    return intrinsics if focals_pixels.dim() > 1 else intrinsics[0]
+
+def get_render_window(roi, image_width, image_height):
+    """
+    Window rasterized for a region of interest. The rasterizer clamps the
+    EWA Jacobian at 1.3 times the half field of view around the optical
+    axis, so windows far off-centre are grown towards the centre until the
+    clamp covers them, and the region is cropped from the result.
+    """
+    x0, y0, x1, y1 = roi
+    if 1.3 * (x1 - x0) < max(image_width - 2 * x0, 2 * x1 - image_width):
+        x0, x1 = min(x0, image_width - x1), max(x1, image_width - x0)
+    if 1.3 * (y1 - y0) < max(image_height - 2 * y0, 2 * y1 - image_height):
+        y0, y1 = min(y0, image_height - y1), max(y1, image_height - y0)
+    return x0, y0, x1, y1
 
 def render_predicted(pc: dict, 
                      world_view_transform,
@@ -15,95 +127,378 @@ def render_predicted(pc: dict,
                      cfg, 
                      scaling_modifier=1.0, 
                      override_color=None,
-                     focals_pixels=None):
+                     focals_pixels=None,
+                     backend=None,
+                     render_depth=False,
+                     render_alpha=False,
+                     image_height=None,
+                     image_width=None,
+                     supersampling=1,
+                     roi=None,
+                     intrinsics=None,
+                     depth_order_cache=None,
+                     return_diagnostics=False,
+                     spatial_index=None):
     """
     Render the scene as specified by pc dictionary. 
-    Returns both the rendered image and the depth map.
+    Returns the rendered image and, if requested, the expected depth and the
+    accumulated alpha [1, H, W].
+    Args:
+        pc: reconstruction (xyz, opacity, scaling, rotation, features_dc and
+            optionally features_rest) or its prepare_gaussians form. Precomputed
+            covariances already include the scaling modifier.
+        backend: "cuda" (diff_gaussian_rasterization), "torch" (differentiable
+            pure PyTorch reference) or "cpu_fast" (multithreaded, inference only).
+            Defaults to cfg.render.backend, then "cuda".
+        render_depth, render_alpha: also return the expected view-space depth
+            (0 where nothing is rendered) and the accumulated alpha. The CUDA
+            backend needs a second rasterization pass for them.
+        image_height, image_width: output size, defaults to the training
+            resolution. The field of view is kept, focals_pixels are always
+            given in pixels of the training resolution.
+        supersampling: renders at supersampling times the output size and
+            averages down. Radii are reported at the supersampled size.
+        roi: pixel window (x0, y0, x1, y1) of the output image. Only the
+            window is rasterized, through the matching off-centre frustum,
+            and the result has its size. Windows aligned to the 16 pixel
+            tiles give the same pixels as the full render.
+        intrinsics: CameraIntrinsics from get_camera_intrinsics, replaces
+            focals_pixels, image_height and image_width and avoids copying
+            the focals to the host for every view.
+        depth_order_cache: DepthOrderCache shared by consecutive views of a
+            camera sequence, repairs the previous depth order instead of
+            sorting from scratch. Ignored by the CUDA backend.
+        return_diagnostics: adds per-tile Gaussian counts, the overdraw
+            heatmap and summary statistics (see diagnostics.py), computed in
+            an extra pass.
+        spatial_index: index of pc from build_culling_index, frustum culling
+            then only tests the Gaussians in the cells that overlap the view.
+    When cfg.render.culling.enabled is set, only the Gaussians listed in
+    visible_indices are rasterized and culled_fraction reports the share
+    that was dropped.
     """
+    backend = get_backend(cfg, backend)
 
     # Create zero tensor for 2D (screen-space) means
     screenspace_points = torch.zeros_like(pc["xyz"], dtype=pc["xyz"].dtype, requires_grad=True, device=pc["xyz"].device)
 
-    if focals_pixels is None:
-        tanfovx = math.tan(cfg.data.fov * np.pi / 360)
-        tanfovy = math.tan(cfg.data.fov * np.pi / 360)
-    else:
-        tanfovx = math.tan(0.5 * focal2fov(focals_pixels[0].item(), cfg.data.training_resolution))
-        tanfovy = math.tan(0.5 * focal2fov(focals_pixels[1].item(), cfg.data.training_resolution))
+    if intrinsics is None:
+        intrinsics = get_camera_intrinsics(cfg, focals_pixels, image_height, image_width)
+    tanfovx, tanfovy = intrinsics.tanfovx, intrinsics.tanfovy
+    image_height, image_width = intrinsics.image_height, intrinsics.image_width
+
+    if roi is not None:
+        roi = tuple(int(v) for v in roi)
+        window = get_render_window(roi, image_width, image_height)
+        crop = getCropMatrix(*window, image_width, image_height).transpose(0, 1).to(full_proj_transform)
+        full_proj_transform = full_proj_transform @ crop
+        # same focal length in pixels
+        tanfovx = tanfovx * (window[2] - window[0]) / image_width
+        tanfovy = tanfovy * (window[3] - window[1]) / image_height
+        image_width, image_height = window[2] - window[0], window[3] - window[1]
+        # windows change from view to view, their settings are not kept
+        intrinsics = CameraIntrinsics(tanfovx=tanfovx, tanfovy=tanfovy,
+                                      image_height=image_height, image_width=image_width)
 
     # Set up rasterization configuration
-    raster_settings = GaussianRasterizationSettings(
-        image_height=int(cfg.data.training_resolution),
-        image_width=int(cfg.data.training_resolution),
-        tanfovx=tanfovx,
-        tanfovy=tanfovy,
-        bg=bg_color,
-        scale_modifier=scaling_modifier,
-        viewmatrix=world_view_transform,
-        projmatrix=full_proj_transform,
-        sh_degree=cfg.model.max_sh_degree,
-        campos=camera_center,
-        prefiltered=False,
-        debug=False
-    )
+    rasterizer = get_rasterizer(backend,
+                                intrinsics,
+                                scale_modifier=scaling_modifier,
+                                sh_degree=cfg.model.max_sh_degree,
+                                bg=bg_color,
+                                viewmatrix=world_view_transform,
+                                projmatrix=full_proj_transform,
+                                campos=camera_center,
+                                supersampling=supersampling)
+    raster_settings = rasterizer.raster_settings
 
-    rasterizer = GaussianRasterizer(raster_settings=raster_settings)
+    # Optionally drop the Gaussians that cannot contribute to this view.
+    # Indexing keeps the autograd graph, gradients scatter back to the full set.
+    num_gaussians = pc["xyz"].shape[0]
+    visible_indices = None
+    culling_settings = get_culling_settings(cfg)
+    if culling_settings is not None:
+        visible_indices = cull_gaussians(pc, world_view_transform, full_proj_transform,
+                                         tanfovx, tanfovy,
+                                         raster_settings.image_height, raster_settings.image_width,
+                                         culling_settings, scaling_modifier=scaling_modifier,
+                                         spatial_index=spatial_index)
+        pc = {k: v[visible_indices] for k, v in pc.items()}
+        if override_color is not None:
+            override_color = override_color[visible_indices]
 
     means3D = pc["xyz"]  # The 3D positions of the Gaussians
-    means2D = screenspace_points
+    means2D = screenspace_points if visible_indices is None else screenspace_points[visible_indices]
     opacity = pc["opacity"]
 
     # If precomputed 3D covariance is provided, use it.
-    scales = pc["scaling"]
-    rotations = pc["rotation"]
+    scales = None
+    rotations = None
+    cov3D_precomp = None
+    if "cov3D_precomp" in pc.keys():
+        cov3D_precomp = pc["cov3D_precomp"]
+    else:
+        scales = pc["scaling"]
+        rotations = pc["rotation"]
 
     # Handling SHs or Precomputed Colors
     shs = None
     colors_precomp = None
-    if override_color is None:
-        if "features_rest" in pc.keys():
-            shs = torch.cat([pc["features_dc"], pc["features_rest"]], dim=1).contiguous()
-        else:
-            shs = pc["features_dc"]
-    else:
+    if override_color is not None:
         colors_precomp = override_color
+    elif "colors_precomp" in pc.keys():
+        colors_precomp = pc["colors_precomp"]
+    elif "shs" in pc.keys():
+        shs = pc["shs"]
+    elif "features_rest" in pc.keys():
+        shs = torch.cat([pc["features_dc"], pc["features_rest"]], dim=1).contiguous()
+    else:
+        shs = pc["features_dc"]
 
     # Ensure either SHs or colors_precomp is provided
     if shs is None and colors_precomp is None:
         raise Exception('Please provide either SHs or precomputed colors!')
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
-    rendered_image, radii = rasterizer(
+    rasterizer_kwargs = {}
+    if (render_depth or render_alpha) and backend != "cuda":
+        # depth and alpha are composited in the same pass as the colours
+        rasterizer_kwargs["return_depth_alpha"] = True
+    if depth_order_cache is not None and backend != "cuda":
+        rasterizer_kwargs["depth_order_cache"] = depth_order_cache
+    outputs = rasterizer(
         means3D=means3D,
         means2D=means2D,
         shs=shs,  # Pass SHs if available
         colors_precomp=colors_precomp,  # Or pass precomputed colors
         opacities=opacity,
         scales=scales,
-        rotations=rotations
+        rotations=rotations,
+        cov3D_precomp=cov3D_precomp,
+        **rasterizer_kwargs
     )
+    rendered_image, radii = outputs[:2]
 
-    # Depth map generation
-    # Extract the Z-coordinates (depth values)
-    depth_values = means3D[:, 2]
+    if "return_depth_alpha" in rasterizer_kwargs:
+        depth, alpha = outputs[2:]
+    elif render_depth or render_alpha:
+        # the CUDA kernels only composite 3 channels: second pass with
+        # (view-space z, 1, 0) as colours on a black background
+        z = (torch.cat([means3D, torch.ones_like(means3D[:, :1])], dim=1) @ world_view_transform)[:, 2:3]
+        rasterizer.raster_settings = raster_settings._replace(bg=torch.zeros_like(bg_color))
+        depth_alpha, _ = rasterizer(means3D=means3D, means2D=means2D, shs=None,
+                                    colors_precomp=torch.cat([z, torch.ones_like(z), torch.zeros_like(z)], dim=1),
+                                    opacities=opacity, scales=scales, rotations=rotations,
+                                    cov3D_precomp=cov3D_precomp)
+        alpha = depth_alpha[1:2]
+        depth = expected_depth(depth_alpha[:1], alpha)
 
-    # Normalize the depth values
-    depth_min = torch.min(depth_values)
-    depth_max = torch.max(depth_values)
-    normalized_depth = (depth_values - depth_min) / (depth_max - depth_min)
+    if supersampling > 1:
+        rendered_image = torch.nn.functional.avg_pool2d(rendered_image.unsqueeze(0), supersampling)[0]
+        if render_depth or render_alpha:
+            # average the alpha-weighted depth so that empty pixels do not pull it to 0
+            depth_alpha = torch.nn.functional.avg_pool2d(torch.cat([depth * alpha, alpha]).unsqueeze(0),
+                                                         supersampling)[0]
+            alpha = depth_alpha[1:2]
+            depth = expected_depth(depth_alpha[:1], alpha)
 
-    # Reshape the depth values accordingly (depth should be a 2D map, not 3D)
-    image_height, image_width = rendered_image.shape[-2], rendered_image.shape[-1]
-    depth_map = normalized_depth.view(image_height, image_width)
+    if roi is not None and tuple(window) != tuple(roi):
+        x0, y0 = roi[0] - window[0], roi[1] - window[1]
+        x1, y1 = x0 + roi[2] - roi[0], y0 + roi[3] - roi[1]
+        rendered_image = rendered_image[:, y0:y1, x0:x1]
+        if render_depth or render_alpha:
+            depth, alpha = depth[:, y0:y1, x0:x1], alpha[:, y0:y1, x0:x1]
 
-    # Save and display depth map as an image
-    # plt.imsave('/content/depth_map.png', depth_map.cpu().numpy(), cmap='gray')
-    # display(Image.open('/content/depth_map.png'))
+    if visible_indices is not None:
+        # radii of culled Gaussians are 0, as for the ones culled by the rasterizer
+        radii = torch.zeros(num_gaussians, dtype=radii.dtype, device=radii.device).index_copy_(
+            0, visible_indices, radii)
+        culled_fraction = 1.0 - visible_indices.shape[0] / max(num_gaussians, 1)
+    else:
+        culled_fraction = 0.0
 
-    return {
+    out = {
         "render": rendered_image,
-        "depth_map": depth_map,
         "viewspace_points": screenspace_points,
         "visibility_filter": radii > 0,
-        "radii": radii
+        "radii": radii,
+        "visible_indices": visible_indices,
+        "culled_fraction": culled_fraction
+    }
+    if render_depth:
+        out["depth"] = depth
+    if render_alpha:
+        out["alpha"] = alpha
+    if return_diagnostics:
+        projected = preprocess_gaussians(means3D, torch.zeros_like(means3D), opacity, raster_settings,
+                                         shs=shs, colors_precomp=colors_precomp, scales=scales,
+                                         rotations=rotations, cov3D_precomp=cov3D_precomp)
+        out["diagnostics"] = compute_render_diagnostics(projected, raster_settings.image_height,
+                                                        raster_settings.image_width, num_gaussians)
+    return out
+
+
+def prepare_gaussians(pc: dict, cfg, scaling_modifier=1.0):
+    """
+    View-independent preprocessing of one reconstruction, shared by all the
+    views it is rendered from: the 3D covariances and either the SH
+    coefficients or, when colours do not depend on the view (SH degree 0),
+    the colours themselves. The result can be passed to render_predicted in
+    place of pc; already prepared reconstructions are returned unchanged.
+    """
+    if "cov3D_precomp" in pc.keys():
+        return pc
+    L = build_scaling_rotation(scaling_modifier * pc["scaling"], pc["rotation"])
+    prepared = {"xyz": pc["xyz"],
+                "opacity": pc["opacity"],
+                "cov3D_precomp": strip_symmetric(L @ L.transpose(1, 2))}
+    if "features_rest" in pc.keys() and cfg.model.max_sh_degree > 0:
+        prepared["shs"] = torch.cat([pc["features_dc"], pc["features_rest"]], dim=1).contiguous()
+    else:
+        prepared["colors_precomp"] = torch.clamp_min(SH2RGB(pc["features_dc"][:, 0]), 0.0)
+    return prepared
+
+def render_batch(pc: dict,
+                 world_view_transforms,
+                 full_proj_transforms,
+                 camera_centers,
+                 bg_color: torch.Tensor,
+                 cfg,
+                 scaling_modifier=1.0,
+                 focals_pixels=None,
+                 backend=None,
+                 render_depth=False,
+                 render_alpha=False,
+                 image_height=None,
+                 image_width=None,
+                 supersampling=1,
+                 rois=None,
+                 reuse_depth_order=False,
+                 return_diagnostics=False,
+                 lod_pyramids=None,
+                 lod_bias=1.0,
+                 use_spatial_index=False):
+    """
+    Renders B reconstructions from V cameras each.
+    Args:
+        pc: dictionary of reconstructions with a leading batch dimension B,
+            or a SplatterImage [B, N, C] (rendered without copying the
+            attributes of every object)
+        world_view_transforms, full_proj_transforms: [B, V, 4, 4]
+        camera_centers: [B, V, 3]
+        focals_pixels: [B, V, 2] or None
+        rois: [B*V, 4] pixel windows (x0, y0, x1, y1) or None. Only the
+            windows are rendered, the rest of every image is background.
+        reuse_depth_order: the V views of every object are a camera sequence
+            (e.g. a turntable), the depth order of a view is repaired from the
+            previous one instead of sorting from scratch.
+        return_diagnostics: adds the list of the render diagnostics of every view.
+        lod_pyramids: list of the B LODPyramids of the reconstructions, every
+            view then renders the level selected from the projected size of
+            the object (see LODPyramid.select_level with lod_bias). The radii
+            of views rendered from a coarser level are left at 0.
+        use_spatial_index: with culling enabled, index every reconstruction
+            once (build_culling_index) for the frustum culling of its views.
+    Returns a dictionary with the renders [B*V, 3, H, W], the radii and
+    visibility filters [B*V, N] of every view, ordered object by object, and
+    the average culled fraction. Depth and alpha [B*V, 1, H, W] are added
+    when requested, and the level of every view with lod_pyramids.
+    """
+    B, V = world_view_transforms.shape[:2]
+    N = pc["xyz"].shape[1]
+    H = int(cfg.data.training_resolution) if image_height is None else image_height
+    W = int(cfg.data.training_resolution) if image_width is None else image_width
+    # single device-to-host copy of the focals for the whole batch
+    intrinsics = get_camera_intrinsics(cfg, focals_pixels, H, W)
+    if rois is not None:
+        rois = rois.tolist() if torch.is_tensor(rois) else rois
+
+    renders = bg_color.new_empty((B * V, 3, H, W))
+    radii = torch.empty((B * V, N), dtype=torch.int32, device=pc["xyz"].device)
+    culled_fraction = 0.0
+    depths = bg_color.new_empty((B * V, 1, H, W)) if render_depth else None
+    alphas = bg_color.new_empty((B * V, 1, H, W)) if render_alpha else None
+    diagnostics = []
+    lod_levels = []
+    if lod_pyramids is not None:
+        # single device-to-host copy of the depths of every object in every view
+        centers = torch.stack([pyramid.center for pyramid in lod_pyramids])
+        lod_depths = (torch.einsum("bi,bvi->bv", centers, world_view_transforms[..., :3, 2])
+                      + world_view_transforms[..., 3, 2]).tolist()
+
+    for b_idx in range(B):
+        if isinstance(pc, SplatterImage):
+            pc_b = pc.batch_item(b_idx)
+        else:
+            pc_b = {k: v[b_idx].contiguous() for k, v in pc.items()}
+        if lod_pyramids is None:
+            prepared_levels = [prepare_gaussians(pc_b, cfg, scaling_modifier=scaling_modifier)]
+        else:
+            prepared_levels = [prepare_gaussians(level, cfg, scaling_modifier=scaling_modifier)
+                               for level in lod_pyramids[b_idx].levels]
+        depth_order_caches = [DepthOrderCache() if reuse_depth_order else None for _ in prepared_levels]
+        spatial_indices = [None] * len(prepared_levels)
+        if use_spatial_index and get_culling_settings(cfg) is not None:
+            spatial_indices = [build_culling_index(prepared) for prepared in prepared_levels]
+        for v_idx in range(V):
+            roi = None if rois is None else rois[b_idx * V + v_idx]
+            view_intrinsics = intrinsics if focals_pixels is None else intrinsics[b_idx * V + v_idx]
+            level = 0
+            if lod_pyramids is not None:
+                level = lod_pyramids[b_idx].select_level(world_view_transforms[b_idx, v_idx],
+                                                         view_intrinsics.tanfovx, view_intrinsics.tanfovy,
+                                                         H, W, lod_bias, depth=lod_depths[b_idx][v_idx])
+                lod_levels.append(level)
+            out = render_predicted(prepared_levels[level],
+                                   world_view_transforms[b_idx, v_idx],
+                                   full_proj_transforms[b_idx, v_idx],
+                                   camera_centers[b_idx, v_idx],
+                                   bg_color,
+                                   cfg,
+                                   intrinsics=view_intrinsics,
+                                   backend=backend,
+                                   render_depth=render_depth,
+                                   render_alpha=render_alpha,
+                                   supersampling=supersampling,
+                                   roi=roi,
+                                   depth_order_cache=depth_order_caches[level],
+                                   spatial_index=spatial_indices[level],
+                                   return_diagnostics=return_diagnostics)
+            if return_diagnostics:
+                diagnostics.append(out["diagnostics"])
+            if roi is None:
+                x0, y0, x1, y1 = 0, 0, W, H
+            else:
+                # paste the window into a background canvas
+                x0, y0, x1, y1 = roi
+                renders[b_idx * V + v_idx] = bg_color.reshape(-1, 1, 1)
+                if render_depth:
+                    depths[b_idx * V + v_idx] = 0.0
+                if render_alpha:
+                    alphas[b_idx * V + v_idx] = 0.0
+            renders[b_idx * V + v_idx, :, y0:y1, x0:x1] = out["render"]
+            if render_depth:
+                depths[b_idx * V + v_idx, :, y0:y1, x0:x1] = out["depth"]
+            if render_alpha:
+                alphas[b_idx * V + v_idx, :, y0:y1, x0:x1] = out["alpha"]
+            if level == 0:
+                radii[b_idx * V + v_idx] = out["radii"]
+            else:
+                radii[b_idx * V + v_idx] = 0
+            culled_fraction += out["culled_fraction"] / (B * V)
+
+    out = {
+        "render": renders,
+        "visibility_filter": radii > 0,
+        "radii": radii,
+        "culled_fraction": culled_fraction
     }
+    if render_depth:
+        out["depth"] = depths
+    if render_alpha:
+        out["alpha"] = alphas
+    if return_diagnostics:
+        out["diagnostics"] = diagnostics
+    if lod_pyramids is not None:
+        out["lod_levels"] = lod_levels
+    return out
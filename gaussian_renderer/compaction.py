@@ -0,0 +1,145 @@
+"""
+Compact reconstructions (utils.pruning_utils) with the voxel size searched to
+reach a target count or to stay within an error budget, the PSNR of the
+renders w.r.t. the unpruned renders.
+"""
+
+import torch
+
+from utils.image_utils import psnr
+from utils.pruning_utils import merge_gaussians, prune_gaussians
+
+from . import get_backend, get_camera_intrinsics, render_batch, render_predicted
+
+def compute_contributions(pc, world_view_transforms, full_proj_transforms, camera_centers, cfg,
+                          focals_pixels=None, backend=None):
+    """
+    Largest contribution of every Gaussian to a view: the sum over the pixels
+    of its blending weight alpha * T. It is the gradient of the sum of a
+    render with unit colours w.r.t. the colour of the Gaussian, so other
+    backends than cuda (e.g. cpu_fast, which does not track gradients) are
+    replaced by the differentiable torch backend.
+    Args:
+        pc: reconstruction without a batch dimension
+        world_view_transforms, full_proj_transforms: [V, 4, 4]
+        camera_centers: [V, 3]
+        focals_pixels: [V, 2] or None to use the field of view in cfg
+    Returns [N] contributions in pixels.
+    """
+    backend = get_backend(cfg, backend)
+    if backend != "cuda":
+        backend = "torch"
+    contributions = torch.zeros(pc["xyz"].shape[0], device=pc["xyz"].device)
+    pc = {k: v.detach() for k, v in pc.items()}
+    background = torch.zeros(3, dtype=torch.float32, device=pc["xyz"].device)
+    V = world_view_transforms.shape[0]
+    intrinsics = get_camera_intrinsics(cfg, focals_pixels)
+    if focals_pixels is None:
+        intrinsics = [intrinsics] * V
+    for v_idx in range(V):
+        colors = torch.ones_like(pc["xyz"], requires_grad=True)
+        with torch.enable_grad():
+            image = render_predicted(pc, world_view_transforms[v_idx], full_proj_transforms[v_idx],
+                                     camera_centers[v_idx], background, cfg, override_color=colors,
+                                     intrinsics=intrinsics[v_idx], backend=backend)["render"]
+            weights = torch.autograd.grad(image[0].sum(), colors)[0][:, 0]
+        contributions = torch.maximum(contributions, weights)
+    return contributions
+
+def get_view_cameras(cameras):
+    """
+    (world_view_transforms, full_proj_transforms, camera_centers, focals_pixels)
+    of cameras given with or without their focals.
+    """
+    return tuple(cameras) if len(cameras) == 4 else (*cameras, None)
+
+@torch.no_grad()
+def render_views(pc, cameras, bg_color, cfg, backend=None):
+    world_view_transforms, full_proj_transforms, camera_centers, focals_pixels = get_view_cameras(cameras)
+    return render_batch({k: v.unsqueeze(0) for k, v in pc.items()},
+                        world_view_transforms.unsqueeze(0), full_proj_transforms.unsqueeze(0),
+                        camera_centers.unsqueeze(0), bg_color, cfg,
+                        focals_pixels=None if focals_pixels is None else focals_pixels.unsqueeze(0),
+                        backend=backend)["render"]
+
+def mean_psnr(renders, reference):
+    """
+    Average PSNR of renders [V, 3, H, W] w.r.t. reference renders, capped at
+    100 dB for exact matches.
+    """
+    return psnr(renders.flatten(1), reference.flatten(1)).clamp_max(100.0).mean().item()
+
+def bisect_voxel_size(predicate, low, high, search_steps):
+    """
+    Boundary between voxel sizes where predicate is False (at low) and True
+    (at high).
+    """
+    for _ in range(search_steps):
+        middle = 0.5 * (low + high)
+        if predicate(middle):
+            high = middle
+        else:
+            low = middle
+    return low, high
+
+@torch.no_grad()
+def compact_reconstruction(pc, cfg, target_count=None, min_psnr=None, cameras=None, bg_color=None,
+                           opacity_threshold=1.0 / 255.0, min_contribution=0.5, colour_bins=4,
+                           search_steps=12, backend=None):
+    """
+    Prunes and merges one reconstruction (without a batch dimension).
+    Args:
+        target_count: largest number of Gaussians of the result
+        min_psnr: error budget, smallest average PSNR (dB) of the renders of
+            cameras w.r.t. the unpruned renders
+        cameras: (world_view_transforms, full_proj_transforms, camera_centers)
+            stacked over views, optionally followed by their focals_pixels
+            [V, 2] (by default the field of view in cfg), used to find the
+            occluded Gaussians, for the error budget and for the report
+        bg_color: background of the renders, black by default
+    With both a target count and a budget, merging stops at whichever is
+    reached first.
+    Returns the compact reconstruction and a report with the Gaussian counts,
+    the voxel size used and, if cameras are given, the PSNR of the compact
+    renders w.r.t. the unpruned ones.
+    """
+    if min_psnr is not None and cameras is None:
+        raise ValueError("An error budget needs cameras to render")
+    num_gaussians = pc["xyz"].shape[0]
+    contributions = None
+    if cameras is not None:
+        if bg_color is None:
+            bg_color = torch.zeros(3, dtype=torch.float32, device=pc["xyz"].device)
+        world_view_transforms, full_proj_transforms, camera_centers, focals_pixels = get_view_cameras(cameras)
+        contributions = compute_contributions(pc, world_view_transforms, full_proj_transforms, camera_centers,
+                                              cfg, focals_pixels=focals_pixels, backend=backend)
+        reference = render_views(pc, cameras, bg_color, cfg, backend=backend)
+    kept = prune_gaussians(pc, opacity_threshold, contributions, min_contribution)
+    pruned = {k: v[kept] for k, v in pc.items()}
+    extent = (pruned["xyz"].max(dim=0).values - pruned["xyz"].min(dim=0).values).max().item()
+
+    voxel_size = 0.0
+    if target_count is not None and kept.shape[0] > target_count:
+        # smallest voxel reaching the target count
+        _, voxel_size = bisect_voxel_size(
+            lambda v: merge_gaussians(pruned, v, colour_bins)["xyz"].shape[0] <= target_count,
+            0.0, extent, search_steps)
+    if min_psnr is not None:
+        # largest voxel within the budget
+        exceeds_budget = lambda v: mean_psnr(render_views(merge_gaussians(pruned, v, colour_bins), cameras,
+                                                          bg_color, cfg, backend=backend), reference) < min_psnr
+        high = voxel_size if target_count is not None else extent
+        if exceeds_budget(high):
+            voxel_size, _ = bisect_voxel_size(exceeds_budget, 0.0, high, search_steps)
+        else:
+            voxel_size = high
+    compact = merge_gaussians(pruned, voxel_size, colour_bins)
+
+    report = {"num_gaussians": num_gaussians,
+              "num_pruned": num_gaussians - kept.shape[0],
+              "num_compact": compact["xyz"].shape[0],
+              "voxel_size": voxel_size}
+    if cameras is not None:
+        report["psnr_to_unpruned"] = mean_psnr(render_views(compact, cameras, bg_color, cfg, backend=backend),
+                                               reference)
+    return compact, report
@@ -0,0 +1,175 @@
+"""
+Inference-only tile rasterizer tuned for CPU throughput.
+
+Gaussians are binned to 16x16 tiles once per frame (sorted by depth within
+each tile), every tile composites its Gaussians in chunks and stops as soon
+as all of its pixels are saturated, and tiles are distributed over a thread
+pool (PyTorch releases the GIL inside its kernels).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from torch import nn
+
+from .torch_rasterizer import BLOCK_X, BLOCK_Y, depth_order, expected_depth, preprocess_gaussians
+
+# Number of Gaussians composited at once before checking for saturation
+CHUNK_SIZE = 128
+
+_executor = None
+_num_threads = None
+
+def set_num_threads(num_threads):
+    """
+    Sets the number of worker threads used to render tiles in parallel.
+    """
+    global _executor, _num_threads
+    if _executor is not None:
+        _executor.shutdown()
+    _executor = None
+    _num_threads = num_threads
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_num_threads or os.cpu_count())
+    return _executor
+
+def bin_gaussians(projected, order, tiles_x, tiles_y):
+    """
+    Duplicates every Gaussian once per tile it overlaps and groups the copies
+    by tile, keeping the depth order inside every tile.
+    Returns the Gaussian indices grouped by tile and the start offset of every
+    tile in that list ([num_tiles + 1]).
+    """
+    rect_min = projected.rect_min[order]
+    rect_max = projected.rect_max[order]
+    extent = rect_max - rect_min
+    num_tiles_touched = extent[:, 0] * extent[:, 1]
+
+    # index of the source Gaussian and local tile offset for every duplicate
+    source = torch.repeat_interleave(torch.arange(order.shape[0], device=order.device),
+                                     num_tiles_touched)
+    first_duplicate = torch.cumsum(num_tiles_touched, dim=0) - num_tiles_touched
+    local = torch.arange(source.shape[0], device=order.device) - first_duplicate[source]
+    tile_x = rect_min[source, 0] + local % extent[source, 0]
+    tile_y = rect_min[source, 1] + local // extent[source, 0]
+    tile_ids = tile_y * tiles_x + tile_x
+
+    # duplicates are already in depth order, a stable sort by tile keeps it
+    tile_ids, perm = torch.sort(tile_ids, stable=True)
+    gaussian_ids = order[source[perm]]
+    tile_counts = torch.bincount(tile_ids, minlength=tiles_x * tiles_y)
+    tile_ranges = torch.cat([tile_counts.new_zeros(1), torch.cumsum(tile_counts, dim=0)])
+    return gaussian_ids, tile_ranges
+
+def gaussian_exponent_coefficients(xy, conic, origin):
+    """
+    Rewrites the Gaussian exponent at pixel (u, v), relative to the tile
+    origin, as a dot product of [u^2, v^2, uv, u, v, 1] with per-Gaussian
+    coefficients so that a whole chunk is evaluated with one matrix product.
+    Tile-local coordinates keep the expansion accurate in float32.
+    """
+    mx = xy[:, 0] - origin[0]
+    my = xy[:, 1] - origin[1]
+    a, b, c = conic[:, 0], conic[:, 1], conic[:, 2]
+    return torch.stack([-0.5 * a,
+                        -0.5 * c,
+                        -b,
+                        a * mx + b * my,
+                        c * my + b * mx,
+                        -0.5 * (a * mx * mx + c * my * my) - b * mx * my], dim=0)
+
+def pixel_monomials(width, height, device):
+    v, u = torch.meshgrid(torch.arange(height, device=device, dtype=torch.float32),
+                          torch.arange(width, device=device, dtype=torch.float32),
+                          indexing="ij")
+    u, v = u.reshape(-1), v.reshape(-1)
+    return torch.stack([u * u, v * v, u * v, u, v, torch.ones_like(u)], dim=1)
+
+def composite_tile_early_stop(monomials, coefficients, opacity, features, chunk_size=CHUNK_SIZE):
+    """
+    Same compositing as torch_rasterizer.composite_tile, processed in
+    depth-ordered chunks that stop once every pixel of the tile is saturated.
+    """
+    P = monomials.shape[0]
+    accum = features.new_zeros((P, features.shape[1]))
+    T = features.new_ones(P)
+    done = torch.zeros(P, dtype=torch.bool, device=features.device)
+    for start in range(0, opacity.shape[0], chunk_size):
+        end = start + chunk_size
+        power = monomials @ coefficients[:, start:end]
+        alpha = torch.clamp_max(opacity[start:end] * torch.exp(power), 0.99)
+        alpha[(power > 0.0) | (alpha < 1.0 / 255.0)] = 0.0
+
+        T_after = T.unsqueeze(1) * torch.cumprod(1.0 - alpha, dim=1)
+        T_before = torch.cat([T.unsqueeze(1), T_after[:, :-1]], dim=1)
+        contributes = (T_after >= 0.0001) & ~done.unsqueeze(1)
+        weights = alpha * T_before * contributes
+        accum += weights @ features[start:end]
+        T = T - weights.sum(dim=1)
+        done = done | (T_after[:, -1] < 0.0001)
+        if bool(done.all()):
+            break
+    return accum, T
+
+class CPUTileRasterizer(nn.Module):
+    """
+    Non-differentiable counterpart of TorchGaussianRasterizer, same interface.
+    """
+    def __init__(self, raster_settings):
+        super().__init__()
+        self.raster_settings = raster_settings
+
+    @torch.no_grad()
+    def forward(self, means3D, means2D, opacities, shs=None, colors_precomp=None,
+                scales=None, rotations=None, cov3D_precomp=None, return_depth_alpha=False,
+                depth_order_cache=None):
+        if (shs is None and colors_precomp is None) or (shs is not None and colors_precomp is not None):
+            raise Exception('Please provide excatly one of either SHs or precomputed colors!')
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or \
+                ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+
+        raster_settings = self.raster_settings
+        H = int(raster_settings.image_height)
+        W = int(raster_settings.image_width)
+        projected = preprocess_gaussians(means3D, means2D, opacities, raster_settings,
+                                         shs=shs, colors_precomp=colors_precomp,
+                                         scales=scales, rotations=rotations,
+                                         cov3D_precomp=cov3D_precomp)
+        features = projected.colors
+        if return_depth_alpha:
+            features = torch.cat([features, projected.depth.unsqueeze(1)], dim=1)
+        features = features.contiguous()
+        tiles_x = (W + BLOCK_X - 1) // BLOCK_X
+        tiles_y = (H + BLOCK_Y - 1) // BLOCK_Y
+        order = depth_order(projected) if depth_order_cache is None else depth_order_cache(projected)
+        gaussian_ids, tile_ranges = bin_gaussians(projected, order, tiles_x, tiles_y)
+        tile_ranges = tile_ranges.tolist()
+
+        accum_image = features.new_zeros((features.shape[1], H, W))
+        transmittance = features.new_ones((H, W))
+
+        def render_tile(tile_id):
+            start, end = tile_ranges[tile_id], tile_ranges[tile_id + 1]
+            if start == end:
+                return
+            x0, y0 = (tile_id % tiles_x) * BLOCK_X, (tile_id // tiles_x) * BLOCK_Y
+            x1, y1 = min(x0 + BLOCK_X, W), min(y0 + BLOCK_Y, H)
+            idx = gaussian_ids[start:end]
+            coefficients = gaussian_exponent_coefficients(projected.xy[idx], projected.conic[idx], (x0, y0))
+            accum, T = composite_tile_early_stop(pixel_monomials(x1 - x0, y1 - y0, features.device),
+                                                 coefficients, projected.opacity[idx], features[idx])
+            accum_image[:, y0:y1, x0:x1] = accum.transpose(0, 1).reshape(-1, y1 - y0, x1 - x0)
+            transmittance[y0:y1, x0:x1] = T.reshape(y1 - y0, x1 - x0)
+
+        # tiles write to disjoint parts of the image
+        list(get_executor().map(render_tile, range(tiles_x * tiles_y)))
+        image = accum_image[:3] + transmittance.unsqueeze(0) * raster_settings.bg.reshape(-1, 1, 1)
+        if not return_depth_alpha:
+            return image, projected.radii
+        alpha = 1.0 - transmittance.unsqueeze(0)
+        return image, projected.radii, expected_depth(accum_image[3:], alpha), alpha
@@ -0,0 +1,127 @@
+"""
+Culling pre-pass that removes Gaussians which cannot contribute to a view
+before they are sent to the rasterizer.
+
+With the default settings the pass is lossless: Gaussians with opacity below
+1/255 never pass the alpha threshold of the rasterizer, and the frustum test
+uses an upper bound of the screen-space radius computed by the rasterizer, so
+every Gaussian it drops would have been culled by the rasterizer as well.
+Dropping Gaussians with a sub-pixel footprint is optional and changes the
+image slightly, the rasterizer still draws them as ~1 pixel dots.
+"""
+
+import math
+from typing import NamedTuple
+
+import torch
+from omegaconf import OmegaConf
+
+from utils.spatial_index import SpatialIndex
+
+from .torch_rasterizer import BLOCK_X, BLOCK_Y, ndc2pix
+
+class CullingSettings(NamedTuple):
+    opacity_threshold: float  # Gaussians with a lower opacity are dropped
+    frustum: bool             # drop Gaussians whose footprint misses the image
+    min_footprint: float      # pixels, drop Gaussians with a smaller projected std, 0 disables
+
+def get_culling_settings(cfg):
+    """
+    Culling settings from cfg.render.culling, None if culling is disabled.
+    """
+    culling_cfg = OmegaConf.select(cfg, "render.culling", default=None)
+    if culling_cfg is None or not culling_cfg.get("enabled", False):
+        return None
+    return CullingSettings(opacity_threshold=float(culling_cfg.get("opacity_threshold", 1.0 / 255.0)),
+                           frustum=bool(culling_cfg.get("frustum", True)),
+                           min_footprint=float(culling_cfg.get("min_footprint", 0.0)))
+
+def max_standard_deviation(pc, scaling_modifier=1.0):
+    """
+    Upper bound of the largest standard deviation of every Gaussian.
+    """
+    if "cov3D_precomp" in pc.keys():
+        # the largest eigenvalue is bounded by the trace
+        cov = pc["cov3D_precomp"]
+        return torch.sqrt(torch.clamp_min(cov[:, 0] + cov[:, 3] + cov[:, 5], 0.0))
+    return scaling_modifier * pc["scaling"].max(dim=1).values
+
+def build_culling_index(pc, scaling_modifier=1.0):
+    """
+    Spatial index of the Gaussians of pc with their 3 sigma extents, built
+    once and reused by the frustum culling of every view.
+    """
+    # coarse cells: the frustum test is per cell
+    return SpatialIndex(pc["xyz"], points_per_cell=64, radii=3.0 * max_standard_deviation(pc, scaling_modifier))
+
+@torch.no_grad()
+def frustum_candidates(spatial_index, full_proj_transform, tanfovx, tanfovy, image_height, image_width):
+    """
+    Indices of the Gaussians in the cells of the index that can overlap the
+    view: a superset of the Gaussians kept by the frustum test below.
+    """
+    focal_x = image_width / (2.0 * tanfovx)
+    focal_y = image_height / (2.0 * tanfovy)
+    # the 3 sigma extents scaled to bound the screen-space radius ...
+    radius_scale = math.sqrt(focal_x ** 2 * (1 + (1.3 * tanfovx) ** 2) +
+                             focal_y ** 2 * (1 + (1.3 * tanfovy) ** 2)) / min(focal_x, focal_y)
+    # ... and a margin of pixels for the low-pass filter, rounding and the tiles
+    margin = 3.0 * math.sqrt(0.3 + math.sqrt(0.1)) + 2.0
+    return spatial_index.frustum_query(full_proj_transform, near=0.2,
+                                       scale_x=1.0 + 2.0 * (margin + BLOCK_X + 1) / image_width,
+                                       scale_y=1.0 + 2.0 * (margin + BLOCK_Y + 1) / image_height,
+                                       radius_scale=radius_scale)
+
+@torch.no_grad()
+def cull_gaussians(pc, world_view_transform, full_proj_transform, tanfovx, tanfovy,
+                   image_height, image_width, culling_settings, scaling_modifier=1.0, spatial_index=None):
+    """
+    Returns the indices of the Gaussians of pc that are kept for rendering.
+    With a spatial_index (build_culling_index), only the Gaussians in the
+    cells that overlap the view are tested.
+    """
+    if spatial_index is not None and culling_settings.frustum:
+        candidates = frustum_candidates(spatial_index, full_proj_transform, tanfovx, tanfovy,
+                                        image_height, image_width)
+        kept = cull_gaussians({k: v[candidates] for k, v in pc.items()}, world_view_transform,
+                              full_proj_transform, tanfovx, tanfovy, image_height, image_width,
+                              culling_settings, scaling_modifier)
+        return candidates[kept]
+
+    keep = pc["opacity"].reshape(-1) >= culling_settings.opacity_threshold
+
+    if culling_settings.frustum or culling_settings.min_footprint > 0:
+        xyz = pc["xyz"]
+        p_hom = torch.cat([xyz, torch.ones_like(xyz[:, :1])], dim=1)
+        depth = (p_hom @ world_view_transform)[:, 2]
+        keep = keep & (depth > 0.2)
+        depth = torch.clamp_min(depth, 0.2)
+
+        focal_x = image_width / (2.0 * tanfovx)
+        focal_y = image_height / (2.0 * tanfovy)
+        std = max_standard_deviation(pc, scaling_modifier)
+
+        if culling_settings.min_footprint > 0:
+            keep = keep & (max(focal_x, focal_y) * std / depth >= culling_settings.min_footprint)
+
+        if culling_settings.frustum:
+            # Frobenius norm of the (clamped) EWA Jacobian bounds its spectral norm
+            jacobian_norm = math.sqrt(focal_x ** 2 * (1 + (1.3 * tanfovx) ** 2) +
+                                      focal_y ** 2 * (1 + (1.3 * tanfovy) ** 2)) / depth
+            # low-pass filter and the eigenvalue clamp of the rasterizer
+            max_variance = (jacobian_norm * std) ** 2 + 0.3 + math.sqrt(0.1)
+            radii = torch.ceil(3.0 * torch.sqrt(max_variance)) + 1.0
+
+            p_proj = p_hom @ full_proj_transform
+            p_proj = p_proj[:, :2] / (p_proj[:, 3:4] + 0.0000001)
+            x = ndc2pix(p_proj[:, 0], image_width)
+            y = ndc2pix(p_proj[:, 1], image_height)
+            # same test as the tile rectangle of the rasterizer
+            tiles_x = (image_width + BLOCK_X - 1) // BLOCK_X
+            tiles_y = (image_height + BLOCK_Y - 1) // BLOCK_Y
+            keep = keep & (torch.floor((x + radii + BLOCK_X - 1) / BLOCK_X) > 0) \
+                & (torch.floor((x - radii) / BLOCK_X) < tiles_x) \
+                & (torch.floor((y + radii + BLOCK_Y - 1) / BLOCK_Y) > 0) \
+                & (torch.floor((y - radii) / BLOCK_Y) < tiles_y)
+
+    return torch.nonzero(keep).squeeze(1)
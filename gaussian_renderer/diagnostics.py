@@ -0,0 +1,73 @@
+"""
+Render cost diagnostics: how many Gaussians every tile has to go through and
+how many of them end up contributing to every pixel (overdraw).
+
+Computed with the PyTorch implementation of the rasterizer, so they are
+available for every backend, at the cost of one extra projection and
+compositing pass without colours.
+"""
+
+import torch
+
+from .torch_rasterizer import BLOCK_X, BLOCK_Y, blending_weights, depth_order, pixel_grid
+
+@torch.no_grad()
+def compute_render_diagnostics(projected, image_height, image_width, num_gaussians=None):
+    """
+    Args:
+        projected: ProjectedGaussians of the rendered view
+        num_gaussians: size of the full reconstruction if projected only
+            holds the Gaussians left after culling
+    Returns a dictionary with
+        tile_gaussian_counts: [tiles_y, tiles_x] Gaussians overlapping each tile
+        overdraw: [H, W] Gaussians contributing to each pixel
+        mean_contributing_gaussians: average of overdraw
+        visible_fraction: fraction of the Gaussians with radii > 0
+    """
+    tiles_x = (image_width + BLOCK_X - 1) // BLOCK_X
+    tiles_y = (image_height + BLOCK_Y - 1) // BLOCK_Y
+    device = projected.xy.device
+    order = depth_order(projected)
+    rect_min = projected.rect_min[order]
+    rect_max = projected.rect_max[order]
+
+    tile_gaussian_counts = torch.zeros((tiles_y, tiles_x), dtype=torch.int32, device=device)
+    overdraw = torch.zeros((image_height, image_width), dtype=torch.int32, device=device)
+    for ty in range(tiles_y):
+        in_row = (rect_min[:, 1] <= ty) & (rect_max[:, 1] > ty)
+        for tx in range(tiles_x):
+            idx = order[in_row & (rect_min[:, 0] <= tx) & (rect_max[:, 0] > tx)]
+            tile_gaussian_counts[ty, tx] = idx.numel()
+            if idx.numel() == 0:
+                continue
+            x0, y0 = tx * BLOCK_X, ty * BLOCK_Y
+            x1, y1 = min(x0 + BLOCK_X, image_width), min(y0 + BLOCK_Y, image_height)
+            weights = blending_weights(pixel_grid(x0, y0, x1, y1, device), projected.xy[idx],
+                                       projected.conic[idx], projected.opacity[idx])
+            overdraw[y0:y1, x0:x1] = (weights > 0).sum(dim=1).reshape(y1 - y0, x1 - x0).int()
+
+    if num_gaussians is None:
+        num_gaussians = projected.radii.shape[0]
+    return {
+        "tile_gaussian_counts": tile_gaussian_counts,
+        "overdraw": overdraw,
+        "mean_contributing_gaussians": overdraw.float().mean().item(),
+        "visible_fraction": (projected.radii > 0).sum().item() / max(num_gaussians, 1)
+    }
+
+def summarise_reconstruction(pc):
+    """
+    Statistics of the predicted opacity and scaling of one reconstruction,
+    saved next to the render diagnostics.
+    """
+    quantiles = torch.tensor([0.1, 0.5, 0.9], device=pc["opacity"].device)
+    opacity = pc["opacity"].reshape(-1).float()
+    max_scale = pc["scaling"].max(dim=-1).values.reshape(-1).float()
+    return {
+        "num_gaussians": opacity.shape[0],
+        "opacity_mean": opacity.mean().item(),
+        "opacity_quantiles": torch.quantile(opacity, quantiles).tolist(),
+        "opacity_below_1_255": (opacity < 1.0 / 255.0).float().mean().item(),
+        "max_scale_mean": max_scale.mean().item(),
+        "max_scale_quantiles": torch.quantile(max_scale, quantiles).tolist()
+    }
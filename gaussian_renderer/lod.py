@@ -0,0 +1,113 @@
+"""
+Level-of-detail pyramid of a splatter image. Every level merges the
+Gaussians of 2x2 pixel neighbourhoods of the splatter image grid of the
+previous one, which keeps the structure of the image, so a level has a
+quarter of the Gaussians of the previous one. Renders pick the coarsest
+level that still has about one Gaussian per pixel across the object.
+"""
+
+import math
+
+import torch
+
+from utils.pruning_utils import merge_clusters
+
+from . import get_camera_intrinsics, render_predicted
+
+class LODPyramid:
+    """
+    Levels of detail of one reconstruction, levels[0] is the reconstruction.
+    """
+    def __init__(self, pc, grid_size, num_levels=4):
+        """
+        Args:
+            pc: activated reconstruction without a batch dimension, made of
+                one or more splatter images of grid_size x grid_size Gaussians
+            num_levels: number of levels including the full reconstruction,
+                fewer are built if the grid cannot be halved
+        """
+        num_gaussians = pc["xyz"].shape[0]
+        if num_gaussians % (grid_size * grid_size) != 0:
+            raise ValueError("{} Gaussians do not make {}x{} splatter images".format(
+                num_gaussians, grid_size, grid_size))
+        self.num_images = num_gaussians // (grid_size * grid_size)
+        self.grid_sizes = [grid_size]
+        self.levels = [pc]
+        while len(self.levels) < num_levels and self.grid_sizes[-1] % 2 == 0:
+            self.levels.append(self.merge_neighbourhoods(self.levels[-1], self.grid_sizes[-1]))
+            self.grid_sizes.append(self.grid_sizes[-1] // 2)
+
+        # bounding sphere of the visible Gaussians
+        visible = pc["opacity"].reshape(-1) >= 1.0 / 255.0
+        xyz = pc["xyz"][visible] if torch.any(visible) else pc["xyz"]
+        self.center = xyz.mean(dim=0)
+        self.radius = torch.norm(xyz - self.center, dim=-1).max().item()
+
+    @torch.no_grad()
+    def merge_neighbourhoods(self, pc, grid_size):
+        """
+        Merges the 2x2 neighbourhoods of a level of grid_size x grid_size.
+        """
+        i = torch.arange(self.num_images, device=pc["xyz"].device).reshape(-1, 1, 1)
+        y = torch.arange(grid_size, device=pc["xyz"].device).reshape(1, -1, 1)
+        x = torch.arange(grid_size, device=pc["xyz"].device).reshape(1, 1, -1)
+        half = grid_size // 2
+        cluster = (i * half * half + (y // 2) * half + x // 2).reshape(-1)
+        return merge_clusters(pc, cluster, self.num_images * half * half)
+
+    def projected_size(self, world_view_transform, tanfovx, tanfovy, image_height, image_width, depth=None):
+        """
+        Diameter in pixels of the bounding sphere seen from the camera. depth
+        is the depth of its centre in the view, computed with a device-to-host
+        copy if not given (render_batch computes those of a batch at once).
+        """
+        if depth is None:
+            depth = (torch.cat([self.center, self.center.new_ones(1)]) @ world_view_transform)[2].item()
+        focal = max(image_width / (2.0 * tanfovx), image_height / (2.0 * tanfovy))
+        if depth <= self.radius:
+            # the camera is inside the sphere
+            return math.inf
+        return 2.0 * self.radius * focal / math.sqrt(depth ** 2 - self.radius ** 2)
+
+    def select_level(self, world_view_transform, tanfovx, tanfovy, image_height, image_width, lod_bias=1.0,
+                     depth=None):
+        """
+        Coarsest level whose grid is at least lod_bias times the projected
+        size of the object.
+        """
+        size = lod_bias * self.projected_size(world_view_transform, tanfovx, tanfovy, image_height, image_width,
+                                              depth)
+        level = 0
+        while level + 1 < len(self.levels) and self.grid_sizes[level + 1] >= size:
+            level += 1
+        return level
+
+    def select_levels(self, world_view_transforms, intrinsics, lod_bias=1.0):
+        """
+        Levels of the views world_view_transforms [V, 4, 4], the depths of
+        the centre are copied to the host at once. intrinsics is one
+        CameraIntrinsics or a list of V of them.
+        """
+        depths = (torch.cat([self.center, self.center.new_ones(1)]) @ world_view_transforms)[:, 2].tolist()
+        if not isinstance(intrinsics, list):
+            intrinsics = [intrinsics] * len(depths)
+        return [self.select_level(None, view_intrinsics.tanfovx, view_intrinsics.tanfovy,
+                                  view_intrinsics.image_height, view_intrinsics.image_width, lod_bias, depth=depth)
+                for depth, view_intrinsics in zip(depths, intrinsics)]
+
+    def render(self, world_view_transform, full_proj_transform, camera_center, bg_color, cfg,
+               lod_bias=1.0, image_height=None, image_width=None, **kwargs):
+        """
+        Renders the level selected for the view with render_predicted, the
+        remaining keyword arguments are passed to it. The output also holds
+        the selected lod_level.
+        """
+        intrinsics = kwargs.pop("intrinsics", None)
+        if intrinsics is None:
+            intrinsics = get_camera_intrinsics(cfg, kwargs.pop("focals_pixels", None), image_height, image_width)
+        level = self.select_level(world_view_transform, intrinsics.tanfovx, intrinsics.tanfovy,
+                                  intrinsics.image_height, intrinsics.image_width, lod_bias)
+        out = render_predicted(self.levels[level], world_view_transform, full_proj_transform, camera_center,
+                               bg_color, cfg, intrinsics=intrinsics, **kwargs)
+        out["lod_level"] = level
+        return out
@@ -0,0 +1,167 @@
+"""
+Renders long camera loops on CPU hosts with a pool of worker processes.
+
+The reconstruction, the cameras and the output frames live in shared memory,
+every worker renders a contiguous chunk of the trajectory straight into its
+slice of the output, so frames come back in order without being copied
+between processes. Inference only.
+
+Starting the workers (spawn and imports) costs more than rendering a short
+loop, so callers that render many loops keep a RenderPool alive across calls.
+"""
+
+import os
+
+import torch
+import torch.multiprocessing as mp
+from omegaconf import OmegaConf
+
+from . import get_camera_intrinsics, prepare_gaussians, render_predicted
+from .cpu_rasterizer import set_num_threads
+from .torch_rasterizer import DepthOrderCache
+
+def get_chunks(num_views, num_workers):
+    """
+    Splits the views into num_workers contiguous chunks of similar size.
+    """
+    bounds = [round(i * num_views / num_workers) for i in range(num_workers + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def init_worker():
+    # one thread per worker, the parallelism comes from the processes
+    torch.set_num_threads(1)
+    set_num_threads(1)
+
+@torch.no_grad()
+def render_chunk(prepared_levels, view_levels, world_view_transforms, full_proj_transforms, camera_centers,
+                 focals_pixels, bg_color, cfg_container, start, end, frames, culled_fractions, reuse_depth_order,
+                 render_kwargs):
+    """
+    Worker: renders views [start, end) into frames[start:end], view v from
+    prepared_levels[view_levels[v]].
+    """
+    cfg = OmegaConf.create(cfg_container)
+    H, W = frames.shape[2], frames.shape[3]
+    if focals_pixels is None:
+        intrinsics = [get_camera_intrinsics(cfg, image_height=H, image_width=W)] * (end - start)
+    else:
+        intrinsics = get_camera_intrinsics(cfg, focals_pixels[start:end], image_height=H, image_width=W)
+    depth_order_caches = [DepthOrderCache() if reuse_depth_order else None for _ in prepared_levels]
+    for v_idx in range(start, end):
+        level = view_levels[v_idx]
+        out = render_predicted(prepared_levels[level],
+                               world_view_transforms[v_idx],
+                               full_proj_transforms[v_idx],
+                               camera_centers[v_idx],
+                               bg_color,
+                               cfg,
+                               intrinsics=intrinsics[v_idx - start],
+                               depth_order_cache=depth_order_caches[level],
+                               **render_kwargs)
+        frames[v_idx] = out["render"]
+        culled_fractions[v_idx] = out["culled_fraction"]
+
+class RenderPool:
+    """
+    Worker processes kept alive across render_loop_parallel calls. Close it
+    (or use it as a context manager) when done.
+    """
+    def __init__(self, num_workers=None):
+        self.num_workers = num_workers or os.cpu_count()
+        # spawn rather than fork: the parent may hold rasterizer thread pools
+        self.pool = mp.get_context("spawn").Pool(self.num_workers, initializer=init_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+@torch.no_grad()
+def render_loop_parallel(pc: dict,
+                         world_view_transforms,
+                         full_proj_transforms,
+                         camera_centers,
+                         bg_color: torch.Tensor,
+                         cfg,
+                         focals_pixels=None,
+                         num_workers=None,
+                         image_height=None,
+                         image_width=None,
+                         backend="cpu_fast",
+                         reuse_depth_order=False,
+                         lod_pyramid=None,
+                         lod_bias=1.0,
+                         pool=None):
+    """
+    Renders one reconstruction from V cameras with num_workers processes
+    (default: those of the pool, or one per core).
+    Args:
+        pc: reconstruction without a batch dimension, on the CPU
+        world_view_transforms, full_proj_transforms: [V, 4, 4]
+        camera_centers: [V, 3]
+        focals_pixels: [V, 2] or None to use the field of view in cfg
+        reuse_depth_order: repair the depth order of the previous view in
+            every chunk (see render_batch), only worth it for sparse scenes
+        lod_pyramid: LODPyramid of the reconstruction, every view then renders
+            the level selected from the projected size of the object (see
+            LODPyramid.select_level with lod_bias)
+        pool: RenderPool to render with, a temporary one is started if None
+    Returns a dictionary with the frames [V, 3, H, W] in camera order and the
+    average culled fraction, and the level of every view with lod_pyramid.
+    """
+    if pc["xyz"].is_cuda:
+        raise ValueError("Parallel loop rendering runs on CPU, got a reconstruction on {}".format(
+            pc["xyz"].device))
+    V = world_view_transforms.shape[0]
+    H = int(cfg.data.training_resolution) if image_height is None else image_height
+    W = int(cfg.data.training_resolution) if image_width is None else image_width
+    if pool is None:
+        with RenderPool(min(num_workers or os.cpu_count(), V)) as pool:
+            return render_loop_parallel(pc, world_view_transforms, full_proj_transforms, camera_centers,
+                                        bg_color, cfg, focals_pixels=focals_pixels, image_height=H,
+                                        image_width=W, backend=backend,
+                                        reuse_depth_order=reuse_depth_order, lod_pyramid=lod_pyramid,
+                                        lod_bias=lod_bias, pool=pool)
+    num_workers = min(num_workers or pool.num_workers, V)
+
+    if lod_pyramid is None:
+        levels, view_levels = [pc], [0] * V
+    else:
+        levels = lod_pyramid.levels
+        view_levels = lod_pyramid.select_levels(world_view_transforms,
+                                                get_camera_intrinsics(cfg, focals_pixels, H, W), lod_bias)
+    # covariances and colours of the levels in use computed once and shared by
+    # all the workers
+    prepared_levels = [None] * len(levels)
+    for l_idx in set(view_levels):
+        prepared_levels[l_idx] = {k: v.detach().contiguous().share_memory_()
+                                  for k, v in prepare_gaussians(levels[l_idx], cfg).items()}
+    cameras = [t.detach().float().contiguous().share_memory_()
+               for t in (world_view_transforms, full_proj_transforms, camera_centers)]
+    if focals_pixels is not None:
+        focals_pixels = focals_pixels.detach().float().contiguous().share_memory_()
+    bg_color = bg_color.detach().contiguous().share_memory_()
+    frames = torch.empty((V, 3, H, W), dtype=torch.float32).share_memory_()
+    culled_fractions = torch.zeros(V, dtype=torch.float32).share_memory_()
+    cfg_container = OmegaConf.to_container(cfg, resolve=True)
+    render_kwargs = {"backend": backend}
+
+    # workers receive handles to the shared tensors and write into frames,
+    # errors in a worker are raised here
+    pool.pool.starmap(render_chunk,
+                      [(prepared_levels, view_levels, *cameras, focals_pixels, bg_color, cfg_container, start, end,
+                        frames, culled_fractions, reuse_depth_order, render_kwargs)
+                       for start, end in get_chunks(V, num_workers)])
+
+    out = {
+        "render": frames,
+        "culled_fraction": culled_fractions.mean().item()
+    }
+    if lod_pyramid is not None:
+        out["lod_levels"] = view_levels
+    return out
@@ -0,0 +1,83 @@
+"""
+Renders several reconstructions together, each placed in the scene with a
+rigid transform, as one set of Gaussians so that occlusions between objects
+are resolved by the depth ordering of the rasterizer.
+"""
+
+import torch
+
+from utils.general_utils import build_rotation, quaternion_raw_multiply
+from utils.sh_utils import rotate_sh_degree1
+
+from . import render_predicted
+
+class SceneComposer:
+    """
+    Concatenates the reconstructions into buffers allocated once. Opacity,
+    scaling and colour are copied when the composer is built, every call to
+    compose() only overwrites the posed attributes of the objects, so the
+    composed dictionary is only valid until the next call.
+    """
+    def __init__(self, reconstructions):
+        """
+        Args:
+            reconstructions: list of dictionaries of activated xyz, opacity,
+                scaling, rotation, features_dc and optionally features_rest
+                (degree 1), without a batch dimension
+        """
+        keys = set(reconstructions[0].keys())
+        if any(set(pc.keys()) != keys for pc in reconstructions):
+            raise ValueError("All the reconstructions need the same attributes, got {}".format(
+                [sorted(pc.keys()) for pc in reconstructions]))
+        if "features_rest" in keys and reconstructions[0]["features_rest"].shape[1] != 3:
+            raise ValueError("Only degree 1 SH can be rotated")
+
+        self.reconstructions = reconstructions
+        sizes = [pc["xyz"].shape[0] for pc in reconstructions]
+        self.offsets = [0]
+        for size in sizes:
+            self.offsets.append(self.offsets[-1] + size)
+
+        self.buffers = {k: torch.cat([pc[k] for pc in reconstructions], dim=0).detach().clone()
+                        for k in keys}
+
+    @property
+    def num_objects(self):
+        return len(self.reconstructions)
+
+    @torch.no_grad()
+    def compose(self, rotations=None, translations=None):
+        """
+        Places every object with its rigid transform, x -> R x + t.
+        Args:
+            rotations: [M, 4] quaternions (real part first), None for identity
+            translations: [M, 3], None for no translation
+        Returns the dictionary of all the Gaussians of the scene.
+        """
+        device = self.buffers["xyz"].device
+        if rotations is None:
+            rotations = torch.tensor([[1.0, 0.0, 0.0, 0.0]], device=device).expand(self.num_objects, 4)
+        if translations is None:
+            translations = torch.zeros((self.num_objects, 3), device=device)
+        rotations = torch.nn.functional.normalize(rotations.to(device), dim=-1)
+        translations = translations.to(device)
+        R = build_rotation(rotations)
+
+        for o_idx, pc in enumerate(self.reconstructions):
+            start, end = self.offsets[o_idx], self.offsets[o_idx + 1]
+            torch.matmul(pc["xyz"], R[o_idx].transpose(0, 1), out=self.buffers["xyz"][start:end])
+            self.buffers["xyz"][start:end] += translations[o_idx]
+            self.buffers["rotation"][start:end] = quaternion_raw_multiply(rotations[o_idx], pc["rotation"])
+            if "features_rest" in self.buffers:
+                self.buffers["features_rest"][start:end] = rotate_sh_degree1(pc["features_rest"], R[o_idx])
+        return self.buffers
+
+    def render(self, world_view_transform, full_proj_transform, camera_center, bg_color, cfg,
+               rotations=None, translations=None, **kwargs):
+        """
+        Composes the scene and renders it in a single pass, the remaining
+        keyword arguments are passed to render_predicted.
+        """
+        return render_predicted(self.compose(rotations, translations),
+                                world_view_transform, full_proj_transform, camera_center,
+                                bg_color, cfg, **kwargs)
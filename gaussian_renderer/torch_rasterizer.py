@@ -0,0 +1,350 @@
+"""
+Differentiable Gaussian Splatting rasterizer written in plain PyTorch.
+
+Follows the forward model of diff_gaussian_rasterization (EWA projection,
+culling thresholds, 16x16 tiles, front-to-back alpha compositing) so that
+it can be used on machines without CUDA and as a reference implementation
+the CUDA kernels can be checked against.
+"""
+
+import math
+from typing import NamedTuple
+
+import torch
+from torch import nn
+from torch.utils.checkpoint import checkpoint
+
+from utils.general_utils import build_scaling_rotation
+from utils.sh_utils import eval_sh
+
+# Same tile size as the CUDA rasterizer
+BLOCK_X = 16
+BLOCK_Y = 16
+
+class RasterizationSettings(NamedTuple):
+    # Mirrors diff_gaussian_rasterization.GaussianRasterizationSettings
+    image_height: int
+    image_width: int
+    tanfovx: float
+    tanfovy: float
+    bg: torch.Tensor
+    scale_modifier: float
+    viewmatrix: torch.Tensor
+    projmatrix: torch.Tensor
+    sh_degree: int
+    campos: torch.Tensor
+    prefiltered: bool
+    debug: bool
+
+class ProjectedGaussians(NamedTuple):
+    xy: torch.Tensor        # [N, 2] centres in pixel coordinates
+    depth: torch.Tensor     # [N] view-space depth
+    conic: torch.Tensor     # [N, 3] inverse 2D covariance (xx, xy, yy)
+    opacity: torch.Tensor   # [N]
+    colors: torch.Tensor    # [N, C]
+    radii: torch.Tensor     # [N] screen-space radius, 0 for culled Gaussians
+    rect_min: torch.Tensor  # [N, 2] first tile (x, y) touched by each Gaussian
+    rect_max: torch.Tensor  # [N, 2] last tile (x, y) touched, exclusive
+
+def ndc2pix(v, S):
+    return ((v + 1.0) * S - 1.0) * 0.5
+
+def unstrip_symmetric(cov):
+    """
+    Inverse of utils.general_utils.strip_symmetric: [N, 6] -> [N, 3, 3]
+    """
+    return torch.stack([cov[:, 0], cov[:, 1], cov[:, 2],
+                        cov[:, 1], cov[:, 3], cov[:, 4],
+                        cov[:, 2], cov[:, 4], cov[:, 5]], dim=-1).reshape(-1, 3, 3)
+
+def compute_cov3D(scales, rotations, scale_modifier=1.0):
+    L = build_scaling_rotation(scale_modifier * scales, rotations)
+    return L @ L.transpose(1, 2)
+
+def compute_cov2D(p_view, cov3D, viewmatrix, focal_x, focal_y, tanfovx, tanfovy):
+    """
+    EWA splatting of the 3D covariances, including the 0.3 pixel low-pass
+    filter and the clamping of off-screen Jacobians of the CUDA rasterizer.
+    Returns the upper triangle (xx, xy, yy) of the 2D covariance.
+    """
+    limx = 1.3 * tanfovx
+    limy = 1.3 * tanfovy
+    tz = p_view[:, 2]
+    tx = (p_view[:, 0] / tz).clamp(-limx, limx) * tz
+    ty = (p_view[:, 1] / tz).clamp(-limy, limy) * tz
+    zeros = torch.zeros_like(tz)
+    J = torch.stack([
+        torch.stack([focal_x / tz, zeros, -(focal_x * tx) / (tz * tz)], dim=-1),
+        torch.stack([zeros, focal_y / tz, -(focal_y * ty) / (tz * tz)], dim=-1)], dim=1)
+    # world_view_transform is stored transposed, its top-left block is W^T
+    T = J @ viewmatrix[:3, :3].transpose(0, 1).unsqueeze(0)
+    cov = T @ cov3D @ T.transpose(1, 2)
+    return torch.stack([cov[:, 0, 0] + 0.3, cov[:, 0, 1], cov[:, 1, 1] + 0.3], dim=-1)
+
+def compute_colors_from_shs(means3D, shs, sh_degree, campos):
+    """
+    View-dependent colour of every Gaussian.
+    shs: [N, (deg + 1) ** 2, 3] as passed to the rasterizer
+    """
+    deg = min(sh_degree, int(math.sqrt(shs.shape[1])) - 1)
+    dirs = means3D - campos.unsqueeze(0)
+    dirs = dirs / dirs.norm(dim=1, keepdim=True)
+    return torch.clamp_min(eval_sh(deg, shs.transpose(1, 2), dirs) + 0.5, 0.0)
+
+def preprocess_gaussians(means3D, means2D, opacities, raster_settings,
+                         shs=None, colors_precomp=None,
+                         scales=None, rotations=None, cov3D_precomp=None):
+    """
+    Projects the Gaussians to the screen and culls the ones that cannot
+    contribute to the image, as in the preprocessing step of the CUDA rasterizer.
+    """
+    H = int(raster_settings.image_height)
+    W = int(raster_settings.image_width)
+    focal_x = W / (2.0 * raster_settings.tanfovx)
+    focal_y = H / (2.0 * raster_settings.tanfovy)
+
+    p_hom = torch.cat([means3D, torch.ones_like(means3D[:, :1])], dim=1)
+    p_view = (p_hom @ raster_settings.viewmatrix)[:, :3]
+    p_proj = p_hom @ raster_settings.projmatrix
+    p_proj = p_proj[:, :2] / (p_proj[:, 3:4] + 0.0000001)
+
+    in_frustum = p_view[:, 2] > 0.2
+    # Keep culled Gaussians finite so that they do not poison the gradients
+    p_view = torch.where(in_frustum.unsqueeze(1), p_view, torch.ones_like(p_view))
+
+    if cov3D_precomp is not None:
+        cov3D = unstrip_symmetric(cov3D_precomp)
+    else:
+        cov3D = compute_cov3D(scales, rotations, raster_settings.scale_modifier)
+    cov2D = compute_cov2D(p_view, cov3D, raster_settings.viewmatrix,
+                          focal_x, focal_y,
+                          raster_settings.tanfovx, raster_settings.tanfovy)
+
+    det = cov2D[:, 0] * cov2D[:, 2] - cov2D[:, 1] * cov2D[:, 1]
+    valid = in_frustum & (det != 0)
+    det = torch.where(valid, det, torch.ones_like(det))
+    conic = torch.stack([cov2D[:, 2], -cov2D[:, 1], cov2D[:, 0]], dim=-1) / det.unsqueeze(1)
+
+    with torch.no_grad():
+        mid = 0.5 * (cov2D[:, 0] + cov2D[:, 2])
+        lambda1 = mid + torch.sqrt(torch.clamp_min(mid * mid - det, 0.1))
+        radii = torch.ceil(3.0 * torch.sqrt(lambda1))
+
+    xy = torch.stack([ndc2pix(p_proj[:, 0], W), ndc2pix(p_proj[:, 1], H)], dim=-1)
+    # Screen-space gradients are accumulated in means2D like in the CUDA rasterizer
+    xy = xy + means2D[:, :2]
+
+    with torch.no_grad():
+        tile_grid = torch.tensor([(W + BLOCK_X - 1) // BLOCK_X, (H + BLOCK_Y - 1) // BLOCK_Y],
+                                 device=xy.device)
+        block = torch.tensor([BLOCK_X, BLOCK_Y], device=xy.device)
+        rect_min = torch.floor((xy - radii.unsqueeze(1)) / block).long()
+        rect_max = torch.floor((xy + radii.unsqueeze(1) + block - 1) / block).long()
+        rect_min = torch.minimum(rect_min.clamp_min(0), tile_grid)
+        rect_max = torch.minimum(rect_max.clamp_min(0), tile_grid)
+        touches_tiles = torch.prod(rect_max - rect_min, dim=1) > 0
+        valid = valid & touches_tiles & torch.isfinite(radii)
+        radii = torch.where(valid, radii, torch.zeros_like(radii)).int()
+
+    if colors_precomp is None:
+        colors = compute_colors_from_shs(means3D, shs, raster_settings.sh_degree,
+                                         raster_settings.campos)
+    else:
+        colors = colors_precomp
+
+    return ProjectedGaussians(xy=xy, depth=p_view[:, 2], conic=conic,
+                              opacity=opacities.reshape(-1), colors=colors,
+                              radii=radii, rect_min=rect_min, rect_max=rect_max)
+
+def depth_order(projected):
+    """
+    Indices of the visible Gaussians sorted front to back.
+    """
+    visible = torch.nonzero(projected.radii > 0).squeeze(1)
+    return visible[torch.argsort(projected.depth.detach()[visible], stable=True)]
+
+class DepthOrderCache:
+    """
+    Keeps the depth order of all the Gaussians of a reconstruction between
+    consecutive views of a camera sequence. The previous order is reused if
+    it is still sorted, repaired with a few odd-even transposition passes if
+    only a few neighbours swapped, and otherwise the Gaussians are sorted
+    from scratch (also when the set of Gaussians changed).
+    """
+    def __init__(self, max_passes=2, max_swapped_fraction=0.001):
+        self.max_passes = max_passes
+        self.max_swapped_fraction = max_swapped_fraction
+        self.order = None
+        self.num_full_sorts = 0
+        self.num_repairs = 0
+
+    def repair(self, depth):
+        """
+        Odd-even transposition passes over the previous order. Returns None
+        if the order is still not sorted after max_passes.
+        """
+        order = self.order.clone()
+        d = depth[order]
+        N = d.shape[0]
+        for _ in range(self.max_passes):
+            swapped = False
+            for start in (0, 1):
+                m = (N - start) // 2
+                if m == 0:
+                    continue
+                d_pairs = d[start:start + 2 * m].view(m, 2)
+                order_pairs = order[start:start + 2 * m].view(m, 2)
+                swap = d_pairs[:, 0] > d_pairs[:, 1]
+                if bool(swap.any()):
+                    swapped = True
+                    d_pairs[swap] = d_pairs[swap].flip(1)
+                    order_pairs[swap] = order_pairs[swap].flip(1)
+            if not swapped:
+                return order
+        return None
+
+    def __call__(self, projected):
+        """
+        Indices of the visible Gaussians sorted front to back, as depth_order.
+        """
+        depth = projected.depth.detach()
+        order = None
+        if self.order is not None and self.order.shape[0] == depth.shape[0]:
+            d = depth[self.order]
+            num_swapped = int((d[1:] < d[:-1]).sum())
+            if num_swapped == 0:
+                order = self.order
+            elif num_swapped <= self.max_swapped_fraction * depth.shape[0]:
+                order = self.repair(depth)
+            if order is not None:
+                self.num_repairs += 1
+        if order is None:
+            self.num_full_sorts += 1
+            order = torch.argsort(depth, stable=True)
+        self.order = order
+        return order[projected.radii[order] > 0]
+
+def pixel_grid(x0, y0, x1, y1, device):
+    ys, xs = torch.meshgrid(torch.arange(y0, y1, device=device, dtype=torch.float32),
+                            torch.arange(x0, x1, device=device, dtype=torch.float32),
+                            indexing="ij")
+    return torch.stack([xs, ys], dim=-1).reshape(-1, 2)
+
+def blending_weights(pix, xy, conic, opacity):
+    """
+    Contribution (alpha times transmittance) of K depth-sorted Gaussians to
+    each of P pixels [P, K], 0 for the Gaussians the rasterizer skips.
+    """
+    d = xy.unsqueeze(0) - pix.unsqueeze(1)
+    power = -0.5 * (conic[:, 0] * d[..., 0] * d[..., 0] + conic[:, 2] * d[..., 1] * d[..., 1]) \
+        - conic[:, 1] * d[..., 0] * d[..., 1]
+    power = torch.where(power > 0.0, torch.full_like(power, -float("inf")), power)
+    alpha = torch.clamp_max(opacity * torch.exp(power), 0.99)
+    alpha = torch.where(alpha < 1.0 / 255.0, torch.zeros_like(alpha), alpha)
+
+    T = torch.cumprod(1.0 - alpha, dim=1)
+    T_before = torch.cat([torch.ones_like(T[:, :1]), T[:, :-1]], dim=1)
+    # The CUDA rasterizer stops once the transmittance would drop below 1e-4.
+    # T is non-increasing, so this keeps a prefix of the sorted Gaussians.
+    return alpha * T_before * (T >= 0.0001)
+
+def composite_tile(pix, xy, conic, opacity, features):
+    """
+    Front-to-back alpha compositing of K depth-sorted Gaussians over P pixels.
+    Returns the accumulated features [P, C] and the final transmittance [P].
+    """
+    weights = blending_weights(pix, xy, conic, opacity)
+    return weights @ features, 1.0 - weights.sum(dim=1)
+
+def rasterize_tiles(projected, image_height, image_width, features=None, order=None):
+    """
+    Renders the projected Gaussians tile by tile.
+    Returns the accumulated features [C, H, W] and the final transmittance [H, W].
+    """
+    if features is None:
+        features = projected.colors
+    if order is None:
+        order = depth_order(projected)
+    device = features.device
+    C = features.shape[1]
+
+    accum = features.new_zeros((C, image_height, image_width))
+    transmittance = features.new_ones((image_height, image_width))
+
+    rect_min = projected.rect_min[order]
+    rect_max = projected.rect_max[order]
+    needs_grad = torch.is_grad_enabled() and any(
+        t.requires_grad for t in (projected.xy, projected.conic, projected.opacity, features))
+
+    for ty in range((image_height + BLOCK_Y - 1) // BLOCK_Y):
+        in_row = (rect_min[:, 1] <= ty) & (rect_max[:, 1] > ty)
+        for tx in range((image_width + BLOCK_X - 1) // BLOCK_X):
+            in_tile = in_row & (rect_min[:, 0] <= tx) & (rect_max[:, 0] > tx)
+            idx = order[in_tile]
+            if idx.numel() == 0:
+                continue
+            x0, y0 = tx * BLOCK_X, ty * BLOCK_Y
+            x1, y1 = min(x0 + BLOCK_X, image_width), min(y0 + BLOCK_Y, image_height)
+            pix = pixel_grid(x0, y0, x1, y1, device)
+            args = (pix, projected.xy[idx], projected.conic[idx],
+                    projected.opacity[idx], features[idx])
+            if needs_grad:
+                # recompute the per-pixel terms in backward instead of storing them
+                tile_accum, tile_T = checkpoint(composite_tile, *args, use_reentrant=False)
+            else:
+                tile_accum, tile_T = composite_tile(*args)
+            accum[:, y0:y1, x0:x1] = tile_accum.transpose(0, 1).reshape(C, y1 - y0, x1 - x0)
+            transmittance[y0:y1, x0:x1] = tile_T.reshape(y1 - y0, x1 - x0)
+
+    return accum, transmittance
+
+def expected_depth(accum_depth, alpha):
+    """
+    Normalises the alpha-weighted depth by the accumulated alpha, 0 where
+    nothing was rendered.
+    """
+    covered = alpha > 1.0 / 255.0
+    return torch.where(covered, accum_depth / torch.where(covered, alpha, torch.ones_like(alpha)),
+                       torch.zeros_like(accum_depth))
+
+class TorchGaussianRasterizer(nn.Module):
+    """
+    Drop-in replacement for diff_gaussian_rasterization.GaussianRasterizer.
+    """
+    def __init__(self, raster_settings):
+        super().__init__()
+        self.raster_settings = raster_settings
+
+    def forward(self, means3D, means2D, opacities, shs=None, colors_precomp=None,
+                scales=None, rotations=None, cov3D_precomp=None, return_depth_alpha=False,
+                depth_order_cache=None):
+        """
+        Returns the image and the radii. With return_depth_alpha the expected
+        depth and the accumulated alpha [1, H, W] are composited in the same
+        pass and returned as well. A DepthOrderCache reuses the depth order
+        of the previous view.
+        """
+        if (shs is None and colors_precomp is None) or (shs is not None and colors_precomp is not None):
+            raise Exception('Please provide excatly one of either SHs or precomputed colors!')
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or \
+                ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+
+        raster_settings = self.raster_settings
+        projected = preprocess_gaussians(means3D, means2D, opacities, raster_settings,
+                                         shs=shs, colors_precomp=colors_precomp,
+                                         scales=scales, rotations=rotations,
+                                         cov3D_precomp=cov3D_precomp)
+        features = projected.colors
+        if return_depth_alpha:
+            features = torch.cat([features, projected.depth.unsqueeze(1)], dim=1)
+        accum, transmittance = rasterize_tiles(projected,
+                                               int(raster_settings.image_height),
+                                               int(raster_settings.image_width),
+                                               features=features,
+                                               order=None if depth_order_cache is None else depth_order_cache(projected))
+        color = accum[:3] + transmittance.unsqueeze(0) * raster_settings.bg.reshape(-1, 1, 1)
+        if not return_depth_alpha:
+            return color, projected.radii
+        alpha = 1.0 - transmittance.unsqueeze(0)
+        return color, projected.radii, expected_depth(accum[3:], alpha), alpha
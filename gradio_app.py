@@ -1,5 +1,4 @@
 import torch
-import torchvision
 import numpy as np
 
 import os
@@ -14,12 +13,15 @@ from utils.app_utils import (
     to_tensor,
     get_source_camera_v2w_rmo_and_quats,
     get_target_cameras,
-    export_to_obj)
+    export_to_obj,
+    export_mesh)
 
 import imageio
 
 from scene.gaussian_predictor import GaussianSplatPredictor
-from gaussian_renderer import render_predicted
+from gaussian_renderer import render_batch
+from gaussian_renderer.lod import LODPyramid
+from gaussian_renderer.parallel import RenderPool, render_loop_parallel
 
 import gradio as gr
 
@@ -31,8 +33,11 @@ from huggingface_hub import hf_hub_download
 def main():
 
     os.environ["CUDA_VISIBLE_DEVICES"] = "1"
-    device = torch.device("cuda:0")
-    torch.cuda.set_device(device)
+    if torch.cuda.is_available():
+        device = torch.device("cuda:0")
+        torch.cuda.set_device(device)
+    else:
+        device = torch.device("cpu")
 
     model_cfg = OmegaConf.load(
         os.path.join(
@@ -49,6 +54,9 @@ def main():
     model.load_state_dict(ckpt_loaded["model_state_dict"])
     model.to(device)
 
+    # rendering workers started once for all the requests
+    render_pool = RenderPool() if device.type == "cpu" else None
+
     # ============= image preprocessing =============
     rembg_session = rembg.new_session()
 
@@ -71,6 +79,7 @@ def main():
         return image
 
     ply_out_path = f'./mesh.ply'
+    mesh_out_path = f'./mesh.obj'
 
     def reconstruct_and_export(image):
         """
@@ -91,28 +100,50 @@ def main():
         reconstruction = {k: v[0].contiguous() for k, v in reconstruction_unactivated.items()}
         reconstruction["scaling"] = model.scaling_activation(reconstruction["scaling"])
         reconstruction["opacity"] = model.opacity_activation(reconstruction["opacity"])
+        # coarser levels of detail for the views where the object looks small
+        lod_pyramid = LODPyramid(reconstruction, grid_size=model_cfg.data.training_resolution)
+        lod_bias = OmegaConf.select(model_cfg, "render.lod_bias", default=1.0)
 
         # render images in a loop
         world_view_transforms, full_proj_transforms, camera_centers = get_target_cameras()
         background = torch.tensor([1, 1, 1] , dtype=torch.float32, device=device)
         loop_renders = []
-        t_to_512 = torchvision.transforms.Resize(512, interpolation=torchvision.transforms.InterpolationMode.NEAREST)
-        for r_idx in range( world_view_transforms.shape[0]):
-            image = render_predicted(reconstruction,
-                                        world_view_transforms[r_idx].to(device),
-                                        full_proj_transforms[r_idx].to(device), 
-                                        camera_centers[r_idx].to(device),
-                                        background,
-                                        model_cfg,
-                                        focals_pixels=None)["render"]
-            image = t_to_512(image)
+        # render directly at the display resolution
+        if device.type == "cpu":
+            # on CPU hosts the turntable is split across worker processes
+            images = render_loop_parallel(reconstruction,
+                                          world_view_transforms,
+                                          full_proj_transforms,
+                                          camera_centers,
+                                          background,
+                                          model_cfg,
+                                          image_height=512,
+                                          image_width=512,
+                                          lod_pyramid=lod_pyramid,
+                                          lod_bias=lod_bias,
+                                          pool=render_pool)["render"]
+        else:
+            images = render_batch({k: v.unsqueeze(0) for k, v in reconstruction.items()},
+                                  world_view_transforms.unsqueeze(0).to(device),
+                                  full_proj_transforms.unsqueeze(0).to(device),
+                                  camera_centers.unsqueeze(0).to(device),
+                                  background,
+                                  model_cfg,
+                                  focals_pixels=None,
+                                  image_height=512,
+                                  image_width=512,
+                                  lod_pyramids=[lod_pyramid],
+                                  lod_bias=lod_bias)["render"]
+        for image in images:
             loop_renders.append(torch.clamp(image * 255, 0.0, 255.0).detach().permute(1, 2, 0).cpu().numpy().astype(np.uint8))
         loop_out_path = os.path.join(os.path.dirname(ply_out_path), "loop.mp4")
         imageio.mimsave(loop_out_path, loop_renders, fps=25)
         # export reconstruction to ply
         export_to_obj(reconstruction_unactivated, ply_out_path)
+        # and a mesh of the density of the Gaussians
+        export_mesh(reconstruction, mesh_out_path)
 
-        return ply_out_path, loop_out_path
+        return ply_out_path, loop_out_path, mesh_out_path
 
     css = """
     h1 {
@@ -123,8 +154,8 @@ def main():
 
     def run_example(image):
         preprocessed = preprocess(image)
-        ply_out_path, loop_out_path = reconstruct_and_export(np.array(preprocessed))
-        return preprocessed, ply_out_path, loop_out_path
+        ply_out_path, loop_out_path, mesh_out_path = reconstruct_and_export(np.array(preprocessed))
+        return preprocessed, ply_out_path, loop_out_path, mesh_out_path
 
 
     with gr.Blocks(css=css) as demo:
@@ -189,6 +220,13 @@ def main():
                                 label="Output Model",
                                 interactive=False
                             )
+                    with gr.Tab("Mesh"):
+                        with gr.Column():
+                            output_mesh = gr.Model3D(
+                                height=512,
+                                label="Mesh extracted from the density of the Gaussians",
+                                interactive=False
+                            )
 
         gr.Markdown(
             """
@@ -220,7 +258,7 @@ def main():
         ).success(
             fn=reconstruct_and_export,
             inputs=[processed_image],
-            outputs=[output_model, output_video],
+            outputs=[output_model, output_video, output_mesh],
         )
 
     demo.queue(max_size=1)
@@ -0,0 +1,22 @@
+import torch
+
+from datasets import cache
+from datasets.cache import ExampleCache
+
+def test_example_cache_evicts_least_recently_used():
+    cache = ExampleCache(max_bytes=2 * 400)
+    for key in ["a", "b"]:
+        cache.put(key, {"rgbs": torch.zeros(100)})
+    assert cache.get("a") is not None
+    cache.put("c", {"rgbs": torch.zeros(100)})
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "entries": 2, "megabytes": 800 / 2 ** 20}
+
+def test_shared_cache_is_capped_to_free_shared_memory(monkeypatch):
+    monkeypatch.setattr(cache, "get_free_shared_memory", lambda: 2 ** 16)
+    shared = cache.SharedExampleCache(max_bytes=2 ** 30, max_entries=16, fallback=ExampleCache(2 ** 20))
+    assert shared.slab.size <= 2 ** 16
+    # objects that do not fit go to the fallback cache
+    shared.put("a", {"rgbs": torch.zeros(2 ** 15)})
+    assert "a" in shared and shared.stats()["shared_entries"] == 0
@@ -0,0 +1,45 @@
+import math
+
+import torch
+
+from gaussian_renderer.compaction import compact_reconstruction
+
+from test_torch_rasterizer import get_camera, get_cfg, get_gaussians
+
+@torch.no_grad()
+def test_compact_reconstruction_reaches_target_count():
+    cfg = get_cfg(resolution=32)
+    cameras = [t.unsqueeze(0) for t in get_camera(cfg)]
+    pc = get_gaussians(400)
+    compact, report = compact_reconstruction(pc, cfg, target_count=100, cameras=cameras, backend="torch")
+    assert compact["xyz"].shape[0] == report["num_compact"] <= 100
+    assert report["num_pruned"] > 0
+    assert 0 < report["psnr_to_unpruned"] < 100
+
+@torch.no_grad()
+def test_compact_reconstruction_with_cpu_fast_backend():
+    cfg = get_cfg(resolution=32)
+    cfg.render = {"backend": "cpu_fast"}
+    cameras = [t.unsqueeze(0) for t in get_camera(cfg)]
+    pc = get_gaussians(400)
+    compact, report = compact_reconstruction(pc, cfg, target_count=100, cameras=cameras)
+    # contributions are computed with the torch backend
+    expected, expected_report = compact_reconstruction(pc, cfg, target_count=100, cameras=cameras, backend="torch")
+    assert report["num_pruned"] == expected_report["num_pruned"] > 0
+    assert compact["xyz"].shape[0] == report["num_compact"] <= 100
+
+@torch.no_grad()
+def test_compact_reconstruction_with_focals():
+    # focals of a narrower field of view than the config
+    cfg = get_cfg(resolution=32)
+    focal = 0.5 * 32 / (0.8 * math.tan(cfg.data.fov * math.pi / 360))
+    narrow_cfg = get_cfg(resolution=32)
+    narrow_cfg.data.fov = 2 * math.atan(0.5 * 32 / focal) * 180 / math.pi
+    cameras = [t.unsqueeze(0) for t in get_camera(narrow_cfg)]
+    pc = get_gaussians(400)
+    compact, report = compact_reconstruction(pc, cfg, target_count=100, backend="torch",
+                                             cameras=(*cameras, torch.tensor([[focal, focal]])))
+    expected, expected_report = compact_reconstruction(pc, narrow_cfg, target_count=100, cameras=cameras,
+                                                       backend="torch")
+    assert report["num_pruned"] == expected_report["num_pruned"] > 0
+    assert math.isclose(report["psnr_to_unpruned"], expected_report["psnr_to_unpruned"], rel_tol=1e-4)
@@ -0,0 +1,109 @@
+import math
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from PIL import Image
+
+from benchmarks.pose_relativisation import get_example_cameras, relativise_batched, relativise_loop
+from data_preprocessing.pack_srn import get_dataset_cfg, pack_srn
+from datasets import srn
+from utils.general_utils import matrix_to_quaternion, matrix_to_quaternion_batch
+
+def write_srn_objects(base_path, views_per_object, side=16):
+    """
+    Small SRN split with random RGBA images and camera-to-world poses.
+    """
+    generator = np.random.default_rng(0)
+    for o_idx, num_views in enumerate(views_per_object):
+        folder = os.path.join(base_path, "object_{}".format(o_idx))
+        os.makedirs(os.path.join(folder, "rgb"))
+        os.makedirs(os.path.join(folder, "pose"))
+        open(os.path.join(folder, "intrinsics.txt"), "w").close()
+        for v_idx in range(num_views):
+            Image.fromarray(generator.integers(0, 256, (side, side, 4), dtype=np.uint8)).save(
+                os.path.join(folder, "rgb", "{:06d}.png".format(v_idx)))
+            angle = 2 * math.pi * v_idx / num_views
+            c2w = np.eye(4)
+            c2w[:3, :3] = [[math.cos(angle), 0, math.sin(angle)], [0, 1, 0], [-math.sin(angle), 0, math.cos(angle)]]
+            c2w[:3, 3] = [-1.3 * math.sin(angle), 0.2, -1.3 * math.cos(angle)]
+            np.savetxt(os.path.join(folder, "pose", "{:06d}.txt".format(v_idx)), c2w.reshape(1, 16))
+
+def test_packed_srn_matches_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(srn, "SHAPENET_DATASET_ROOT", str(tmp_path))
+    base_path = os.path.join(tmp_path, "srn_cars", "cars_test")
+    write_srn_objects(base_path, [3, 5])
+    pack_srn(base_path, resolution=8)
+
+    from_files = srn.SRNDataset(get_dataset_cfg("cars", resolution=8), "test")
+    packed = srn.SRNDataset(get_dataset_cfg("cars", resolution=8, packed=True), "test")
+    assert len(packed) == len(from_files) == 2
+    for idx in range(2):
+        expected, example = from_files[idx], packed[idx]
+        assert example["sample_id"] == expected["sample_id"]
+        for k in expected.keys():
+            if k != "sample_id":
+                assert torch.allclose(example[k], expected[k], atol=1e-5), k
+
+def test_srn_cache_keeps_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(srn, "SHAPENET_DATASET_ROOT", str(tmp_path))
+    write_srn_objects(os.path.join(tmp_path, "srn_cars", "cars_test"), [3, 5])
+    cfg = get_dataset_cfg("cars", resolution=8)
+    # no budget: only the object read last is kept
+    cfg.data.cache_mb = 0
+    dataset = srn.SRNDataset(cfg, "test")
+    expected = dataset[0]
+    for idx in [0, 1, 0]:
+        example = dataset[idx]
+    assert torch.equal(example["gt_images"], expected["gt_images"])
+    stats = dataset.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (1, 3, 2, 1)
+
+def test_srn_shared_cache_is_filled_by_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(srn, "SHAPENET_DATASET_ROOT", str(tmp_path))
+    write_srn_objects(os.path.join(tmp_path, "srn_cars", "cars_test"), [3, 5])
+    expected = srn.SRNDataset(get_dataset_cfg("cars", resolution=8), "test")
+    cfg = get_dataset_cfg("cars", resolution=8)
+    cfg.data.shared_cache_mb = 1
+    dataset = srn.SRNDataset(cfg, "test")
+    batches = list(DataLoader(dataset, batch_size=1, num_workers=2))
+    # objects decoded by the workers are read by this process without decoding
+    stats = dataset.cache.stats()
+    assert stats["shared_entries"] == 2 and stats["entries"] == 0
+    for idx, batch in enumerate(batches):
+        assert torch.equal(batch["gt_images"][0], expected[idx]["gt_images"])
+        assert torch.equal(dataset[idx]["gt_images"], expected[idx]["gt_images"])
+    assert dataset.cache.stats()["hits"] == 2
+
+def test_batched_pose_relativisation_matches_loop():
+    cameras = get_example_cameras(50)
+    expected = relativise_loop(cameras)
+    out = relativise_batched(cameras)
+    for k in expected.keys():
+        assert torch.allclose(out[k], expected[k], atol=1e-5), k
+    # exact half turns about x, y and z take the other branches
+    rotations = torch.cat([torch.diag_embed(torch.tensor([[1.0, -1.0, -1.0], [-1.0, 1.0, -1.0], [-1.0, -1.0, 1.0]])),
+                           cameras["view_to_world_transforms"][:, :3, :3]])
+    assert torch.allclose(matrix_to_quaternion_batch(rotations),
+                          torch.stack([matrix_to_quaternion(M) for M in rotations]))
+
+def test_lazy_srn_frames_match_eager_frames(tmp_path, monkeypatch):
+    monkeypatch.setattr(srn, "SHAPENET_DATASET_ROOT", str(tmp_path))
+    write_srn_objects(os.path.join(tmp_path, "srn_cars", "cars_train"), [6, 8])
+    eager = srn.SRNDataset(get_dataset_cfg("cars", resolution=8), "train")
+    cfg = get_dataset_cfg("cars", resolution=8)
+    cfg.data.lazy_frames = True
+    lazy = srn.SRNDataset(cfg, "train")
+    for idx in [0, 1, 0]:
+        torch.manual_seed(idx)
+        expected = eager[idx]
+        torch.manual_seed(idx)
+        example = lazy[idx]
+        assert torch.equal(example["gt_images"], expected["gt_images"])
+        # cameras are computed for all the views at once, as for the packed split
+        for k in expected.keys():
+            if k != "sample_id":
+                assert torch.allclose(example[k], expected[k], atol=1e-5), k
+    # cameras of both objects and only the sampled views are decoded
+    assert len(lazy.cache) < 2 + 2 * (eager.imgs_per_obj + 1)
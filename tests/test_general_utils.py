@@ -0,0 +1,9 @@
+import torch
+
+from utils.general_utils import get_foreground_rois
+
+def test_foreground_rois():
+    images = torch.ones(2, 3, 64, 64)
+    images[0, :, 20:30, 35:40] = 0.5
+    rois = get_foreground_rois(images, torch.ones(3))
+    assert rois.tolist() == [[32, 16, 48, 32], [0, 0, 64, 64]]
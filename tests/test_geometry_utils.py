@@ -0,0 +1,23 @@
+import math
+
+import torch
+
+from utils.geometry_utils import chamfer_and_fscore, sample_gaussian_points
+
+@torch.no_grad()
+def test_geometry_metrics_match_full_scan():
+    generator = torch.Generator().manual_seed(0)
+    points = torch.rand(500, 3, generator=generator)
+    reference = torch.rand(800, 3, generator=generator)
+    metrics = chamfer_and_fscore(points, reference, threshold=0.05)
+    distances = torch.cdist(points, reference)
+    to_reference, to_points = distances.min(dim=1).values, distances.min(dim=0).values
+    assert math.isclose(metrics["chamfer"], 0.5 * (to_reference.mean() + to_points.mean()).item(), rel_tol=1e-5)
+    assert math.isclose(metrics["precision"], (to_reference <= 0.05).float().mean().item(), rel_tol=1e-5)
+    assert math.isclose(metrics["recall"], (to_points <= 0.05).float().mean().item(), rel_tol=1e-5)
+    assert chamfer_and_fscore(reference, reference)["fscore"] == 1.0
+
+    # transparent Gaussians are never sampled
+    pc = {"xyz": points, "opacity": (torch.arange(500) % 2).float().unsqueeze(1)}
+    samples = sample_gaussian_points(pc, 1000, generator=generator)
+    assert torch.all(torch.any(torch.all(samples.unsqueeze(1) == points[1::2], dim=-1), dim=1))
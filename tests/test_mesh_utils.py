@@ -0,0 +1,40 @@
+import math
+
+import torch
+
+from utils.mesh_utils import evaluate_density_grid, extract_mesh
+
+@torch.no_grad()
+def test_extracted_mesh_is_closed_iso_surface():
+    # two isotropic Gaussians of different colours, far apart
+    pc = {"xyz": torch.tensor([[-0.5, 0.0, 0.0], [0.5, 0.0, 0.0]]),
+          "scaling": torch.full((2, 3), 0.1),
+          "rotation": torch.tensor([[1.0, 0.0, 0.0, 0.0]]).repeat(2, 1),
+          "opacity": torch.ones(2, 1),
+          "features_dc": torch.tensor([[[1.0, -1.0, -1.0]], [[-1.0, -1.0, 1.0]]])}
+    bounds = (torch.tensor([-1.0, -0.5, -0.5]), torch.tensor([1.0, 0.5, 0.5]))
+
+    # chunked evaluation matches the density evaluated at every grid point
+    density, _, origin, spacing = evaluate_density_grid(pc, 17, bounds, chunk_size=4)
+    steps = [origin[i] + spacing[i] * torch.arange(17) for i in range(3)]
+    points = torch.stack(torch.meshgrid(*steps, indexing="ij"), dim=-1)
+    offsets = points.reshape(-1, 1, 3) - pc["xyz"]
+    # Gaussians are evaluated in their 3 sigma boxes
+    inside = torch.all(torch.abs(offsets) <= 0.3, dim=-1)
+    expected = torch.sum(torch.exp(-0.5 * torch.sum(offsets ** 2, dim=-1) / 0.01) * inside, dim=1)
+    assert torch.allclose(density.reshape(-1), expected, atol=1e-5)
+
+    vertices, faces, colours = extract_mesh(pc, resolution=48, level=0.5, bounds=bounds, chunk_size=16)
+    radius = 0.1 * math.sqrt(2.0 * math.log(2.0))
+    distances = torch.cdist(vertices, pc["xyz"]).min(dim=1)
+    assert torch.allclose(distances.values, torch.full_like(distances.values, radius), atol=0.01)
+    # every edge is shared by two faces, which face outwards
+    edges = torch.sort(torch.cat([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), dim=1).values
+    assert torch.all(torch.unique(edges, dim=0, return_counts=True)[1] == 2)
+    triangles = vertices[faces]
+    normals = torch.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0], dim=1)
+    centers = pc["xyz"][distances.indices[faces[:, 0]]]
+    assert torch.all(torch.sum(normals * (triangles.mean(dim=1) - centers), dim=1) > 0)
+    # vertices take the colour of their Gaussian
+    expected_colours = torch.clamp(0.5 + 0.28209479177387814 * pc["features_dc"][:, 0], 0.0, 1.0)
+    assert torch.allclose(colours, expected_colours[distances.indices], atol=0.02)
@@ -0,0 +1,23 @@
+import torch
+
+from utils.general_utils import build_rotation
+from utils.pruning_utils import merge_gaussians
+
+from test_torch_rasterizer import get_gaussians
+
+@torch.no_grad()
+def test_merged_gaussian_matches_moments():
+    pc = get_gaussians(2)
+    pc["features_dc"][1] = pc["features_dc"][0]
+    merged = merge_gaussians(pc, voxel_size=10.0)
+    assert merged["xyz"].shape[0] == 1
+
+    weights = pc["opacity"] / pc["opacity"].sum()
+    mean = (weights * pc["xyz"]).sum(dim=0)
+    L = build_rotation(pc["rotation"]) * pc["scaling"].unsqueeze(1)
+    offsets = pc["xyz"] - mean
+    cov = (weights.unsqueeze(2) * (L @ L.transpose(1, 2) + offsets.unsqueeze(2) * offsets.unsqueeze(1))).sum(dim=0)
+    L_merged = build_rotation(merged["rotation"]) * merged["scaling"].unsqueeze(1)
+    assert torch.allclose(merged["xyz"][0], mean, atol=1e-6)
+    assert torch.allclose((L_merged @ L_merged.transpose(1, 2))[0], cov, atol=1e-6)
+    assert torch.allclose(merged["opacity"][0], 1 - (1 - pc["opacity"]).prod(dim=0), atol=1e-5)
@@ -0,0 +1,23 @@
+import torch
+
+from utils.spatial_index import SpatialIndex
+
+@torch.no_grad()
+def test_spatial_index_queries_match_full_scan():
+    generator = torch.Generator().manual_seed(0)
+    points = torch.rand(2000, 3, generator=generator)
+    queries = torch.rand(100, 3, generator=generator) * 1.2 - 0.1
+    index = SpatialIndex(points)
+
+    distances, indices = index.knn(queries, k=3)
+    expected_distances, expected_indices = torch.topk(torch.cdist(queries, points), 3, dim=1, largest=False)
+    assert torch.allclose(distances, expected_distances, atol=1e-5)
+    assert torch.equal(indices, expected_indices)
+
+    query_idx, point_idx = index.radius_query(queries, 0.1)
+    expected = torch.nonzero(torch.cdist(queries, points) <= 0.1)
+    assert set(zip(query_idx.tolist(), point_idx.tolist())) == set(map(tuple, expected.tolist()))
+
+    box_min, box_max = torch.tensor([0.2, 0.1, 0.5]), torch.tensor([0.6, 0.3, 0.9])
+    inside = torch.all((points >= box_min) & (points <= box_max), dim=1)
+    assert torch.equal(index.box_query(box_min, box_max), torch.nonzero(inside).squeeze(1))
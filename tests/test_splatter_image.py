@@ -0,0 +1,29 @@
+import torch
+
+from gaussian_renderer import render_batch
+from utils.splatter_image import SplatterImage
+
+from test_torch_rasterizer import get_camera, get_cfg, get_gaussians
+
+def test_splatter_image_views_packed_buffer():
+    pcs = [get_gaussians(50, seed=seed) for seed in range(2)]
+    batched = {k: torch.stack([pc[k] for pc in pcs]) for k in pcs[0].keys()}
+    image = SplatterImage.from_dict(batched)
+    assert image.buffer.shape == (2, 50, 23)
+    assert image.num_gaussians == 50 and image.batch_item(0).num_gaussians == 50
+    for k, v in image.to_dict().items():
+        assert torch.equal(v, batched[k])
+        assert v.data_ptr() >= image.buffer.data_ptr()
+
+    # batch items and attributes are views of the buffer
+    item = image.batch_item(1)
+    item["xyz"][0] = 5.0
+    assert torch.all(image.buffer[1, 0, :3] == 5.0)
+
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    cameras = [t.expand(2, 2, *t.shape) for t in (world_view_transform, full_proj_transform, camera_center)]
+    with torch.no_grad():
+        expected = render_batch(image.to_dict(), *cameras, torch.zeros(3), cfg, backend="torch")["render"]
+        packed = render_batch(image, *cameras, torch.zeros(3), cfg, backend="torch")["render"]
+    assert torch.equal(packed, expected)
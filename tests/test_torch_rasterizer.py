@@ -0,0 +1,444 @@
+import math
+
+import torch
+from omegaconf import OmegaConf
+
+from benchmarks.conformance import MIN_PSNR, load_golden, psnr, render_case
+from gaussian_renderer import render_predicted, render_batch, get_camera_intrinsics
+from gaussian_renderer.culling import build_culling_index, cull_gaussians, get_culling_settings
+from gaussian_renderer.lod import LODPyramid
+from gaussian_renderer.parallel import RenderPool, get_chunks, render_loop_parallel
+from gaussian_renderer.scene_composer import SceneComposer
+from gaussian_renderer.torch_rasterizer import (DepthOrderCache, ProjectedGaussians, RasterizationSettings,
+                                                depth_order, preprocess_gaussians)
+from utils.general_utils import build_rotation
+from utils.graphics_utils import getProjectionMatrix
+
+def get_cfg(resolution=32):
+    return OmegaConf.create({"data": {"fov": 51.98948897809546,
+                                      "training_resolution": resolution},
+                             "model": {"max_sh_degree": 1}})
+
+def get_camera(cfg):
+    fov = cfg.data.fov * math.pi / 180
+    projection_matrix = getProjectionMatrix(znear=0.8, zfar=3.2, fovX=fov, fovY=fov).transpose(0, 1)
+    world_view_transform = torch.eye(4)
+    return world_view_transform, world_view_transform @ projection_matrix, torch.zeros(3)
+
+def get_gaussians(num_gaussians, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    return {"xyz": torch.randn(num_gaussians, 3, generator=generator) * 0.2 + torch.tensor([0.0, 0.0, 2.0]),
+            "opacity": torch.rand(num_gaussians, 1, generator=generator),
+            "scaling": torch.rand(num_gaussians, 3, generator=generator) * 0.03,
+            "rotation": torch.nn.functional.normalize(torch.randn(num_gaussians, 4, generator=generator), dim=-1),
+            "features_dc": torch.randn(num_gaussians, 1, 3, generator=generator),
+            "features_rest": torch.randn(num_gaussians, 3, 3, generator=generator) * 0.1}
+
+def reference_composite(projected, bg, height, width):
+    """
+    Per-pixel loop over depth-sorted Gaussians, written like the CUDA kernel.
+    """
+    image = torch.zeros(3, height, width)
+    order = torch.argsort(projected.depth)
+    for y in range(height):
+        for x in range(width):
+            T = 1.0
+            C = torch.zeros(3)
+            for i in order.tolist():
+                if projected.radii[i] == 0:
+                    continue
+                dx = projected.xy[i, 0] - x
+                dy = projected.xy[i, 1] - y
+                con = projected.conic[i]
+                power = -0.5 * (con[0] * dx * dx + con[2] * dy * dy) - con[1] * dx * dy
+                if power > 0:
+                    continue
+                alpha = min(0.99, projected.opacity[i] * math.exp(power))
+                if alpha < 1.0 / 255.0:
+                    continue
+                test_T = T * (1 - alpha)
+                if test_T < 0.0001:
+                    break
+                C += projected.colors[i] * alpha * T
+                T = test_T
+            image[:, y, x] = C + T * bg
+    return image
+
+@torch.no_grad()
+def test_torch_backend_matches_reference_compositing():
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(16 * 16)
+    bg = torch.tensor([1.0, 1.0, 1.0])
+
+    image = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                             bg, cfg, backend="torch")["render"]
+
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    settings = RasterizationSettings(image_height=16, image_width=16, tanfovx=tanfov, tanfovy=tanfov,
+                                     bg=bg, scale_modifier=1.0, viewmatrix=world_view_transform,
+                                     projmatrix=full_proj_transform, sh_degree=1, campos=camera_center,
+                                     prefiltered=False, debug=False)
+    projected = preprocess_gaussians(pc["xyz"], torch.zeros_like(pc["xyz"]), pc["opacity"], settings,
+                                     shs=torch.cat([pc["features_dc"], pc["features_rest"]], dim=1),
+                                     scales=pc["scaling"], rotations=pc["rotation"])
+    reference = reference_composite(projected, bg, 16, 16)
+
+    assert torch.allclose(image, reference, atol=1e-5)
+
+@torch.no_grad()
+def test_isotropic_gaussian_projection():
+    cfg = get_cfg()
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    settings = RasterizationSettings(image_height=32, image_width=32, tanfovx=tanfov, tanfovy=tanfov,
+                                     bg=torch.zeros(3), scale_modifier=1.0, viewmatrix=world_view_transform,
+                                     projmatrix=full_proj_transform, sh_degree=0, campos=camera_center,
+                                     prefiltered=False, debug=False)
+    projected = preprocess_gaussians(torch.tensor([[0.0, 0.0, 2.0]]), torch.zeros(1, 3), torch.ones(1, 1),
+                                     settings, colors_precomp=torch.ones(1, 3),
+                                     scales=torch.full((1, 3), 0.05),
+                                     rotations=torch.tensor([[1.0, 0.0, 0.0, 0.0]]))
+    focal = 32 / (2 * tanfov)
+    expected_variance = (focal * 0.05 / 2.0) ** 2 + 0.3
+
+    assert torch.allclose(projected.xy, torch.tensor([[15.5, 15.5]]), atol=1e-4)
+    assert torch.allclose(projected.conic, torch.tensor([[1 / expected_variance, 0.0, 1 / expected_variance]]),
+                          rtol=1e-4)
+
+def test_torch_backend_gradients():
+    cfg = get_cfg()
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = {k: v.requires_grad_() for k, v in get_gaussians(32 * 32).items()}
+
+    out = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                           torch.zeros(3), cfg, backend="torch")
+    out["render"].mean().backward()
+
+    for k, v in pc.items():
+        assert v.grad is not None and torch.all(torch.isfinite(v.grad)), k
+    assert torch.any(out["viewspace_points"].grad != 0)
+
+@torch.no_grad()
+def test_cpu_fast_backend_matches_torch_backend():
+    cfg = get_cfg(resolution=64)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(64 * 64)
+    bg = torch.tensor([1.0, 1.0, 1.0])
+
+    renders = [render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                                bg, cfg, backend=backend) for backend in ["torch", "cpu_fast"]]
+
+    assert torch.allclose(renders[0]["render"], renders[1]["render"], atol=1e-4)
+    assert torch.equal(renders[0]["radii"], renders[1]["radii"])
+
+@torch.no_grad()
+def test_render_batch_matches_render_predicted():
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pcs = [get_gaussians(16 * 16, seed=seed) for seed in range(2)]
+    bg = torch.zeros(3)
+
+    out = render_batch({k: torch.stack([pc[k] for pc in pcs]) for k in pcs[0].keys()},
+                       world_view_transform.expand(2, 3, 4, 4),
+                       full_proj_transform.expand(2, 3, 4, 4),
+                       camera_center.expand(2, 3, 3),
+                       bg, cfg, backend="torch")
+
+    for b_idx, pc in enumerate(pcs):
+        expected = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                                    bg, cfg, backend="torch")["render"]
+        for v_idx in range(3):
+            assert torch.allclose(out["render"][b_idx * 3 + v_idx], expected, atol=1e-5)
+
+def get_culling_cfg(resolution, **culling):
+    cfg = get_cfg(resolution=resolution)
+    cfg.render = {"culling": {"enabled": True, **culling}}
+    return cfg
+
+@torch.no_grad()
+def test_default_culling_is_lossless():
+    cfg = get_culling_cfg(32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(32 * 32)
+    # move part of the Gaussians out of the view and make some transparent
+    pc["xyz"][:200, 0] += 3.0
+    pc["opacity"][200:400] *= 0.003
+    bg = torch.tensor([1.0, 1.0, 1.0])
+
+    reference = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                                 bg, get_cfg(32), backend="torch")
+    culled = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                              bg, cfg, backend="torch")
+
+    assert culled["culled_fraction"] > 0.3
+    assert torch.allclose(culled["render"], reference["render"], atol=1e-6)
+    # Gaussians outside of the view are culled by the rasterizer as well
+    assert torch.all(reference["radii"][:200] == 0)
+    opaque = pc["opacity"].reshape(-1) >= 1.0 / 255.0
+    assert torch.equal(culled["radii"][opaque], reference["radii"][opaque])
+
+def test_culling_gradients_scatter_back():
+    cfg = get_culling_cfg(32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(32 * 32)
+    pc["opacity"][:100] = 0.0
+    pc = {k: v.requires_grad_() for k, v in pc.items()}
+
+    out = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                           torch.zeros(3), cfg, backend="torch")
+    out["render"].mean().backward()
+
+    assert out["radii"].shape[0] == 32 * 32
+    assert torch.all(pc["xyz"].grad[:100] == 0)
+    assert torch.any(pc["xyz"].grad[100:] != 0)
+    assert out["viewspace_points"].grad.shape == pc["xyz"].shape
+
+@torch.no_grad()
+def test_depth_and_alpha_match_reference_compositing():
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(100)
+    bg = torch.tensor([1.0, 1.0, 1.0])
+
+    outs = [render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                             backend=backend, render_depth=True, render_alpha=True)
+            for backend in ["torch", "cpu_fast"]]
+
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    settings = RasterizationSettings(image_height=16, image_width=16, tanfovx=tanfov, tanfovy=tanfov,
+                                     bg=bg, scale_modifier=1.0, viewmatrix=world_view_transform,
+                                     projmatrix=full_proj_transform, sh_degree=1, campos=camera_center,
+                                     prefiltered=False, debug=False)
+    projected = preprocess_gaussians(pc["xyz"], torch.zeros_like(pc["xyz"]), pc["opacity"], settings,
+                                     colors_precomp=torch.ones(100, 3),
+                                     scales=pc["scaling"], rotations=pc["rotation"])
+    alpha = reference_composite(projected, torch.zeros(3), 16, 16)[:1]
+    projected = projected._replace(colors=projected.depth.unsqueeze(1).expand(-1, 3))
+    depth = reference_composite(projected, torch.zeros(3), 16, 16)[:1]
+    depth = torch.where(alpha > 1.0 / 255.0, depth / alpha, torch.zeros_like(depth))
+
+    for out in outs:
+        assert torch.allclose(out["alpha"], alpha, atol=1e-4)
+        assert torch.allclose(out["depth"], depth, atol=1e-4)
+    assert torch.allclose(outs[0]["render"], outs[1]["render"], atol=1e-4)
+
+@torch.no_grad()
+def test_output_size_and_supersampling():
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(100)
+    bg = torch.tensor([1.0, 1.0, 1.0])
+    focal = 16 / (2 * math.tan(cfg.data.fov * math.pi / 360))
+
+    high_res = render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                                backend="torch", image_height=32, image_width=32)["render"]
+    # focals are given at the training resolution and describe the same camera
+    with_focals = render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                                   backend="torch", image_height=32, image_width=32,
+                                   focals_pixels=torch.tensor([focal, focal]))["render"]
+    supersampled = render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                                    backend="torch", supersampling=2)["render"]
+
+    assert high_res.shape == (3, 32, 32)
+    assert torch.allclose(with_focals, high_res, atol=1e-5)
+    assert torch.allclose(supersampled, torch.nn.functional.avg_pool2d(high_res.unsqueeze(0), 2)[0], atol=1e-6)
+
+@torch.no_grad()
+def test_roi_render_matches_crop_of_full_render():
+    cfg = get_cfg(resolution=64)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(500)
+    bg = torch.tensor([1.0, 1.0, 1.0])
+
+    full = render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                            backend="torch", render_depth=True)
+    # tile-aligned windows, centred and one that has to be grown towards the centre
+    for roi in [(16, 16, 48, 48), (32, 16, 64, 48)]:
+        x0, y0, x1, y1 = roi
+        out = render_predicted(pc, world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                               backend="torch", render_depth=True, roi=roi)
+        assert out["render"].shape == (3, y1 - y0, x1 - x0)
+        assert torch.allclose(out["render"], full["render"][:, y0:y1, x0:x1], atol=1e-5)
+        assert torch.allclose(out["depth"], full["depth"][:, y0:y1, x0:x1], atol=1e-4)
+
+@torch.no_grad()
+def test_cached_rasterizer_follows_the_view():
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    shifted = world_view_transform.clone()
+    shifted[3, 0] = 0.1
+    pc = get_gaussians(100)
+    bg = torch.zeros(3)
+    focal = 16 / (2 * math.tan(cfg.data.fov * math.pi / 360))
+
+    intrinsics = get_camera_intrinsics(cfg, torch.full((1, 2, 2), focal))
+    renders = [render_predicted(pc, view, view @ (torch.linalg.inv(world_view_transform) @ full_proj_transform),
+                                camera_center, bg, cfg, backend="torch", intrinsics=intrinsics[i])["render"]
+               for i, view in enumerate([world_view_transform, shifted])]
+    shared = get_camera_intrinsics(cfg)
+    for view in [shifted, world_view_transform]:
+        again = render_predicted(pc, view, view @ (torch.linalg.inv(world_view_transform) @ full_proj_transform),
+                                 camera_center, bg, cfg, backend="torch", intrinsics=shared)["render"]
+
+    assert len(intrinsics) == 2
+    assert len(shared.raster_settings) == 1
+    assert not torch.allclose(renders[0], renders[1])
+    assert torch.allclose(renders[0], again, atol=1e-6)
+
+def test_depth_order_cache_repairs_previous_order():
+    generator = torch.Generator().manual_seed(0)
+    depth = torch.rand(1000, generator=generator)
+    radii = (torch.rand(1000, generator=generator) > 0.2).int()
+    projected = ProjectedGaussians(xy=None, depth=depth, conic=None, opacity=None, colors=None,
+                                   radii=radii, rect_min=None, rect_max=None)
+    cache = DepthOrderCache(max_passes=4, max_swapped_fraction=0.01)
+
+    for step in range(3):
+        order = cache(projected)
+        assert torch.equal(order, depth_order(projected))
+        # swap the depths of a few neighbours
+        sorted_idx = torch.argsort(depth)
+        depth = depth.clone()
+        depth[sorted_idx[[10, 11, 500, 501]]] = depth[sorted_idx[[11, 10, 501, 500]]]
+        projected = projected._replace(depth=depth)
+
+    assert cache.num_full_sorts == 1 and cache.num_repairs == 2
+
+@torch.no_grad()
+def test_render_diagnostics():
+    cfg = get_cfg(resolution=32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(300)
+    pc["xyz"][:50, 0] += 3.0
+
+    diagnostics = render_predicted(pc, world_view_transform, full_proj_transform, camera_center,
+                                   torch.zeros(3), cfg, backend="torch", return_diagnostics=True)["diagnostics"]
+
+    assert diagnostics["tile_gaussian_counts"].shape == (2, 2)
+    assert diagnostics["overdraw"].shape == (32, 32)
+    assert diagnostics["visible_fraction"] <= 250 / 300
+    assert diagnostics["overdraw"].max() <= diagnostics["tile_gaussian_counts"].max()
+    assert diagnostics["mean_contributing_gaussians"] > 0
+
+@torch.no_grad()
+def test_scene_composer_matches_moved_camera():
+    cfg = get_cfg(resolution=32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pcs = [get_gaussians(200, seed=seed) for seed in range(2)]
+    for pc in pcs:
+        pc["xyz"] -= torch.tensor([0.0, 0.0, 2.0])
+    composer = SceneComposer(pcs)
+    bg = torch.zeros(3)
+
+    # identity transforms concatenate the objects
+    composed = composer.render(world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                               translations=torch.tensor([[0.0, 0.0, 2.0], [0.0, 0.0, 2.0]]),
+                               backend="torch")["render"]
+    concatenated = {k: torch.cat([pc[k] for pc in pcs]) for k in pcs[0].keys()}
+    concatenated["xyz"] = concatenated["xyz"] + torch.tensor([0.0, 0.0, 2.0])
+    expected = render_predicted(concatenated, world_view_transform, full_proj_transform, camera_center,
+                                bg, cfg, backend="torch")["render"]
+    assert torch.allclose(composed, expected, atol=1e-5)
+
+    # moving a single object is the same as moving the camera the other way
+    q = torch.nn.functional.normalize(torch.tensor([0.9, 0.2, -0.3, 0.1]), dim=0)
+    t = torch.tensor([0.1, -0.05, 2.0])
+    R = build_rotation(q.unsqueeze(0))[0]
+    single = SceneComposer(pcs[:1])
+    moved = single.render(world_view_transform, full_proj_transform, camera_center, bg, cfg,
+                          rotations=q.unsqueeze(0), translations=t.unsqueeze(0), backend="torch")["render"]
+    object_to_world = torch.eye(4)
+    object_to_world[:3, :3] = R.transpose(0, 1)
+    object_to_world[3, :3] = t
+    camera_moved = render_predicted(pcs[0], object_to_world @ world_view_transform,
+                                    object_to_world @ full_proj_transform,
+                                    R.transpose(0, 1) @ (camera_center - t), bg, cfg, backend="torch")["render"]
+    assert torch.allclose(moved, camera_moved, atol=1e-4)
+
+@torch.no_grad()
+def test_parallel_loop_matches_render_batch():
+    cfg = get_cfg(resolution=32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    projection_matrix = torch.linalg.inv(world_view_transform) @ full_proj_transform
+    world_view_transforms = world_view_transform.repeat(5, 1, 1)
+    world_view_transforms[:, 3, 0] = torch.linspace(-0.2, 0.2, 5)
+    full_proj_transforms = world_view_transforms @ projection_matrix
+    camera_centers = torch.linalg.inv(world_view_transforms)[:, 3, :3]
+    pc = get_gaussians(300)
+    bg = torch.ones(3)
+
+    assert get_chunks(5, 2) == [(0, 2), (2, 5)]
+    expected = render_batch({k: v.unsqueeze(0) for k, v in pc.items()},
+                            world_view_transforms.unsqueeze(0), full_proj_transforms.unsqueeze(0),
+                            camera_centers.unsqueeze(0), bg, cfg, backend="cpu_fast")["render"]
+    frames = render_loop_parallel(pc, world_view_transforms, full_proj_transforms, camera_centers,
+                                  bg, cfg, num_workers=2)["render"]
+    assert torch.allclose(frames, expected, atol=1e-5)
+    # the workers of a pool render several loops
+    with RenderPool(2) as pool:
+        for reuse_depth_order in [False, True]:
+            frames = render_loop_parallel(pc, world_view_transforms, full_proj_transforms, camera_centers,
+                                          bg, cfg, reuse_depth_order=reuse_depth_order, pool=pool)["render"]
+            assert torch.allclose(frames, expected, atol=1e-5)
+
+def test_backends_match_golden_images():
+    golden = load_golden(1000, 64, 4)
+    assert golden is not None
+    for backend in ["torch", "cpu_fast"]:
+        frames, _ = render_case(backend, 1000, 64, 4)
+        for v_idx in range(4):
+            assert psnr(frames[v_idx], golden[v_idx]) >= MIN_PSNR
+
+@torch.no_grad()
+def test_lod_pyramid_levels_follow_projected_size():
+    pc = get_gaussians(16 * 16)
+    pyramid = LODPyramid(pc, grid_size=16, num_levels=3)
+    assert [level["xyz"].shape[0] for level in pyramid.levels] == [256, 64, 16]
+
+    bg = torch.zeros(3)
+    levels = []
+    for resolution in [64, 4]:
+        cfg = get_cfg(resolution=resolution)
+        world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+        cameras = [t.expand(1, 1, *t.shape) for t in (world_view_transform, full_proj_transform, camera_center)]
+        out = render_batch({k: v.unsqueeze(0) for k, v in pc.items()}, *cameras, bg, cfg, backend="torch",
+                           lod_pyramids=[pyramid])
+        level = out["lod_levels"][0]
+        expected = render_predicted(pyramid.levels[level], world_view_transform, full_proj_transform,
+                                    camera_center, bg, cfg, backend="torch")["render"]
+        assert torch.allclose(out["render"][0], expected, atol=1e-5)
+        levels.append(level)
+    # the full reconstruction for large renders, a coarser level for thumbnails
+    assert levels[0] == 0 and levels[1] > 0
+
+    # levels of a batch of views, from the depths copied to the host at once
+    cfg = get_cfg(resolution=16)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    world_view_transforms = world_view_transform.repeat(3, 1, 1)
+    world_view_transforms[:, 3, 2] = torch.tensor([0.0, 1.0, 4.0])
+    out = render_batch({k: v.unsqueeze(0) for k, v in pc.items()}, world_view_transforms.unsqueeze(0),
+                       full_proj_transform.expand(1, 3, 4, 4), camera_center.expand(1, 3, 3), bg, cfg,
+                       backend="torch", lod_pyramids=[pyramid])
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    assert out["lod_levels"] == [pyramid.select_level(t, tanfov, tanfov, 16, 16) for t in world_view_transforms]
+    assert len(set(out["lod_levels"])) > 1
+    # the parallel turntable picks the same levels
+    parallel = render_loop_parallel(pc, world_view_transforms, full_proj_transform.expand(3, 4, 4),
+                                    camera_center.expand(3, 3), bg, cfg, num_workers=1, backend="torch",
+                                    lod_pyramid=pyramid)
+    assert parallel["lod_levels"] == out["lod_levels"]
+    assert torch.allclose(parallel["render"], out["render"], atol=1e-5)
+
+@torch.no_grad()
+def test_indexed_culling_matches_full_culling():
+    cfg = get_culling_cfg(32)
+    world_view_transform, full_proj_transform, camera_center = get_camera(cfg)
+    pc = get_gaussians(32 * 32)
+    pc["xyz"] = pc["xyz"] * torch.tensor([6.0, 6.0, 1.0])
+    tanfov = math.tan(cfg.data.fov * math.pi / 360)
+    args = (pc, world_view_transform, full_proj_transform, tanfov, tanfov, 32, 32, get_culling_settings(cfg))
+
+    kept = cull_gaussians(*args)
+    assert kept.shape[0] < 32 * 32
+    assert torch.equal(cull_gaussians(*args, spatial_index=build_culling_index(pc)), kept)
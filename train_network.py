@@ -11,12 +11,15 @@ from torch.utils.data import Sampler
 from lightning.fabric import Fabric
 from ema_pytorch import EMA
 from omegaconf import DictConfig, OmegaConf
-from utils.general_utils import safe_state
+from utils.general_utils import safe_state, get_foreground_rois
 from utils.loss_utils import l1_loss, l2_loss
+from utils.splatter_image import SplatterImage
 import lpips as lpips_lib
 from eval import evaluate_dataset
-from gaussian_renderer import render_predicted
+from gaussian_renderer import render_batch
+from gaussian_renderer.culling import get_culling_settings
 from scene.gaussian_predictor import GaussianSplatPredictor
+from datasets.cache import SharedExampleCache
 from datasets.dataset_factory import get_dataset
 from torch.utils.data import DataLoader, SequentialSampler
 from torch.utils.data import Dataset
@@ -88,6 +91,11 @@ def normalize_channels_min_max(tensor):
 
 def custom_loss_fn_batched(target_reconstructions, gaussian_splats):
     total_loss = 0.0
+    # SplatterImages are read through dictionaries of views of their buffers
+    if isinstance(target_reconstructions, SplatterImage):
+        target_reconstructions = target_reconstructions.to_dict()
+    if isinstance(gaussian_splats, SplatterImage):
+        gaussian_splats = gaussian_splats.to_dict()
 
     # Ensure the shapes match by squeezing unnecessary dimensions
     target_reconstructions['xyz'] = target_reconstructions['xyz'].squeeze(dim=1)
@@ -165,11 +173,13 @@ def main(cfg: DictConfig):
 
   
     torch.set_float32_matmul_precision('high')
+    # CPU hosts train with the pure PyTorch rasterizer (render.backend: torch)
+    accelerator = "cuda" if torch.cuda.is_available() else "cpu"
     if cfg.general.mixed_precision:
-        fabric = Fabric(accelerator="cuda", devices=cfg.general.num_devices, strategy="ddp",
+        fabric = Fabric(accelerator=accelerator, devices=cfg.general.num_devices, strategy="ddp",
                         precision="16-mixed")
     else:
-        fabric = Fabric(accelerator="cuda", devices=cfg.general.num_devices, strategy="ddp")
+        fabric = Fabric(accelerator=accelerator, devices=cfg.general.num_devices, strategy="ddp")
     fabric.launch()
 
     if fabric.is_global_zero:
@@ -264,6 +274,12 @@ def main(cfg: DictConfig):
     if cfg.data.category in ["nmr", "objaverse"]:
         num_workers = 12
         persistent_workers = True
+    elif cfg.data.get("shared_cache_mb", 0) > 0 or cfg.data.get("cache_mb", -1) >= 0:
+        # workers decode every object once for all of them (shared cache)
+        # or keep at most cache_mb each, unbounded caches in every worker
+        # would grow to the whole split
+        num_workers = 4
+        persistent_workers = True
     else:
         num_workers = 0
         persistent_workers = False
@@ -367,31 +383,32 @@ def main(cfg: DictConfig):
             # Render
             l12_loss_sum = 0.0
             lpips_loss_sum = 0.0
-            rendered_images = []
-            gt_images = []
-            for b_idx in range(data["gt_images"].shape[0]):
-                # image at index 0 is training, remaining images are targets
-                # Rendering is done sequentially because gaussian rasterization code
-                # does not support batching
-                gaussian_splat_batch = {k: v[b_idx].contiguous() for k, v in gaussian_splats.items()}
-                for r_idx in range(cfg.data.input_images, data["gt_images"].shape[1]):
-                    if "focals_pixels" in data.keys():
-                        focals_pixels_render = data["focals_pixels"][b_idx, r_idx].cpu()
-                    else:
-                        focals_pixels_render = None
-                    image = render_predicted(gaussian_splat_batch, 
-                                        data["world_view_transforms"][b_idx, r_idx],
-                                        data["full_proj_transforms"][b_idx, r_idx],
-                                        data["camera_centers"][b_idx, r_idx],
-                                        background,
-                                        cfg,
-                                        focals_pixels=focals_pixels_render)["render"]
-                    # Put in a list for a later loss computation
-                    rendered_images.append(image)
-                    gt_image = data["gt_images"][b_idx, r_idx]
-                    gt_images.append(gt_image)
-            rendered_images = torch.stack(rendered_images, dim=0)
-            gt_images = torch.stack(gt_images, dim=0)
+            # image at index 0 is training, remaining images are targets
+            if "focals_pixels" in data.keys():
+                focals_pixels_render = data["focals_pixels"][:, cfg.data.input_images:]
+            else:
+                focals_pixels_render = None
+            gt_images = data["gt_images"][:, cfg.data.input_images:].flatten(0, 1)
+            if cfg.opt.foreground_roi:
+                # rasterize only the foreground bounding box of every target view
+                if "fg_masks" in data.keys():
+                    fg_masks = data["fg_masks"][:, cfg.data.input_images:].flatten(0, 1)
+                else:
+                    fg_masks = None
+                rois = get_foreground_rois(gt_images, background, fg_masks)
+            else:
+                rois = None
+            rendered_batch = render_batch(gaussian_splats,
+                                          data["world_view_transforms"][:, cfg.data.input_images:],
+                                          data["full_proj_transforms"][:, cfg.data.input_images:],
+                                          data["camera_centers"][:, cfg.data.input_images:],
+                                          background,
+                                          cfg,
+                                          focals_pixels=focals_pixels_render,
+                                          rois=rois)
+            rendered_images = rendered_batch["render"]
+            image = rendered_images[-1]
+            gt_image = gt_images[-1]
             # Loss computation
             l12_loss_sum = loss_fn(rendered_images, gt_images) 
             if cfg.opt.lambda_lpips != 0:
@@ -438,6 +455,12 @@ def main(cfg: DictConfig):
                         "custom_loss": np.log10(custom_loss.cpu().item() + 1e-8),  # Move to CPU and then get item
                         "custom_lambda": custom_lambda
                     }, step=iteration)
+                    if get_culling_settings(cfg) is not None:
+                        wandb.log({"culled_fraction": rendered_batch["culled_fraction"]}, step=iteration)
+                    if getattr(dataset, "cache", None) is not None and \
+                            (num_workers == 0 or isinstance(dataset.cache, SharedExampleCache)):
+                        # with workers the local caches are not visible here, the shared one is
+                        wandb.log({"data_cache_" + k: v for k, v in dataset.cache.stats().items()}, step=iteration)
 
                     if cfg.opt.lambda_lpips != 0:
                         wandb.log({"training_l12_loss": np.log10(l12_loss_sum.item() + 1e-8)}, step=iteration)
@@ -486,23 +509,20 @@ def main(cfg: DictConfig):
                                                         rot_transform_quats,
                                                         focals_pixels_pred)
 
-                    test_loop = []
+                    # We don't change the input or output of the network, just the rendering cameras
+                    test_images = render_batch({k: v[:1] for k, v in gaussian_splats_vis.items()},
+                                               vis_data["world_view_transforms"][:1],
+                                               vis_data["full_proj_transforms"][:1],
+                                               vis_data["camera_centers"][:1],
+                                               background,
+                                               cfg,
+                                               focals_pixels=vis_data["focals_pixels"][:1] \
+                                                if "focals_pixels" in vis_data.keys() else None)["render"]
                     test_loop_gt = []
+                    test_loop = []
                     for r_idx in range(vis_data["gt_images"].shape[1]):
-                        # We don't change the input or output of the network, just the rendering cameras
-                        if "focals_pixels" in vis_data.keys():
-                            focals_pixels_render = vis_data["focals_pixels"][0, r_idx]
-                        else:
-                            focals_pixels_render = None
-                        test_image = render_predicted({k: v[0].contiguous() for k, v in gaussian_splats_vis.items()}, 
-                                            vis_data["world_view_transforms"][0, r_idx], 
-                                            vis_data["full_proj_transforms"][0, r_idx], 
-                                            vis_data["camera_centers"][0, r_idx],
-                                            background,
-                                            cfg,
-                                            focals_pixels=focals_pixels_render)["render"]
                         test_loop_gt.append((np.clip(vis_data["gt_images"][0, r_idx].detach().cpu().numpy(), 0, 1)*255).astype(np.uint8))
-                        test_loop.append((np.clip(test_image.detach().cpu().numpy(), 0, 1)*255).astype(np.uint8))
+                        test_loop.append((np.clip(test_images[r_idx].detach().cpu().numpy(), 0, 1)*255).astype(np.uint8))
         
                     wandb.log({"rot": wandb.Video(np.asarray(test_loop), fps=20, format="mp4")},
                         step=iteration)
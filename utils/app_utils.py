@@ -9,6 +9,8 @@ import torch
 from .camera_utils import get_loop_cameras
 from .graphics_utils import getProjectionMatrix
 from .general_utils import matrix_to_quaternion, quaternion_raw_multiply
+from .mesh_utils import export_mesh_to_obj, extract_mesh
+from .splatter_image import SplatterImage
 import math
 
 def remove_background(image, rembg_session):
@@ -142,13 +144,34 @@ def construct_list_of_attributes():
         l.append('rot_{}'.format(i))
     return l
 
+def get_visualisation_transform():
+    """
+    Rotation applied to row-vector locations for visualisation in Gradio.
+    """
+    t1 = torch.tensor([[1,  0, 0],
+                        [0,  0, 1],
+                        [0, -1, 0]], dtype=torch.float32)
+    angle1 = 30 * math.pi * 2 / 360
+    t2 = torch.tensor([[math.cos(angle1),  -math.sin(angle1), 0],
+                       [math.sin(angle1),  math.cos(angle1), 0],
+                       [0, 0, 1]], dtype=torch.float32)
+    angle2 = -60 * math.pi * 2 / 360
+    t3 = torch.tensor([[math.cos(angle2), 0, math.sin(angle2)],
+                       [0,  1, 0],
+                       [-math.sin(angle2), 0, math.cos(angle2)]], dtype=torch.float32)
+
+    return (t1 @ t2)@ t3
+
 @torch.no_grad()
 def export_to_obj(reconstruction, ply_out_path):
     """
     Args:
-      reconstruction: dict with xyz, opacity, features dc, etc with leading batch size
+      reconstruction: dict with xyz, opacity, features dc, etc with leading batch size,
+        or a SplatterImage
       ply_out_path: file path where to save the output
     """
+    if isinstance(reconstruction, SplatterImage):
+        reconstruction = reconstruction.to_dict()
     os.makedirs(os.path.dirname(ply_out_path), exist_ok=True)
 
     for k, v in reconstruction.items():
@@ -165,19 +188,7 @@ def export_to_obj(reconstruction, ply_out_path):
     # transforms for visualisation in Gradio
     # ============= Transform locations =============
     xyz = reconstruction["xyz"][valid_gaussians].detach().cpu().clone()
-    t1 = torch.tensor([[1,  0, 0],
-                        [0,  0, 1],
-                        [0, -1, 0]], dtype=torch.float32)
-    angle1 = 30 * math.pi * 2 / 360
-    t2 = torch.tensor([[math.cos(angle1),  -math.sin(angle1), 0],
-                       [math.sin(angle1),  math.cos(angle1), 0],
-                       [0, 0, 1]], dtype=torch.float32)
-    angle2 = -60 * math.pi * 2 / 360
-    t3 = torch.tensor([[math.cos(angle2), 0, math.sin(angle2)],
-                       [0,  1, 0],
-                       [-math.sin(angle2), 0, math.cos(angle2)]], dtype=torch.float32)
-
-    overall_transform_matrix = (t1 @ t2)@ t3
+    overall_transform_matrix = get_visualisation_transform()
 
     xyz = torch.matmul(xyz, overall_transform_matrix).numpy()
     normals = np.zeros_like(xyz)
@@ -204,3 +215,16 @@ def export_to_obj(reconstruction, ply_out_path):
     elements[:] = list(map(tuple, attributes))
     el = PlyElement.describe(elements, 'vertex')
     PlyData([el]).write(ply_out_path)
+
+@torch.no_grad()
+def export_mesh(reconstruction, obj_out_path, resolution=256, level=0.5):
+    """
+    Extracts a coloured mesh from the density of the Gaussians and writes it
+    to .obj, in the same coordinates as export_to_obj.
+    Args:
+      reconstruction: activated reconstruction without a batch dimension
+      resolution: grid points along every axis of the density grid
+    """
+    vertices, faces, colours = extract_mesh(reconstruction, resolution=resolution, level=level)
+    vertices = vertices.cpu() @ get_visualisation_transform()
+    export_mesh_to_obj(vertices, faces, colours, obj_out_path)
@@ -62,7 +62,7 @@ def get_expon_lr_func(
     return helper
 
 def strip_lowerdiag(L):
-    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device="cuda")
+    uncertainty = torch.zeros((L.shape[0], 6), dtype=torch.float, device=L.device)
 
     uncertainty[:, 0] = L[:, 0, 0]
     uncertainty[:, 1] = L[:, 0, 1]
@@ -150,12 +150,49 @@ def matrix_to_quaternion(M: torch.Tensor) -> torch.Tensor:
 
     return torch.stack([r, x, y, z], dim=-1)
 
+def matrix_to_quaternion_batch(M: torch.Tensor) -> torch.Tensor:
+    """
+    matrix_to_quaternion of every matrix in a batch, with the same branches
+    chosen per matrix.
+    Args:
+        M: rotation matrices, (N x 3 x 3)
+    Returns:
+        q: quaternions of shape (N x 4)
+    """
+    m00, m11, m22 = M[:, 0, 0], M[:, 1, 1], M[:, 2, 2]
+    tr = 1 + m00 + m11 + m22
+    # quaternions of every branch, the invalid ones are not selected
+    r = torch.sqrt(tr) / 2.0
+    q_tr = torch.stack([r,
+                        (M[:, 2, 1] - M[:, 1, 2]) / (4 * r),
+                        (M[:, 0, 2] - M[:, 2, 0]) / (4 * r),
+                        (M[:, 1, 0] - M[:, 0, 1]) / (4 * r)], dim=-1)
+    S = torch.sqrt(1.0 + m00 - m11 - m22) * 2 # S=4*qx
+    q_x = torch.stack([(M[:, 2, 1] - M[:, 1, 2]) / S,
+                       0.25 * S,
+                       (M[:, 0, 1] + M[:, 1, 0]) / S,
+                       (M[:, 0, 2] + M[:, 2, 0]) / S], dim=-1)
+    S = torch.sqrt(1.0 + m11 - m00 - m22) * 2 # S=4*qy
+    q_y = torch.stack([(M[:, 0, 2] - M[:, 2, 0]) / S,
+                       (M[:, 0, 1] + M[:, 1, 0]) / S,
+                       0.25 * S,
+                       (M[:, 1, 2] + M[:, 2, 1]) / S], dim=-1)
+    S = torch.sqrt(1.0 + m22 - m00 - m11) * 2 # S=4*qz
+    q_z = torch.stack([(M[:, 1, 0] - M[:, 0, 1]) / S,
+                       (M[:, 0, 2] + M[:, 2, 0]) / S,
+                       (M[:, 1, 2] + M[:, 2, 1]) / S,
+                       0.25 * S], dim=-1)
+
+    q = torch.where((m11 > m22).unsqueeze(-1), q_y, q_z)
+    q = torch.where(((m00 > m11) & (m00 > m22)).unsqueeze(-1), q_x, q)
+    return torch.where((tr > 0).unsqueeze(-1), q_tr, q)
+
 def build_rotation(r):
     norm = torch.sqrt(r[:,0]*r[:,0] + r[:,1]*r[:,1] + r[:,2]*r[:,2] + r[:,3]*r[:,3])
 
     q = r / norm[:, None]
 
-    R = torch.zeros((q.size(0), 3, 3), device='cuda')
+    R = torch.zeros((q.size(0), 3, 3), device=r.device)
 
     r = q[:, 0]
     x = q[:, 1]
@@ -174,7 +211,7 @@ def build_rotation(r):
     return R
 
 def build_scaling_rotation(s, r):
-    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device="cuda")
+    L = torch.zeros((s.shape[0], 3, 3), dtype=torch.float, device=s.device)
     R = build_rotation(r)
 
     L[:,0,0] = s[:,0]
@@ -184,6 +221,40 @@ def build_scaling_rotation(s, r):
     L = R @ L
     return L
 
+def get_foreground_rois(images, bg_color, fg_masks=None, margin=2, align=16):
+    """
+    Pixel windows (x0, y0, x1, y1) bounding the foreground of every image,
+    grown by margin and aligned to align pixels (the rasterizer tile size).
+    The foreground is taken from fg_masks if given, otherwise it is every
+    pixel that differs from the background. Images without foreground get
+    the full frame.
+    Args:
+        images: [M, 3, H, W]
+        fg_masks: [M, 1, H, W] or None
+    Returns a LongTensor [M, 4].
+    """
+    M, _, H, W = images.shape
+    if fg_masks is not None:
+        foreground = fg_masks[:, 0] > 0
+    else:
+        foreground = torch.any(torch.abs(images - bg_color.reshape(1, -1, 1, 1)) > 1.0 / 255.0, dim=1)
+    rows = torch.any(foreground, dim=2)
+    cols = torch.any(foreground, dim=1)
+    ys = torch.arange(H, device=images.device)
+    xs = torch.arange(W, device=images.device)
+    y0 = torch.where(rows, ys, H).min(dim=1).values
+    y1 = torch.where(rows, ys + 1, 0).max(dim=1).values
+    x0 = torch.where(cols, xs, W).min(dim=1).values
+    x1 = torch.where(cols, xs + 1, 0).max(dim=1).values
+    rois = torch.stack([torch.div(x0 - margin, align, rounding_mode="floor") * align,
+                        torch.div(y0 - margin, align, rounding_mode="floor") * align,
+                        -torch.div(-(x1 + margin), align, rounding_mode="floor") * align,
+                        -torch.div(-(y1 + margin), align, rounding_mode="floor") * align], dim=1)
+    rois = torch.minimum(rois.clamp_min(0), torch.tensor([W, H, W, H], device=images.device))
+    empty = ~torch.any(rows, dim=1)
+    rois[empty] = torch.tensor([0, 0, W, H], device=images.device)
+    return rois
+
 def safe_state(cfg, silent=False):
     old_f = sys.stdout
     class F:
@@ -205,7 +276,10 @@ def safe_state(cfg, silent=False):
     random.seed(cfg.general.random_seed)
     np.random.seed(cfg.general.random_seed)
     torch.manual_seed(cfg.general.random_seed)
-    device = torch.device("cuda:{}".format(cfg.general.device))
-    torch.cuda.set_device(device)
+    if torch.cuda.is_available():
+        device = torch.device("cuda:{}".format(cfg.general.device))
+        torch.cuda.set_device(device)
+    else:
+        device = torch.device("cpu")
 
     return device
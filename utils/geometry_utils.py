@@ -0,0 +1,69 @@
+"""
+Geometry metrics of reconstructions against reference point clouds, e.g. the
+sequence point clouds of CO3D. Points are sampled from the Gaussians with
+probability proportional to their opacity and compared to the reference with
+the Chamfer distance and the F-score at a distance threshold. Nearest
+neighbours are found with a SpatialIndex over every cloud.
+"""
+
+import torch
+
+from .spatial_index import SpatialIndex
+
+def sample_gaussian_points(pc, num_points, generator=None):
+    """
+    Means [num_points, 3] of Gaussians drawn with probability proportional to
+    their opacity (with replacement).
+    Args:
+        pc: activated reconstruction without a batch dimension
+    """
+    opacity = pc["opacity"].reshape(-1).float()
+    if not torch.any(opacity > 0):
+        raise ValueError("Cannot sample points from a fully transparent reconstruction")
+    if generator is None:
+        idx = torch.multinomial(opacity, num_points, replacement=True)
+    else:
+        idx = torch.multinomial(opacity.cpu(), num_points, replacement=True, generator=generator).to(opacity.device)
+    return pc["xyz"][idx].detach()
+
+def nearest_distances(points, reference):
+    """
+    Distance [P] of every point [P, 3] to its nearest reference point [R, 3].
+    """
+    distances, _ = SpatialIndex(reference).knn(points, k=1)
+    return distances[:, 0]
+
+def chamfer_and_fscore(points, reference, threshold=0.05):
+    """
+    Compares two point clouds [P, 3] and [R, 3].
+    Returns a dict with the symmetric Chamfer distance (mean of the average
+    nearest neighbour distances in both directions), the precision (share of
+    points within threshold of the reference), the recall (share of
+    reference points within threshold of the points) and their F-score.
+    """
+    to_reference = nearest_distances(points, reference)
+    to_points = nearest_distances(reference, points)
+    precision = (to_reference <= threshold).float().mean().item()
+    recall = (to_points <= threshold).float().mean().item()
+    fscore = 0.0 if precision + recall == 0 else 2 * precision * recall / (precision + recall)
+    return {"chamfer": 0.5 * (to_reference.mean().item() + to_points.mean().item()),
+            "precision": precision,
+            "recall": recall,
+            "fscore": fscore}
+
+@torch.no_grad()
+def evaluate_geometry(pc, reference, num_points=10000, threshold=0.05, generator=None):
+    """
+    Geometry metrics (chamfer_and_fscore) of a reconstruction without a
+    batch dimension against the reference point cloud [R, 3], in the same
+    coordinates. At most num_points reference points are used.
+    """
+    points = sample_gaussian_points(pc, num_points, generator=generator)
+    reference = reference.to(points.device, points.dtype)
+    if reference.shape[0] > num_points:
+        if generator is None:
+            keep = torch.randperm(reference.shape[0], device=reference.device)[:num_points]
+        else:
+            keep = torch.randperm(reference.shape[0], generator=generator)[:num_points].to(reference.device)
+        reference = reference[keep]
+    return chamfer_and_fscore(points, reference, threshold)
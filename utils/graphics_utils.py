@@ -19,6 +19,15 @@ class BasicPointCloud(NamedTuple):
     colors : np.array
     normals : np.array
 
+class CameraIntrinsics(NamedTuple):
+    tanfovx : float
+    tanfovy : float
+    image_height : int
+    image_width : int
+    # rasterization settings built for these intrinsics, keyed by backend,
+    # rendered size, scale modifier and SH degree
+    raster_settings : dict = None
+
 def geom_transform_points(points, transf_matrix):
     P, _ = points.shape
     ones = torch.ones(P, 1, dtype=points.dtype, device=points.device)
@@ -28,6 +37,19 @@ def geom_transform_points(points, transf_matrix):
     denom = points_out[..., 3:] + 0.0000001
     return (points_out[..., :3] / denom).squeeze(dim=0)
 
+def invert_rigid_transforms(transforms):
+    """
+    Inverses of rigid transforms [..., 4, 4] in the row-major convention of
+    the cameras (rotation in [:3, :3], translation in [3, :3]), computed with
+    a transposed rotation instead of a general inverse.
+    """
+    rotations = transforms[..., :3, :3].transpose(-1, -2)
+    inverses = torch.zeros_like(transforms)
+    inverses[..., :3, :3] = rotations
+    inverses[..., 3:, :3] = -transforms[..., 3:, :3] @ rotations
+    inverses[..., 3, 3] = 1.0
+    return inverses
+
 def getWorld2View(R, t):
     Rt = np.zeros((4, 4))
     Rt[:3, :3] = R.transpose()
@@ -83,6 +105,19 @@ def getProjectionMatrix(znear, zfar, fovX, fovY):
     P[2, 3] = -(zfar * znear) / (zfar - znear)
     return P
 
+def getCropMatrix(x0, y0, x1, y1, width, height):
+    """
+    Maps clip coordinates of a width x height image to the clip coordinates
+    of its pixel window [x0, x1) x [y0, y1), turning a projection matrix P
+    into the off-centre one of the window (C @ P).
+    """
+    C = torch.eye(4)
+    C[0, 0] = width / (x1 - x0)
+    C[0, 3] = (width - 2 * x0 - (x1 - x0)) / (x1 - x0)
+    C[1, 1] = height / (y1 - y0)
+    C[1, 3] = (height - 2 * y0 - (y1 - y0)) / (y1 - y0)
+    return C
+
 def fov2focal(fov, pixels):
     return pixels / (2 * math.tan(fov / 2))
 
@@ -0,0 +1,343 @@
+"""
+Mesh extraction from reconstructions. The density of the Gaussian mixture,
+sum_i opacity_i exp(-0.5 d_i^T Sigma_i^-1 d_i), is evaluated on a regular
+grid chunk by chunk: every chunk only evaluates the Gaussians whose 3 sigma
+box (smaller for faint Gaussians) overlaps it, and only at the grid points inside that box, which keeps the
+memory bounded by the chunk size and the number of pairs evaluated at once.
+An iso-surface of the density is extracted with marching tetrahedra (every
+grid cell split into 6 tetrahedra along its main diagonal, which needs 16
+cases instead of the 256 of marching cubes and gives watertight surfaces),
+and the vertices are coloured with the SH DC colours of the Gaussians
+averaged with their densities, accumulated on a coarser grid.
+"""
+
+import os
+
+import torch
+
+from .general_utils import build_rotation
+from .sh_utils import SH2RGB
+
+# corners of a grid cell and its split into tetrahedra sharing the diagonal 0-6
+CELL_CORNERS = torch.tensor([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                             [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
+CELL_TETRAHEDRA = torch.tensor([[0, 5, 1, 6], [0, 1, 2, 6], [0, 2, 3, 6],
+                                [0, 3, 7, 6], [0, 7, 4, 6], [0, 4, 5, 6]])
+
+def get_tetrahedron_table():
+    """
+    Triangles of the 16 above / below level cases of the tetrahedra of a
+    cell, as pairs of tetrahedron corners whose edge holds a vertex
+    [6, 16, 2, 3, 2] (padded with repeated triangles), and the number of
+    triangles of every case. The triangles face the corners below the level.
+    """
+    table = torch.zeros(len(CELL_TETRAHEDRA), 16, 2, 3, 2, dtype=torch.long)
+    counts = torch.zeros(16, dtype=torch.long)
+    for case in range(16):
+        above = [c for c in range(4) if case & (1 << c)]
+        below = [c for c in range(4) if not case & (1 << c)]
+        if len(above) in [0, 4]:
+            continue
+        if len(above) == 1 or len(below) == 1:
+            single, others = (above[0], below) if len(above) == 1 else (below[0], above)
+            triangles = [[[single, o] for o in others]] * 2
+            counts[case] = 1
+        else:
+            (a0, a1), (b0, b1) = above, below
+            quad = [[a0, b0], [a0, b1], [a1, b1], [a1, b0]]
+            triangles = [[quad[0], quad[1], quad[2]], [quad[0], quad[2], quad[3]]]
+            counts[case] = 2
+        for t, tetrahedron in enumerate(CELL_TETRAHEDRA):
+            # the orientation does not change when the vertices move along
+            # their edges, check it with the midpoints
+            corners = CELL_CORNERS[tetrahedron].float()
+            direction = corners[below].mean(dim=0) - corners[above].mean(dim=0)
+            for i, triangle in enumerate(triangles):
+                vertices = corners[torch.tensor(triangle)].mean(dim=1)
+                normal = torch.cross(vertices[1] - vertices[0], vertices[2] - vertices[0], dim=0)
+                table[t, case, i] = torch.tensor(triangle if torch.dot(normal, direction) > 0 else triangle[::-1])
+    return table, counts
+
+TETRAHEDRON_TABLE, TETRAHEDRON_TRIANGLE_COUNTS = get_tetrahedron_table()
+# grid offsets from the first to the second corner of the tetrahedron edges
+CELL_EDGE_OFFSETS = [(1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (1, 0, 1), (0, 1, 1), (1, 1, 1)]
+
+def get_cell_edges():
+    """
+    The 19 edges of the tetrahedra of a cell, as (first, second) cell corners
+    along one of CELL_EDGE_OFFSETS, and TETRAHEDRON_TABLE with the indices of
+    these edges in place of the corner pairs [6, 16, 2, 3].
+    """
+    edges = []
+    for tetrahedron in CELL_TETRAHEDRA.tolist():
+        for i in range(4):
+            for j in range(4):
+                offset = (CELL_CORNERS[tetrahedron[j]] - CELL_CORNERS[tetrahedron[i]]).tolist()
+                if tuple(offset) in CELL_EDGE_OFFSETS and (tetrahedron[i], tetrahedron[j]) not in edges:
+                    edges.append((tetrahedron[i], tetrahedron[j]))
+    corner_pairs = CELL_TETRAHEDRA.reshape(-1, 1, 1, 1, 4).expand(-1, 16, 2, 3, -1).gather(4, TETRAHEDRON_TABLE)
+    edge_index = torch.zeros(8, 8, dtype=torch.long)
+    for e, (a, b) in enumerate(edges):
+        edge_index[a, b] = edge_index[b, a] = e
+    return edges, edge_index[corner_pairs[..., 0], corner_pairs[..., 1]]
+
+CELL_EDGES, TETRAHEDRON_EDGE_TABLE = get_cell_edges()
+
+def get_cell_triangles():
+    """
+    Triangles of the 256 above / below level cases of the corners of a cell,
+    as indices of the CELL_EDGES holding their vertices [256, 12, 3] (padded
+    with zeros), and the number of triangles of every case.
+    """
+    table = torch.zeros(256, 2 * len(CELL_TETRAHEDRA), 3, dtype=torch.long)
+    counts = torch.zeros(256, dtype=torch.long)
+    for code in range(256):
+        for t, tetrahedron in enumerate(CELL_TETRAHEDRA.tolist()):
+            case = sum(1 << c for c in range(4) if code & (1 << tetrahedron[c]))
+            for i in range(TETRAHEDRON_TRIANGLE_COUNTS[case]):
+                table[code, counts[code]] = TETRAHEDRON_EDGE_TABLE[t, case, i]
+                counts[code] += 1
+    return table, counts
+
+CELL_TRIANGLES, CELL_TRIANGLE_COUNTS = get_cell_triangles()
+
+def get_inverse_covariances(pc):
+    """
+    [N, 3, 3] inverse covariances R S^-2 R^T and [N, 3] 3 sigma extents of
+    the Gaussians along the axes.
+    """
+    R = build_rotation(pc["rotation"])
+    scaling = pc["scaling"].clamp_min(1e-8)
+    inverse_covariances = (R / scaling.unsqueeze(1) ** 2) @ R.transpose(1, 2)
+    variances = torch.sum((R * scaling.unsqueeze(1)) ** 2, dim=2)
+    return inverse_covariances, 3.0 * torch.sqrt(variances)
+
+def get_grid_bounds(pc, opacity_threshold=1.0 / 255.0, padding=0.05):
+    """
+    Bounding box of the means of the visible Gaussians, padded by a fraction
+    of its largest side.
+    """
+    visible = pc["opacity"].reshape(-1) >= opacity_threshold
+    xyz = pc["xyz"][visible] if torch.any(visible) else pc["xyz"]
+    low, high = xyz.min(dim=0).values, xyz.max(dim=0).values
+    margin = padding * (high - low).max()
+    return low - margin, high + margin
+
+@torch.no_grad()
+def evaluate_density_grid(pc, resolution=256, bounds=None, chunk_size=256, max_pairs=2 ** 22,
+                          opacity_threshold=1.0 / 255.0, colours=False):
+    """
+    Density of the Gaussian mixture at the points of a regular grid, and
+    optionally the sums of the SH DC colours of the Gaussians weighted by
+    their densities.
+    Args:
+        pc: activated reconstruction without a batch dimension
+        resolution: grid points along every axis
+        bounds: (low [3], high [3]) corners of the grid, by default the padded
+            bounding box of the visible Gaussians
+        chunk_size: grid points along every axis of the chunks evaluated at
+            once
+        max_pairs: largest number of (Gaussian, grid point) pairs evaluated
+            at once
+        colours: also accumulate the [resolution]^3 x 3 colour sums, which
+            quadruples the memory of the grid
+    Returns the [resolution]^3 density indexed by x, y, z, the colour sums
+    (None without colours), the grid origin and the spacing of the grid
+    points.
+    """
+    device = pc["xyz"].device
+    low, high = get_grid_bounds(pc, opacity_threshold) if bounds is None else bounds
+    spacing = ((high - low) / (resolution - 1)).to(device)
+    low = low.to(device)
+
+    visible = pc["opacity"].reshape(-1) >= opacity_threshold
+    xyz = pc["xyz"][visible].float()
+    opacity = pc["opacity"].reshape(-1)[visible].float()
+    rgb = torch.clamp(SH2RGB(pc["features_dc"][visible][:, 0].float()), 0.0, 1.0) if colours else None
+    inverse_covariances, extents = get_inverse_covariances({k: pc[k][visible] for k in ["rotation", "scaling"]})
+    packed_inverse_covariances = inverse_covariances[:, [0, 1, 2, 0, 0, 1], [0, 1, 2, 1, 2, 2]]
+    # grid points covered by the box of every Gaussian: 3 sigma, or less for
+    # the faint ones, down to where their density falls below the threshold
+    extents = extents * torch.sqrt(2.0 * torch.log(opacity / opacity_threshold).clamp_min(0.0)
+                                   ).clamp_max(3.0).unsqueeze(1) / 3.0
+    first = torch.ceil((xyz - extents - low) / spacing).long().clamp_min(0)
+    last = torch.floor((xyz + extents - low) / spacing).long().clamp_max(resolution - 1)
+
+    density = torch.zeros((resolution,) * 3, device=device)
+    colour_sums = torch.zeros((resolution,) * 3 + (3,), device=device) if colours else None
+    stencil_sizes = get_stencil_sizes(chunk_size).to(device)
+    steps = range(0, resolution, chunk_size)
+    for x0 in steps:
+        for y0 in steps:
+            for z0 in steps:
+                chunk_first = torch.tensor([x0, y0, z0], device=device)
+                chunk_last = (chunk_first + chunk_size - 1).clamp_max(resolution - 1)
+                lo = torch.maximum(first, chunk_first)
+                sizes = (torch.minimum(last, chunk_last) - lo + 1).clamp_min(0)
+                overlapping = torch.nonzero(torch.all(sizes > 0, dim=1)).squeeze(1)
+                if overlapping.shape[0] == 0:
+                    continue
+                # Gaussians with boxes of similar sizes are evaluated on the
+                # same stencil, at most max_pairs grid points at once
+                stencils = stencil_sizes[torch.searchsorted(stencil_sizes, sizes[overlapping])]
+                shapes, bucket = torch.unique(stencils, dim=0, return_inverse=True)
+                for b, shape in enumerate(shapes.tolist()):
+                    idx = overlapping[bucket == b]
+                    batch_size = max(1, max_pairs // (shape[0] * shape[1] * shape[2]))
+                    for start in range(0, idx.shape[0], batch_size):
+                        batch = idx[start:start + batch_size]
+                        accumulate_densities(density, shape, lo[batch], sizes[batch], xyz[batch],
+                                             opacity[batch], packed_inverse_covariances[batch], low, spacing,
+                                             colour_sums, None if rgb is None else rgb[batch])
+    return density, colour_sums, low, spacing
+
+def get_stencil_sizes(max_size):
+    """
+    Sizes 1, 2, 3, 4, 6, 8, 12, ... up to max_size: boxes are padded to the
+    next one, by less than half of their size.
+    """
+    sizes = {max_size}
+    power = 1
+    while power < max_size:
+        sizes.update([power, min(3 * power, max_size)])
+        power *= 2
+    return torch.tensor(sorted(sizes))
+
+def accumulate_densities(density, shape, lo, sizes, xyz, opacity, inverse_covariances, low, spacing,
+                         colour_sums=None, rgb=None):
+    """
+    Adds the densities of Gaussians at the grid points of their boxes (first
+    grid point lo, sizes along the axes, padded to shape) to the density grid,
+    and their colours rgb [G, 3] weighted by them to the colour sums.
+    The inverse covariances are packed as [G, 6] xx, yy, zz, xy, xz, yz.
+    """
+    # [G, K] grid coordinates, offsets from the means and -inf outside the
+    # boxes along every axis
+    coords, d, outside = [], [], []
+    for axis in range(3):
+        steps = torch.arange(shape[axis], device=xyz.device)
+        coords.append((lo[:, axis:axis + 1] + steps).clamp_max(density.shape[axis] - 1))
+        d.append(low[axis] + (lo[:, axis:axis + 1] + steps) * spacing[axis] - xyz[:, axis:axis + 1])
+        outside.append(torch.where(steps < sizes[:, axis:axis + 1], 0.0, -torch.inf))
+    dx, dy, dz = d[0].unsqueeze(2), d[1].unsqueeze(1), d[2].reshape(-1, 1, 1, shape[2])
+    a = [-0.5 * inverse_covariances[:, i].reshape(-1, 1, 1) for i in range(6)]
+    # the exponent, log opacity - 0.5 Mahalanobis distance, as a quadratic in
+    # dz: only three passes over the [G, Kx, Ky, Kz] pairs
+    constant = (a[0] * dx * dx + a[1] * dy * dy + 2.0 * a[3] * dx * dy + torch.log(opacity).reshape(-1, 1, 1)
+                + outside[0].unsqueeze(2) + outside[1].unsqueeze(1))
+    linear = 2.0 * (a[4] * dx + a[5] * dy)
+    quadratic = a[2].unsqueeze(3) * dz * dz + outside[2].reshape(-1, 1, 1, shape[2])
+    values = torch.addcmul(constant.unsqueeze(3), linear.unsqueeze(3), dz).add_(quadratic).exp_()
+    keys = ((coords[0].unsqueeze(2) * density.shape[1] + coords[1].unsqueeze(1)) *
+            density.shape[2]).unsqueeze(3) + coords[2].reshape(-1, 1, 1, shape[2])
+    density.view(-1).index_add_(0, keys.reshape(-1), values.reshape(-1))
+    if colour_sums is not None:
+        colour_sums.view(-1, 3).index_add_(0, keys.reshape(-1),
+                                           (values.unsqueeze(4) * rgb.reshape(-1, 1, 1, 1, 3)).reshape(-1, 3))
+
+def marching_tetrahedra(grid, level):
+    """
+    Iso-surface {grid == level} of a [X, Y, Z] grid of values, with the
+    triangles facing towards decreasing values.
+    Returns vertices [V, 3] in grid units and faces [F, 3].
+    """
+    device = grid.device
+    X, Y, Z = grid.shape
+    above = grid > level
+    # cases of the cells: bit k is set if corner k is above the level
+    codes = torch.zeros((X - 1, Y - 1, Z - 1), dtype=torch.uint8, device=device)
+    for k, (a, b, c) in enumerate(CELL_CORNERS.tolist()):
+        codes |= above[a:X - 1 + a, b:Y - 1 + b, c:Z - 1 + c].to(torch.uint8) << k
+    cells = torch.nonzero((codes > 0) & (codes < 255))
+    if cells.shape[0] == 0:
+        return torch.zeros((0, 3), device=device), torch.zeros((0, 3), dtype=torch.long, device=device)
+    codes = codes[cells[:, 0], cells[:, 1], cells[:, 2]].long()
+    cell_keys = (cells[:, 0] * Y + cells[:, 1]) * Z + cells[:, 2]
+    corner_offsets = ((CELL_CORNERS[:, 0] * Y + CELL_CORNERS[:, 1]) * Z + CELL_CORNERS[:, 2]).tolist()
+
+    # one vertex per grid edge crossing the level, numbered direction by
+    # direction from the grid: deduplicating the edges of the triangles
+    # (torch.unique) takes longer than the rest at 256^3
+    cell_edge_vertices = torch.empty((cells.shape[0], len(CELL_EDGES)), dtype=torch.long, device=device)
+    vertex_ids = torch.empty(X * Y * Z, dtype=torch.long, device=device)
+    first_points, second_points = [], []
+    num_vertices = 0
+    for dx, dy, dz in CELL_EDGE_OFFSETS:
+        crossing = torch.zeros_like(above)
+        crossing[:X - dx, :Y - dy, :Z - dz] = above[:X - dx, :Y - dy, :Z - dz] != above[dx:, dy:, dz:]
+        points = torch.nonzero(crossing.view(-1)).squeeze(1)
+        vertex_ids[points] = torch.arange(num_vertices, num_vertices + points.shape[0], device=device)
+        num_vertices += points.shape[0]
+        # vertices of the cell edges along this direction, those of the
+        # edges that do not cross the level are never read
+        for e, (a, b) in enumerate(CELL_EDGES):
+            if (CELL_CORNERS[b] - CELL_CORNERS[a]).tolist() == [dx, dy, dz]:
+                cell_edge_vertices[:, e] = vertex_ids[cell_keys + corner_offsets[a]]
+        first_points.append(points)
+        second_points.append(points + (dx * Y + dy) * Z + dz)
+    del vertex_ids
+
+    # triangles of every cell from the table of its case
+    num_triangles = CELL_TRIANGLE_COUNTS.to(device)[codes]
+    cell_idx = torch.repeat_interleave(num_triangles)
+    first_triangles = torch.cumsum(num_triangles, 0) - num_triangles
+    slots = torch.arange(cell_idx.shape[0], device=device) - first_triangles[cell_idx]
+    edges = CELL_TRIANGLES.to(device)[codes[cell_idx], slots]
+    faces = cell_edge_vertices[cell_idx.unsqueeze(1), edges]
+    a, b = torch.cat(first_points), torch.cat(second_points)
+    values = grid.view(-1)
+    t = ((level - values[a]) / (values[b] - values[a])).clamp(0.0, 1.0).unsqueeze(1)
+    unravel = lambda k: torch.stack([k // (Y * Z), (k // Z) % Y, k % Z], dim=1).float()
+    vertices = unravel(a) + t * (unravel(b) - unravel(a))
+    return vertices, faces
+
+@torch.no_grad()
+def extract_mesh(pc, resolution=256, level=0.5, bounds=None, chunk_size=256, max_pairs=2 ** 22,
+                 opacity_threshold=1.0 / 255.0, colour_resolution=None):
+    """
+    Coloured mesh of the iso-surface of the density of a reconstruction at
+    level (evaluate_density_grid for the grid arguments). The vertex colours
+    are the SH DC colours of the Gaussians averaged with their densities, on
+    a grid of colour_resolution (by default half the resolution) points per
+    axis interpolated at the vertices. On one CPU core a 128 x 128 splatter
+    image takes about 0.7 s at resolution 128 and 5 s at 256
+    (benchmarks/mesh_extraction.py).
+    Args:
+        pc: activated reconstruction without a batch dimension
+    Returns vertices [V, 3], faces [F, 3] and vertex colours [V, 3] in [0, 1].
+    """
+    if bounds is None:
+        bounds = get_grid_bounds(pc, opacity_threshold)
+    density, _, origin, spacing = evaluate_density_grid(pc, resolution, bounds, chunk_size, max_pairs,
+                                                        opacity_threshold)
+    vertices, faces = marching_tetrahedra(density, level)
+    del density
+    vertices = origin + vertices * spacing
+
+    colour_resolution = max(2, resolution // 2) if colour_resolution is None else colour_resolution
+    colour_density, colour_sums, colour_origin, colour_spacing = evaluate_density_grid(
+        pc, colour_resolution, bounds, chunk_size, max_pairs, opacity_threshold, colours=True)
+    # grid_sample takes [N, C, D, H, W] volumes and (W, H, D) coordinates in [-1, 1]
+    volume = torch.cat([colour_sums, colour_density.unsqueeze(3)], dim=3).permute(3, 0, 1, 2).unsqueeze(0)
+    coordinates = 2.0 * (vertices - colour_origin) / (colour_spacing * (colour_resolution - 1)) - 1.0
+    samples = torch.nn.functional.grid_sample(volume, coordinates.flip(1).reshape(1, -1, 1, 1, 3),
+                                              align_corners=True)[0, :, :, 0, 0].transpose(0, 1)
+    colours = samples[:, :3] / samples[:, 3:].clamp_min(1e-12)
+    return vertices, faces, colours.clamp(0.0, 1.0)
+
+def export_mesh_to_obj(vertices, faces, colours, obj_out_path, chunk_size=65536):
+    """
+    Writes a mesh with vertex colours (as x y z r g b vertex lines) to .obj.
+    """
+    if os.path.dirname(obj_out_path) != "":
+        os.makedirs(os.path.dirname(obj_out_path), exist_ok=True)
+    vertex_lines = torch.cat([vertices, colours], dim=1).detach().cpu().numpy()
+    face_lines = faces.cpu().numpy() + 1
+    with open(obj_out_path, "w") as f:
+        # formatting whole chunks at once is much faster than line by line
+        for start in range(0, vertex_lines.shape[0], chunk_size):
+            chunk = vertex_lines[start:start + chunk_size]
+            f.write(("v %.6f %.6f %.6f %.4f %.4f %.4f\n" * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+        for start in range(0, face_lines.shape[0], chunk_size):
+            chunk = face_lines[start:start + chunk_size]
+            f.write(("f %d %d %d\n" * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
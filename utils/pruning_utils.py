@@ -0,0 +1,95 @@
+"""
+Merging of Gaussians that makes reconstructions compact: every splatter image
+has one Gaussian per pixel, whatever the complexity of the object.
+
+Gaussians that are nearly transparent or never visible from a set of views
+are removed, the remaining ones are clustered on a voxel grid and by colour,
+and every cluster is replaced by one moment-matched Gaussian. The search of
+the voxel size, which renders the reconstruction, is in
+gaussian_renderer.compaction.
+"""
+
+import torch
+
+from .general_utils import build_scaling_rotation, matrix_to_quaternion_batch
+from .sh_utils import SH2RGB
+from .spatial_index import SpatialIndex
+
+def prune_gaussians(pc, opacity_threshold=1.0 / 255.0, contributions=None, min_contribution=0.0):
+    """
+    Indices of the Gaussians kept: opacity at least opacity_threshold and,
+    if contributions are given, a contribution of at least min_contribution
+    pixels to one of the views.
+    """
+    keep = pc["opacity"].reshape(-1) >= opacity_threshold
+    if contributions is not None:
+        keep = keep & (contributions > min_contribution)
+    return torch.nonzero(keep).squeeze(1)
+
+def merge_clusters(pc, cluster, num_clusters):
+    """
+    Replaces every cluster of Gaussians by one Gaussian. Weighted by opacity,
+    the mean, the covariance (including the spread of the means) and the SH
+    coefficients are matched, the opacity is that of the Gaussians composited
+    on top of each other.
+    Args:
+        pc: activated reconstruction without a batch dimension
+        cluster: [N] index of the cluster of every Gaussian
+    Returns the merged reconstruction, clusters of one Gaussian are kept as
+    they were.
+    """
+    xyz = pc["xyz"]
+    N, M = xyz.shape[0], num_clusters
+    counts = torch.zeros(M, dtype=torch.long, device=xyz.device).index_add_(
+        0, cluster, torch.ones_like(cluster))
+    opacity = pc["opacity"].reshape(-1)
+    weights = opacity + 1e-6
+    cluster_weights = torch.zeros(M, device=xyz.device).index_add_(0, cluster, weights)
+    normalised = (weights / cluster_weights[cluster]).unsqueeze(1)
+
+    def weighted_mean(values):
+        flat = values.reshape(N, -1)
+        merged = torch.zeros((M, flat.shape[1]), device=xyz.device).index_add_(0, cluster, flat * normalised)
+        return merged.reshape(M, *values.shape[1:])
+
+    mean = weighted_mean(xyz)
+    L = build_scaling_rotation(pc["scaling"], pc["rotation"])
+    offsets = xyz - mean[cluster]
+    cov = weighted_mean(L @ L.transpose(1, 2) + offsets.unsqueeze(2) * offsets.unsqueeze(1))
+
+    eigenvalues, eigenvectors = torch.linalg.eigh(cov)
+    # proper rotations only
+    eigenvectors[:, :, 2] *= torch.sign(torch.linalg.det(eigenvectors)).unsqueeze(1)
+    scaling = torch.sqrt(torch.clamp_min(eigenvalues, 1e-12))
+    merged_opacity = 1.0 - torch.exp(torch.zeros(M, device=xyz.device).index_add_(
+        0, cluster, torch.log(torch.clamp_min(1.0 - opacity, 1e-6))))
+    merged = {"xyz": mean,
+              "scaling": scaling,
+              "rotation": matrix_to_quaternion_batch(eigenvectors),
+              "opacity": merged_opacity.unsqueeze(1)}
+    for k in pc.keys():
+        if k not in merged:
+            merged[k] = weighted_mean(pc[k])
+
+    singles = counts[cluster] == 1
+    for k in merged.keys():
+        merged[k][cluster[singles]] = pc[k][singles].to(merged[k].dtype)
+    return merged
+
+def merge_gaussians(pc, voxel_size, colour_bins=4):
+    """
+    Merges the Gaussians that share a voxel and a colour bin (merge_clusters).
+    Args:
+        pc: activated reconstruction without a batch dimension
+        voxel_size: side of the voxels, 0 disables merging
+        colour_bins: bins per RGB channel of the base colour
+    Returns the merged reconstruction.
+    """
+    if voxel_size <= 0:
+        return pc
+    voxels = SpatialIndex(pc["xyz"], cell_size=voxel_size).point_keys()
+    colours = torch.clamp(SH2RGB(pc["features_dc"][:, 0]), 0.0, 1.0)
+    colour_idx = torch.clamp((colours * colour_bins).long(), max=colour_bins - 1)
+    keys, cluster = torch.unique(torch.cat([voxels.unsqueeze(1), colour_idx], dim=1), dim=0,
+                                 return_inverse=True)
+    return merge_clusters(pc, cluster, keys.shape[0])
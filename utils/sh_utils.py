@@ -111,6 +111,20 @@ def eval_sh(deg, sh, dirs):
                             C4[8] * (xx * (xx - 3 * yy) - yy * (3 * xx - yy)) * sh[..., 24])
     return result
 
+def rotate_sh_degree1(sh_rest, R):
+    """
+    Rotates degree 1 SH coefficients with the rotation R applied to the
+    object, so that colours seen along R @ d match the old colours along d.
+    The degree 1 band is C1 * (-sh[3], -sh[1], sh[2]) . d, the vector in
+    brackets rotates with the object.
+    Args:
+        sh_rest: [N, 3, C] degree 1 coefficients (features_rest layout)
+        R: [3, 3] rotation matrix
+    """
+    v = torch.stack([-sh_rest[:, 2], -sh_rest[:, 0], sh_rest[:, 1]], dim=1)
+    v = torch.einsum("ij,njc->nic", R, v)
+    return torch.stack([-v[:, 1], v[:, 2], -v[:, 0]], dim=1)
+
 def RGB2SH(rgb):
     return (rgb - 0.5) / C0
 
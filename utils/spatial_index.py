@@ -0,0 +1,214 @@
+"""
+Uniform grid index over the Gaussians of a reconstruction, built once and
+queried for the points inside a frustum or a box, within a radius of query
+points, or the k nearest neighbours of query points, without scanning all
+the Gaussians.
+
+The points are sorted by the linear index of their grid cell, every
+occupied cell is a contiguous range of the sorted points found with a
+binary search, and every query gathers the ranges of the cells it touches.
+"""
+
+import math
+
+import torch
+
+class SpatialIndex:
+    """
+    Index over points [N, 3]. Query results are indices into the points.
+    """
+    def __init__(self, xyz, cell_size=None, points_per_cell=8, radii=None):
+        """
+        Args:
+            xyz: [N, 3] points
+            cell_size: side of the cells, by default chosen so that occupied
+                cells hold about points_per_cell points
+            radii: optional [N] extent of every point (e.g. 3 standard
+                deviations of a Gaussian), used to pad the cells in frustum
+                queries
+        """
+        self.xyz = xyz.detach()
+        self.origin = self.xyz.min(dim=0).values
+        extent = (self.xyz.max(dim=0).values - self.origin).max().item()
+        num_points = self.xyz.shape[0]
+        if cell_size is None:
+            cells_per_side = max(1, math.ceil((num_points / points_per_cell) ** (1.0 / 3.0)))
+            cell_size = max(extent / cells_per_side, 1e-6)
+            # the points of reconstructions lie on surfaces: correct the size
+            # from the occupancy, assuming occupied cells grow with its square
+            occupied = torch.unique(self.linear_keys(self.cell_coords(self.xyz, cell_size),
+                                                     self.grid_dims(extent, cell_size))).shape[0]
+            cell_size = max(cell_size * math.sqrt(points_per_cell * occupied / num_points), 1e-6)
+        self.cell_size = cell_size
+        self.dims = self.grid_dims(extent, cell_size)
+
+        keys = self.linear_keys(self.cell_coords(self.xyz, cell_size), self.dims)
+        self.sorted_keys, self.order = torch.sort(keys)
+        self.cell_keys, self.cell_counts = torch.unique_consecutive(self.sorted_keys, return_counts=True)
+        self.cell_starts = torch.cumsum(self.cell_counts, dim=0) - self.cell_counts
+        self.cells = self.unravel_keys(self.cell_keys)
+        self.cell_radii = None
+        if radii is not None:
+            self.cell_radii = torch.zeros(self.cell_keys.shape[0], dtype=radii.dtype, device=radii.device)
+            cell_of_point = torch.repeat_interleave(torch.arange(self.cell_keys.shape[0], device=keys.device),
+                                                    self.cell_counts)
+            self.cell_radii.scatter_reduce_(0, cell_of_point, radii.detach()[self.order], reduce="amax")
+
+    @staticmethod
+    def grid_dims(extent, cell_size):
+        return int(math.floor(extent / cell_size)) + 1
+
+    def cell_coords(self, points, cell_size=None):
+        """
+        Integer [.., 3] cell coordinates of points (not clamped to the grid).
+        """
+        cell_size = self.cell_size if cell_size is None else cell_size
+        return torch.floor((points - self.origin) / cell_size).long()
+
+    @staticmethod
+    def linear_keys(cells, dims):
+        """
+        Linear index of cells [..., 3], -1 for cells outside the grid.
+        """
+        inside = torch.all((cells >= 0) & (cells < dims), dim=-1)
+        keys = (cells[..., 0] * dims + cells[..., 1]) * dims + cells[..., 2]
+        return torch.where(inside, keys, -1)
+
+    def unravel_keys(self, keys):
+        return torch.stack([keys // (self.dims * self.dims), (keys // self.dims) % self.dims,
+                            keys % self.dims], dim=-1)
+
+    def gather_cells(self, keys):
+        """
+        Points of the cells with linear keys [Q, K] (-1 or unoccupied cells
+        are empty). Returns the row of every candidate and its point index.
+        """
+        position = torch.searchsorted(self.cell_keys, keys.reshape(-1)).clamp_max(self.cell_keys.shape[0] - 1)
+        occupied = (self.cell_keys[position] == keys.reshape(-1)) & (keys.reshape(-1) >= 0)
+        counts = torch.where(occupied, self.cell_counts[position], 0)
+        starts = self.cell_starts[position]
+        rows = torch.repeat_interleave(torch.arange(keys.numel(), device=keys.device) // keys.shape[1], counts)
+        offsets = torch.arange(rows.shape[0], device=keys.device) - \
+            torch.repeat_interleave(torch.cumsum(counts, dim=0) - counts, counts)
+        return rows, self.order[torch.repeat_interleave(starts, counts) + offsets]
+
+    def nearest_cells(self, points):
+        """
+        [Q, 3] cells of the grid nearest to the points. Every indexed point is
+        at least as many cells away from them as from the cells of the points.
+        """
+        return self.cell_coords(points).clamp(0, self.dims - 1)
+
+    def neighbourhood_keys(self, points, ring):
+        """
+        Keys [Q, (2 ring + 1)^3] of the cells within ring cells of the nearest
+        cell of every point.
+        """
+        steps = torch.arange(-ring, ring + 1, device=points.device)
+        offsets = torch.stack(torch.meshgrid(steps, steps, steps, indexing="ij"), dim=-1).reshape(-1, 3)
+        return self.linear_keys(self.nearest_cells(points).unsqueeze(1) + offsets, self.dims)
+
+    def radius_query(self, points, radius, chunk_size=4096):
+        """
+        Pairs of a query point [Q, 3] and an indexed point closer than radius.
+        Returns the query indices and the point indices.
+        """
+        ring = max(1, math.ceil(radius / self.cell_size))
+        query_idx, point_idx = [], []
+        for start in range(0, points.shape[0], chunk_size):
+            chunk = points[start:start + chunk_size]
+            rows, candidates = self.gather_cells(self.neighbourhood_keys(chunk, ring))
+            close = torch.sum((self.xyz[candidates] - chunk[rows]) ** 2, dim=-1) <= radius * radius
+            query_idx.append(rows[close] + start)
+            point_idx.append(candidates[close])
+        return torch.cat(query_idx), torch.cat(point_idx)
+
+    def knn(self, points, k=1, chunk_size=4096):
+        """
+        k nearest indexed points of every query point [Q, 3].
+        Returns the distances and the indices [Q, k], sorted by distance.
+        """
+        if k > self.xyz.shape[0]:
+            raise ValueError("{} neighbours requested from {} points".format(k, self.xyz.shape[0]))
+        distances = torch.full((points.shape[0], k), math.inf, device=points.device)
+        indices = torch.full((points.shape[0], k), -1, dtype=torch.long, device=points.device)
+        for start in range(0, points.shape[0], chunk_size):
+            remaining = torch.arange(start, min(start + chunk_size, points.shape[0]), device=points.device)
+            ring = 1
+            while remaining.shape[0] > 0:
+                rows, candidates = self.gather_cells(self.neighbourhood_keys(points[remaining], ring))
+                d = torch.norm(self.xyz[candidates] - points[remaining][rows], dim=-1)
+                # candidates of every query point in a padded row
+                counts = torch.bincount(rows, minlength=remaining.shape[0])
+                columns = torch.arange(rows.shape[0], device=points.device) - \
+                    torch.repeat_interleave(torch.cumsum(counts, dim=0) - counts, counts)
+                dense = torch.full((remaining.shape[0], max(int(counts.max().item()), k)), math.inf,
+                                   device=points.device)
+                dense[rows, columns] = d
+                dense_idx = torch.full_like(dense, -1, dtype=torch.long)
+                dense_idx[rows, columns] = candidates
+                best, best_columns = torch.topk(dense, k, dim=1, largest=False)
+                # every point closer than ring cells, or the whole grid, has been seen
+                cells = self.nearest_cells(points[remaining])
+                reach = torch.maximum(cells, self.dims - 1 - cells).amax(dim=-1)
+                done = (best[:, -1] <= ring * self.cell_size) | (ring >= reach)
+                distances[remaining[done]] = best[done]
+                indices[remaining[done]] = torch.gather(dense_idx, 1, best_columns)[done]
+                remaining = remaining[~done]
+                if remaining.shape[0] > 0:
+                    ring = min(2 * ring, int(reach[~done].max().item()))
+        return distances, indices
+
+    def box_query(self, box_min, box_max):
+        """
+        Indices of the points inside the axis-aligned box.
+        """
+        low = self.cell_coords(box_min.to(self.xyz.device))
+        high = self.cell_coords(box_max.to(self.xyz.device))
+        touched = torch.all((self.cells >= low) & (self.cells <= high), dim=-1)
+        candidates = self.points_of_cells(touched)
+        inside = torch.all((self.xyz[candidates] >= box_min) & (self.xyz[candidates] <= box_max), dim=-1)
+        return candidates[inside]
+
+    def frustum_query(self, full_proj_transform, near=0.2, scale_x=1.0, scale_y=1.0, radius_scale=0.0):
+        """
+        Indices of the points in the cells whose bounding spheres overlap the
+        view frustum (conservative: every point inside is returned, some
+        outside are).
+        Args:
+            full_proj_transform: [4, 4] row-vector projection of the view
+            near: depth of the near plane
+            scale_x, scale_y: widen the frustum to |x_ndc| <= scale_x, ...
+            radius_scale: pad the cells by radius_scale times the largest
+                radius of their points (needs radii at build time)
+        """
+        centers = self.origin + (self.cells + 0.5) * self.cell_size
+        radii = torch.full_like(centers[:, 0], 0.5 * math.sqrt(3.0) * self.cell_size)
+        if radius_scale > 0:
+            radii = radii + radius_scale * self.cell_radii
+        # planes of the frustum in world space, [p, 1] @ planes >= 0 inside
+        P = full_proj_transform
+        e_w = torch.tensor([0.0, 0.0, 0.0, 1.0], dtype=P.dtype, device=P.device)
+        planes = torch.stack([P[:, 3] - near * e_w,
+                              scale_x * P[:, 3] - P[:, 0], scale_x * P[:, 3] + P[:, 0],
+                              scale_y * P[:, 3] - P[:, 1], scale_y * P[:, 3] + P[:, 1]], dim=1)
+        distances = torch.cat([centers, torch.ones_like(centers[:, :1])], dim=1) @ planes
+        # cells are bounded by spheres: outside if beyond one of the planes
+        outside = torch.any(distances < -radii.unsqueeze(1) * torch.norm(planes[:3], dim=0), dim=1)
+        return self.points_of_cells(~outside)
+
+    def point_keys(self):
+        """
+        [N] linear key of the cell of every point.
+        """
+        keys = torch.empty_like(self.sorted_keys)
+        keys[self.order] = self.sorted_keys
+        return keys
+
+    def points_of_cells(self, cell_mask):
+        """
+        Sorted indices of the points in the occupied cells selected by mask.
+        """
+        point_mask = torch.zeros(self.order.shape[0], dtype=torch.bool, device=self.order.device)
+        point_mask[self.order] = torch.repeat_interleave(cell_mask, self.cell_counts)
+        return torch.nonzero(point_mask).squeeze(1)
@@ -0,0 +1,93 @@
+import torch
+
+# attributes of a reconstruction in the order they are packed
+ATTRIBUTE_NAMES = ["xyz", "opacity", "scaling", "rotation", "features_dc", "features_rest"]
+
+class SplatterImage:
+    """
+    Reconstruction with all the attributes packed in one contiguous buffer
+    [..., N, C], e.g. [B, N, 23] for degree 1 SH. Attributes are returned as
+    views of the buffer with the same shapes as in the reconstruction
+    dictionaries (xyz [..., N, 3], features_rest [..., N, 3, 3], ...), and
+    batch items as SplatterImages viewing the same buffer, so neither makes
+    copies. SplatterImage can be read like the dictionaries (keys, items,
+    indexing with the name of an attribute), writing to the buffer or to an
+    attribute view modifies the reconstruction in place.
+    """
+    __slots__ = ("buffer", "layout")
+
+    def __init__(self, buffer, layout):
+        """
+        Args:
+            buffer: [..., N, C] tensor
+            layout: dictionary name -> (start, end, shape) of every attribute
+                in the channels of the buffer
+        """
+        num_channels = max(end for _, end, _ in layout.values())
+        if buffer.shape[-1] != num_channels:
+            raise ValueError("Layout needs {} channels, the buffer has {}".format(
+                num_channels, buffer.shape[-1]))
+        self.buffer = buffer
+        self.layout = layout
+
+    @classmethod
+    def from_dict(cls, reconstruction):
+        """
+        Packs a reconstruction dictionary (one copy of every attribute).
+        The leading dimensions are taken from xyz [..., N, 3].
+        """
+        leading_shape = reconstruction["xyz"].shape[:-1]
+        names = [k for k in ATTRIBUTE_NAMES if k in reconstruction.keys()] + \
+            sorted(k for k in reconstruction.keys() if k not in ATTRIBUTE_NAMES)
+        layout = {}
+        start = 0
+        for name in names:
+            shape = tuple(reconstruction[name].shape[len(leading_shape):])
+            end = start + int(torch.Size(shape).numel())
+            layout[name] = (start, end, shape)
+            start = end
+        buffer = torch.cat([reconstruction[name].reshape(*leading_shape, -1) for name in names], dim=-1)
+        return cls(buffer, layout)
+
+    def to_dict(self):
+        """
+        Dictionary of views of the attributes.
+        """
+        return {name: self[name] for name in self.layout.keys()}
+
+    def __getitem__(self, name):
+        start, end, shape = self.layout[name]
+        view = self.buffer[..., start:end]
+        return view if len(shape) == 1 else view.view(*view.shape[:-1], *shape)
+
+    def __contains__(self, name):
+        return name in self.layout
+
+    def keys(self):
+        return self.layout.keys()
+
+    def items(self):
+        return ((name, self[name]) for name in self.layout.keys())
+
+    def batch_item(self, b_idx):
+        """
+        SplatterImage of one batch item, viewing the same buffer.
+        """
+        return SplatterImage(self.buffer[b_idx], self.layout)
+
+    @property
+    def num_gaussians(self):
+        return self.buffer.shape[-2]
+
+    @property
+    def device(self):
+        return self.buffer.device
+
+    def to(self, *args, **kwargs):
+        return SplatterImage(self.buffer.to(*args, **kwargs), self.layout)
+
+    def detach(self):
+        return SplatterImage(self.buffer.detach(), self.layout)
+
+    def clone(self):
+        return SplatterImage(self.buffer.clone(), self.layout)
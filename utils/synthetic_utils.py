@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+import torch
+
+from .camera_utils import get_loop_cameras
+from .graphics_utils import getProjectionMatrix
+
+def get_synthetic_splatter_image(num_gaussians=128 * 128, seed=0, device="cpu"):
+    """
+    Random reconstruction with the statistics of a predicted splatter image:
+    Gaussians spread over the surface of a blob around the world origin,
+    about half of them nearly transparent, scales matched to the surface
+    area covered per Gaussian and degree 1 SH colours.
+    Returns a dict of activated xyz, opacity, scaling, rotation, features_dc
+    and features_rest without a batch dimension.
+    """
+    generator = torch.Generator().manual_seed(seed)
+
+    # Fibonacci sphere with a radial perturbation
+    i = torch.arange(num_gaussians, dtype=torch.float32) + 0.5
+    phi = torch.acos(1 - 2 * i / num_gaussians)
+    theta = math.pi * (1 + 5 ** 0.5) * i
+    dirs = torch.stack([torch.cos(theta) * torch.sin(phi),
+                        torch.sin(theta) * torch.sin(phi),
+                        torch.cos(phi)], dim=-1)
+    radius = 0.5 + 0.05 * torch.sin(3 * theta) * torch.sin(4 * phi) + \
+        0.01 * torch.randn(num_gaussians, generator=generator)
+    xyz = dirs * radius.unsqueeze(1)
+
+    spacing = 0.5 * math.sqrt(4 * math.pi / num_gaussians)
+    scaling = spacing * torch.exp(0.3 * torch.randn(num_gaussians, 3, generator=generator))
+    rotation = torch.nn.functional.normalize(torch.randn(num_gaussians, 4, generator=generator), dim=-1)
+    opacity = torch.sigmoid(3 * torch.randn(num_gaussians, 1, generator=generator))
+
+    features_dc = (0.5 * dirs + 0.2 * torch.randn(num_gaussians, 3, generator=generator)).unsqueeze(1)
+    features_rest = 0.1 * torch.randn(num_gaussians, 3, 3, generator=generator)
+
+    reconstruction = {"xyz": xyz,
+                      "opacity": opacity,
+                      "scaling": scaling,
+                      "rotation": rotation,
+                      "features_dc": features_dc,
+                      "features_rest": features_rest}
+    return {k: v.to(device) for k, v in reconstruction.items()}
+
+def get_synthetic_loop_cameras(num_imgs_in_loop=200, fov=49.134342641202636,
+                               znear=0.8, zfar=3.2, device="cpu"):
+    """
+    Camera loop around the world origin in the format used by render_predicted
+    (same cameras as the loop rendered in the gradio demo).
+    Returns world_view_transforms, full_proj_transforms and camera_centers
+    stacked along the first dimension.
+    """
+    projection_matrix = getProjectionMatrix(
+        znear=znear, zfar=zfar,
+        fovX=fov * 2 * np.pi / 360,
+        fovY=fov * 2 * np.pi / 360).transpose(0, 1)
+
+    loop_cameras_c2w_cmo = np.stack(get_loop_cameras(num_imgs_in_loop=num_imgs_in_loop,
+                                                     max_elevation=np.pi / 4,
+                                                     elevation_freq=1.5))
+    view_world_transforms = torch.from_numpy(loop_cameras_c2w_cmo).transpose(1, 2)
+    world_view_transforms = torch.from_numpy(loop_cameras_c2w_cmo).inverse().transpose(1, 2)
+    camera_centers = view_world_transforms[:, 3, :3].clone()
+    full_proj_transforms = world_view_transforms.bmm(projection_matrix.unsqueeze(0).expand(
+        world_view_transforms.shape[0], 4, 4))
+
+    return world_view_transforms.to(device), full_proj_transforms.to(device), camera_centers.to(device)